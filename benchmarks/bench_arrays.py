@@ -0,0 +1,27 @@
+"""
+Decode/encode of large homogeneous arrays with and without columnar mode.
+
+    python -m benchmarks.bench_arrays [blocks]
+"""
+import sys
+import timeit
+
+from levin.reader import LevinReader
+from benchmarks.corpus import chain_entry
+
+
+def rate(func, number: int = 5) -> float:
+    return number / min(timeit.repeat(func, number=number, repeat=3))
+
+
+def main(blocks: int = 10000):
+    payload = chain_entry(blocks)
+    columnar = LevinReader(payload, columnar=True).read_payload()
+    print("chain entry with %d blocks (%d bytes)" % (blocks, len(payload)))
+    for name, kwargs in (("default", {}), ("native", {'native': True}), ("columnar", {'columnar': True})):
+        print("  decode %-9s %10.1f ops/s" % (name, rate(lambda: LevinReader(payload, **kwargs).read_payload())))
+    print("  encode %-9s %10.1f ops/s" % ("columnar", rate(lambda: bytes(columnar))))
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,61 @@
+"""
+Large blob payloads: decoding a get_objects response with copied blobs
+against memoryview slices, and peak Python memory of framing it in memory
+against spilling it to a temporary file and decoding from the mmap.
+
+    python -m benchmarks.bench_blobs
+"""
+import os
+import timeit
+import tracemalloc
+
+from levin.bucket import Bucket
+from levin.framing import LevinFrameDecoder
+from levin.schema import ResponseGetObjects, BlockCompleteEntry
+from levin.constants import *
+
+
+def get_objects_response(blocks: int, txs: int, tx_size: int) -> bytes:
+    entries = [BlockCompleteEntry(pruned=False, block=os.urandom(tx_size), block_weight=tx_size,
+                                  txs=[os.urandom(tx_size) for _ in range(txs)]) for _ in range(blocks)]
+    return ResponseGetObjects(blocks=entries, missed_ids=b'', current_blockchain_height=blocks).encode()
+
+
+def _peak(fn) -> int:
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(blocks: int = 100, txs: int = 20, tx_size: int = 10000):
+    payload = get_objects_response(blocks, txs, tx_size)
+    print("payload %.1f MB, %d blobs" % (len(payload) / 1e6, blocks * (txs + 1)))
+
+    number = 5
+    baseline = None
+    for label, views in (('bytes', False), ('memoryview', True)):
+        t = min(timeit.repeat(lambda: ResponseGetObjects.decode(payload, views=views), number=number,
+                              repeat=3)) / number
+        baseline = baseline or t
+        print("decode %-12s %8.2f ms  %5.1fx" % (label, t * 1e3, baseline / t))
+
+    frame = bytes(Bucket.create_request(NOTIFY_RESPONSE_GET_OBJECTS.value, payload=payload).header()) + payload
+    chunks = [frame[i:i + 65536] for i in range(0, len(frame), 65536)]
+
+    def receive(**options):
+        decoder = LevinFrameDecoder(schema=True, **options)
+        for chunk in chunks:
+            for bucket in decoder.feed(chunk):
+                message = bucket.payload_section
+                assert len(message.blocks) == blocks
+
+    del payload, frame
+    for label, options in (('in memory', {}), ('in memory, views', {'views': True}),
+                           ('spilled, views', {'views': True, 'spill_threshold': 1 << 20})):
+        print("receive %-18s peak %8.1f MB" % (label, _peak(lambda: receive(**options)) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
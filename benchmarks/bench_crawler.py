@@ -0,0 +1,33 @@
+"""
+Crawl throughput (nodes/sec) against a simulated local network. The
+sightings go to an in-memory PeerStore, and every one must keep the peer id
+its node advertised.
+
+    python -m benchmarks.bench_crawler [nodes] [concurrency]
+"""
+import asyncio
+import sys
+
+from levin.crawler import Crawler
+from levin.peerstore import PeerStore
+from benchmarks.fakenet import FakeNetwork
+
+
+async def run(nodes: int, concurrency: int, store: PeerStore = None):
+    async with FakeNetwork(nodes=nodes, degree=32) as network:
+        crawler = Crawler(seeds=network.seeds, concurrency=concurrency, timeout=5.0, retries=0, store=store)
+        stats = await crawler.run()
+    return stats
+
+
+def main(nodes: int = 500, concurrency: int = 200):
+    store = PeerStore()
+    stats = asyncio.run(run(nodes, concurrency, store))
+    print("nodes=%d concurrency=%d -> %r" % (nodes, concurrency, stats))
+    peers = store.fresh()
+    assert peers and all(peer[4] is not None for peer in peers), "sightings without a peer id"
+    store.close()
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
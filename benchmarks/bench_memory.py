@@ -0,0 +1,45 @@
+"""
+Memory held by decoded payloads and scalar construction time, for _CType
+wrappers and native values.
+
+    python -m benchmarks.bench_memory [peers]
+"""
+import sys
+import timeit
+import tracemalloc
+
+from levin.reader import LevinReader
+from levin.ctypes import *
+from benchmarks.corpus import handshake_response
+
+
+def retained(payload: bytes, **kwargs) -> int:
+    """bytes still allocated while the decoded section is alive"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    section = LevinReader(payload, **kwargs).read_payload()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del section
+    return after - before
+
+
+def main(peers: int = 5000):
+    payload = handshake_response(peers)
+    print("decoded %d peers (%d bytes payload)" % (peers, len(payload)))
+    for name, kwargs in (("ctypes", {}), ("native", {'native': True})):
+        size = retained(payload, **kwargs)
+        t = min(timeit.repeat(lambda: LevinReader(payload, **kwargs).read_payload(), number=3, repeat=3)) / 3
+        print("  %-7s %10d bytes retained %8.0f bytes/peer %8.2f ms/decode" % (name, size, size / peers, t * 1000))
+
+    print("scalar construction")
+    n = 200000
+    for name, stmt in (("c_uint64(x)", lambda: c_uint64(1234567)),
+                       ("c_uint32(x)", lambda: c_uint32(1234567)),
+                       ("int", lambda: 1234567)):
+        t = min(timeit.repeat(stmt, number=n, repeat=3))
+        print("  %-12s %8.1f ns" % (name, t / n * 1e9))
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,49 @@
+"""
+Cost of the instrumentation hooks on the framing path: feeding ping
+responses through LevinFrameDecoder with hooks disabled, with no-op `Hooks`
+and with `Metrics`, then a session against a local server with metrics on.
+
+    python -m benchmarks.bench_metrics
+"""
+import asyncio
+import timeit
+
+from levin import metrics
+from levin.bucket import Bucket
+from levin.framing import LevinFrameDecoder
+from levin.section import Section
+from levin.server import LevinServer
+from levin.session import LevinSession
+from levin.constants import *
+
+
+async def _session():
+    async with LevinServer('127.0.0.1', 0, peers=[('10.0.0.%d' % i, 18080) for i in range(1, 251)]) as server:
+        async with LevinSession('127.0.0.1', server.port) as session:
+            await session.peers()
+            await session.peers()
+            await session.ping()
+
+
+def main(frames: int = 1000):
+    bucket = Bucket.create_response(P2P_COMMAND_PING.value, section=Section.ping_response(1))
+    stream = b''.join(bytes(b) for b in bucket.buffers()) * frames
+
+    baseline = None
+    for label, hooks in (('disabled', None), ('Hooks', metrics.Hooks()), ('Metrics', metrics.Metrics())):
+        if hooks is None:
+            metrics.disable()
+        else:
+            metrics.enable(hooks)
+        t = min(timeit.repeat(lambda: LevinFrameDecoder().feed(stream), number=5, repeat=5)) / 5 / frames
+        baseline = baseline or t
+        print("feed ping response %-10s %6.2f us/frame  %+5.1f%%" % (label, t * 1e6, 100 * (t / baseline - 1)))
+
+    m = metrics.enable()
+    asyncio.run(_session())
+    metrics.disable()
+    print(m.prometheus(), end='')
+
+
+if __name__ == '__main__':
+    main()
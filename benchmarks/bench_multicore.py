@@ -0,0 +1,120 @@
+"""
+Crawl throughput of ShardedCrawler with 1..N worker processes against fake
+nodes served from separate processes. Sightings go to an in-memory
+PeerStore and must arrive with their peer ids. First, a node advertising
+peers without last_seen or id, or with them 0, is crawled by Crawler and by
+ShardedCrawler; both must write the same edges and store rows. Then a
+crawl of nodes advertising 250 peers each must push batches larger than a
+pipe buffer both ways at once, and finish.
+
+    python -m benchmarks.bench_multicore [nodes] [max_workers] [concurrency]
+"""
+import asyncio
+import csv
+import io
+import multiprocessing
+import random
+import sys
+import threading
+
+from levin.crawler import Crawler, EdgeWriter, ShardedCrawler
+from levin.peerstore import PeerStore
+from levin.section import Section
+from levin.ctypes import *
+from benchmarks.corpus import _peer
+from benchmarks.fakenet import FakeNetwork, FakeNetworkProcesses
+
+
+def _sparse_handshake() -> bytes:
+    """a handshake response whose peers leave out last_seen or id, or send them as 0"""
+    rnd = random.Random(0)
+    peers = [_peer(rnd, '10.1.0.%d' % i) for i in range(1, 6)]
+    for i, peer in enumerate(peers):
+        # not the clock, which may tick between the crawls compared
+        peer.entries['last_seen'] = c_int64(1700000000 + i)
+    del peers[0].entries['last_seen']
+    peers[1].entries['last_seen'] = c_int64(0)
+    del peers[2].entries['id']
+    peers[3].entries['id'] = c_uint64(0)
+    section = Section.handshake_request(my_port=18080, peer_id=1)
+    section.add('local_peerlist_new', peers)
+    return bytes(section)
+
+
+def _crawl(seeds: list, workers: int) -> tuple:
+    """edges as (peer_host, peer_port, last_seen) and stored (ip, port, id) of a crawl of `seeds`' peers"""
+    edges = EdgeWriter(fileobj=io.StringIO())
+    store = PeerStore()
+    options = dict(seeds=seeds, max_depth=0, timeout=5.0, retries=0, output=edges, store=store)
+    if workers == 1:
+        asyncio.run(Crawler(**options).run())
+    else:
+        ShardedCrawler(workers=workers, **options).run()
+    rows = [tuple(row[2:]) for row in csv.reader(io.StringIO(edges.fileobj.getvalue()))][1:]
+    stored = sorted((p.ip, p.port, p.id) for p in store.fresh())
+    store.close()
+    return rows, stored
+
+
+async def _crawl_sparse(workers: int) -> tuple:
+    async with FakeNetwork(nodes=1) as network:
+        network._payloads[0]['handshake'] = _sparse_handshake()
+        # this loop serves the fake node while another thread crawls it
+        return await asyncio.get_running_loop().run_in_executor(None, _crawl, network.seeds, workers)
+
+
+def sparse_sightings():
+    single, sharded = asyncio.run(_crawl_sparse(1)), asyncio.run(_crawl_sparse(2))
+    assert single == sharded, (single, sharded)
+    rows, stored = single
+    assert [row[2] for row in rows[:2]] == ['', '0'] and all(row[2].isdigit() for row in rows[2:]), rows
+    assert stored[2][2] is None and stored[3][2] == 0, stored
+    print("sparse peer entries: Crawler and ShardedCrawler write the same %d edges and store rows" % len(rows))
+
+
+class _Batches(ShardedCrawler):
+    """records the largest results batch read and the largest outbox left after it"""
+    results = outbox = 0
+
+    def _on_results(self, data: bytes):
+        super(_Batches, self)._on_results(data)
+        self.results = max(self.results, len(data))
+        self.outbox = max(self.outbox, max(map(len, self._outbox)))
+
+
+def both_ways(nodes: int = 8000, workers: int = 1, deadline: float = 300.0):
+    with FakeNetworkProcesses(nodes=nodes, degree=250, processes=2) as network:
+        crawler = _Batches(seeds=network.seeds, workers=workers, concurrency=1000, timeout=30.0, retries=0)
+        thread = threading.Thread(target=crawler.run, daemon=True)
+        thread.start()
+        thread.join(deadline)
+        assert not thread.is_alive(), "stalled: %r" % crawler.stats
+    assert crawler.stats.nodes_ok == nodes, crawler.stats
+    assert crawler.results > 1 << 16 and crawler.outbox > 1 << 16, (crawler.results, crawler.outbox)
+    print("large batches both ways: results up to %d KiB, targets up to %d KiB -> %r"
+          % (crawler.results >> 10, crawler.outbox >> 10, crawler.stats))
+
+
+def run(nodes: int, workers: int, concurrency: int):
+    store = PeerStore()
+    with FakeNetworkProcesses(nodes=nodes, degree=32, processes=2) as network:
+        crawler = ShardedCrawler(seeds=network.seeds, workers=workers, concurrency=concurrency,
+                                 timeout=5.0, retries=0, store=store)
+        stats = crawler.run()
+    peers = store.fresh()
+    assert peers and all(peer[4] is not None for peer in peers), "sightings without a peer id"
+    store.close()
+    return stats
+
+
+def main(nodes: int = 2000, max_workers: int = None, concurrency: int = 200):
+    print("cpus=%d" % multiprocessing.cpu_count())
+    sparse_sightings()
+    both_ways()
+    for workers in range(1, (max_workers or multiprocessing.cpu_count()) + 1):
+        stats = run(nodes, workers, concurrency)
+        print("workers=%d -> %r" % (workers, stats))
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,58 @@
+"""
+Peer list extraction from a raw handshake payload: PeerListScanner columns
+against decoding the payload and calling Bucket.get_peers(). A mixed
+IPv4/IPv6 peer list must come out of get_peers() the same, value types
+included, whether decoded with ctypes or native values.
+
+    python -m benchmarks.bench_peerlist
+"""
+import timeit
+
+from levin.bucket import Bucket
+from levin.peerlist import extract_peers
+from levin.section import Section
+from levin.constants import *
+from benchmarks.corpus import handshake_response
+
+
+def _get_peers(payload: bytes, **options):
+    bucket = Bucket.create_response(P2P_COMMAND_HANDSHAKE.value)
+    bucket.read_payload(payload, **options)
+    return [(p['ip'].ip, p['port'].value) for p in bucket.get_peers()]
+
+
+def _mixed():
+    section = Section.handshake_response([('1.2.3.4', 18080), ('2001:db8::1', 18081), ('5.6.7.8', 18082)])
+    payload = bytes(section)
+    for native in (False, True):
+        bucket = Bucket.create_response(P2P_COMMAND_HANDSHAKE.value)
+        bucket.read_payload(payload, native=native)
+        yield [(p['ip'].ip, type(p['port']).__name__, p['port'].value) for p in bucket.get_peers()]
+
+
+def main():
+    plain, native = _mixed()
+    assert plain == native and len(plain) == 3, (plain, native)
+
+    for peers in (250, 5000):
+        payload = handshake_response(peers=peers)
+        ipv4, ipv6 = extract_peers(payload)
+        assert [(ip, port) for ip, port, _, _ in ipv4] == _get_peers(payload)
+
+        number = max(1, 20000 // peers)
+        results = [
+            ('get_peers', lambda: _get_peers(payload)),
+            ('get_peers native', lambda: _get_peers(payload, native=True)),
+            ('extract_peers', lambda: extract_peers(payload)),
+            ('extract_peers + addresses', lambda: [c.address(i) for c in extract_peers(payload)
+                                                   for i in range(len(c))]),
+        ]
+        baseline = None
+        for name, fn in results:
+            t = min(timeit.repeat(fn, number=number, repeat=5)) / number
+            baseline = baseline or t
+            print("%5d peers  %-26s %8.3f ms  %5.1fx" % (peers, name, t * 1e3, baseline / t))
+
+
+if __name__ == '__main__':
+    main()
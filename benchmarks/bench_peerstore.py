@@ -0,0 +1,42 @@
+"""
+PeerStore upsert rate when fed decoded handshake responses, and fresh-peer
+query time.
+
+    python -m benchmarks.bench_peerstore [responses] [peers] [path]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from levin.bucket import Bucket
+from levin.peerstore import PeerStore
+from levin.constants import *
+from benchmarks.corpus import handshake_response
+
+
+def main(responses: int = 200, peers: int = 250, path: str = None):
+    # a pool of 20 distinct responses, so later ones update existing records
+    buckets = []
+    for seed in range(20):
+        bucket = Bucket.create_response(P2P_COMMAND_HANDSHAKE.value)
+        bucket.read_payload(handshake_response(peers=peers, seed=seed), native=True)
+        buckets.append(bucket)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with PeerStore(path or os.path.join(tmp, 'peers.db')) as store:
+            started = time.perf_counter()
+            for i in range(responses):
+                store.add_bucket(buckets[i % len(buckets)], source=('10.0.0.%d' % (i % 250), 18080))
+            store.flush()
+            elapsed = time.perf_counter() - started
+            print("%d sightings in %.2fs: %.0f sightings/s, %d distinct peers" % (
+                responses * peers, elapsed, responses * peers / elapsed, len(store)))
+
+            started = time.perf_counter()
+            fresh = store.fresh(since=time.time() - 3600, limit=1000)
+            print("fresh(1h, limit=1000): %d peers in %.2fms" % (len(fresh), (time.perf_counter() - started) * 1e3))
+
+
+if __name__ == '__main__':
+    main(*(int(a) if a.isdigit() else a for a in sys.argv[1:]))
@@ -0,0 +1,109 @@
+"""
+PropagationMonitor against a simulated gossip network: how closely the
+recorded delays follow the true ones, and how many sightings per second
+the monitor keeps up with. First, nodes that answer the handshake with an
+empty payload or an unreadable peer list, then hang up, must be reconnected
+to again and again.
+
+    python -m benchmarks.bench_propagation
+"""
+import asyncio
+import logging
+import statistics
+import time
+
+from levin.bucket import Bucket
+from levin.framing import LevinFrameDecoder
+from levin.monitor import PropagationMonitor, TX, BLOCK
+from levin.section import Section
+from levin.constants import *
+from benchmarks.gossip import GossipNetwork
+
+
+async def _settle(monitor: PropagationMonitor, expected: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while len(monitor.records) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def _answering(payload: bytes):
+    """a node answering a handshake with `payload`, then hanging up"""
+    async def serve(reader, writer):
+        decoder = LevinFrameDecoder()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            if any(bucket.command.value == P2P_COMMAND_HANDSHAKE.value for bucket in decoder.feed(data)):
+                writer.writelines(Bucket.create_response(P2P_COMMAND_HANDSHAKE.value, payload=payload).buffers())
+                await writer.drain()
+                break
+        writer.close()
+    return await asyncio.start_server(serve, '127.0.0.1', 0)
+
+
+async def misbehaving(timeout: float = 10.0):
+    unreadable = Section()
+    unreadable.add('local_peerlist_new', [b'not a peer'])
+    servers = [await _answering(b''), await _answering(bytes(unreadable))]
+    # the unreadable one is logged as an error each time
+    logging.disable(logging.ERROR)
+    try:
+        async with PropagationMonitor(reconnect_delay=0.01) as monitor:
+            for server in servers:
+                monitor.watch('127.0.0.1', server.sockets[0].getsockname()[1])
+            deadline = time.monotonic() + timeout
+            while (monitor.stats.sessions < 3 or monitor.stats.errors < 3) and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+    finally:
+        logging.disable(logging.NOTSET)
+        for server in servers:
+            server.close()
+    assert monitor.stats.sessions >= 3 and monitor.stats.errors >= 3, monitor.stats
+    print("empty and unreadable handshake responses, reconnected: %r" % monitor.stats)
+
+
+async def run(nodes: int, objects: int, burst: int):
+    async with GossipNetwork(nodes=nodes) as network:
+        async with PropagationMonitor(max_records=None) as monitor:
+            for host, port in network.addresses:
+                monitor.watch(host, port)
+            while len(monitor.sessions) < nodes:
+                await asyncio.sleep(0.01)
+
+            # accuracy: spaced out objects, recorded delay against true delay
+            for i in range(objects):
+                network.inject(BLOCK if i % 10 == 0 else TX)
+                await asyncio.sleep(0.01)
+            await _settle(monitor, objects * nodes)
+
+            index = {address: i for i, address in enumerate(network.addresses)}
+            errors = []
+            for sighting in monitor.records:
+                arrivals = network.arrivals[sighting.id]
+                true_delay = arrivals[index[sighting.peer]] - min(arrivals.values())
+                errors.append(abs(sighting.delay - true_delay))
+            print("%d nodes, %d objects: %d sightings, delay error median %.2f ms, p99 %.2f ms" % (
+                nodes, objects, len(monitor.records), 1e3 * statistics.median(errors),
+                1e3 * statistics.quantiles(errors, n=100)[98]))
+
+            # throughput: a burst of transactions
+            monitor.records.clear()
+            started = time.monotonic()
+            network.delay = (0.0, 0.001)
+            for _ in range(burst):
+                network.inject(TX)
+            await _settle(monitor, burst * nodes)
+            elapsed = time.monotonic() - started
+            print("burst of %d txs: %d sightings in %.2fs, %.0f sightings/s" % (
+                burst, len(monitor.records), elapsed, len(monitor.records) / elapsed))
+            print(monitor.stats)
+
+
+def main(nodes: int = 20, objects: int = 200, burst: int = 2000):
+    asyncio.run(misbehaving())
+    asyncio.run(run(nodes, objects, burst))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Decode throughput of LevinReader on handshake responses, compared to the
+previous per-field BytesIO decoder (kept below as a reference), and of a
+selective query (node_data.peer_id, payload_data.current_height and the
+first peer address) with full vs lazy decoding. With the C extension
+built lazy readers decode eagerly in C as well; set LEVIN_PURE_PYTHON=1
+to time skimming against the Python decoder.
+
+    python -m benchmarks.bench_reader
+"""
+import sys
+import timeit
+from io import BytesIO
+
+from levin.reader import LevinReader
+from levin.section import Section
+from levin.ctypes import *
+from levin.constants import *
+from benchmarks.corpus import handshake_response
+
+
+class LegacyReader:
+    """The BytesIO + _CType.from_buffer decoder LevinReader replaced."""
+    def __init__(self, buffer: bytes):
+        self.buffer = BytesIO(buffer)
+
+    def read_payload(self):
+        c_uint32.from_buffer(self.buffer)
+        c_uint32.from_buffer(self.buffer)
+        c_ubyte.from_buffer(self.buffer)
+        return self.read_section()
+
+    def read_section(self):
+        section = Section()
+        count = self.read_var_int()
+        while count > 0:
+            len_name = c_ubyte.from_buffer(self.buffer)
+            name = self.buffer.read(len_name.value).decode('ascii')
+            section.add(name, self.load_storage_entry())
+            count -= 1
+        return section
+
+    def load_storage_entry(self):
+        _type = c_ubyte.from_buffer(self.buffer)
+        if (_type & SERIALIZE_FLAG_ARRAY) != 0:
+            size = self.read_var_int()
+            _type &= ~SERIALIZE_FLAG_ARRAY.value
+            return [self.read(_type) for _ in range(size)]
+        return self.read(_type)
+
+    def read(self, _type):
+        for stype, ctype in ((SERIALIZE_TYPE_UINT64, c_uint64), (SERIALIZE_TYPE_INT64, c_int64),
+                             (SERIALIZE_TYPE_UINT32, c_uint32), (SERIALIZE_TYPE_INT32, c_int32),
+                             (SERIALIZE_TYPE_UINT16, c_uint16), (SERIALIZE_TYPE_INT16, c_int16),
+                             (SERIALIZE_TYPE_UINT8, c_ubyte), (SERIALIZE_TYPE_INT8, c_byte)):
+            if _type == stype:
+                return ctype.from_buffer(self.buffer)
+        if _type == SERIALIZE_TYPE_OBJECT:
+            return self.read_section()
+        if _type == SERIALIZE_TYPE_STRING:
+            return self.buffer.read(self.read_var_int())
+
+    def read_var_int(self):
+        b = c_ubyte.from_buffer(self.buffer)
+        size_mask = b & PORTABLE_RAW_SIZE_MARK_MASK
+        if size_mask == PORTABLE_RAW_SIZE_MARK_BYTE:
+            return b.value >> 2
+        nbytes = {1: 1, 2: 3, 3: 7}[size_mask]
+        v = b.value
+        for i in range(nbytes):
+            v |= c_ubyte.from_buffer(self.buffer).value << (8 * (i + 1))
+        return v >> 2
+
+
+def bench(func, number: int) -> float:
+    """returns best-of-3 calls/sec"""
+    best = min(timeit.repeat(func, number=number, repeat=3))
+    return number / best
+
+
+def query(section):
+    node_data = section.entries['node_data'].entries
+    payload_data = section.entries['payload_data'].entries
+    peer = section.entries['local_peerlist_new'][0].entries
+    return node_data['peer_id'], payload_data['current_height'], peer['adr'].entries['addr'].entries['m_ip']
+
+
+def main(peers=(10, 250, 5000)):
+    print("%-10s %8s %14s %14s %8s" % ("peers", "bytes", "legacy ops/s", "reader ops/s", "speedup"))
+    for n in peers:
+        payload = handshake_response(n)
+        number = max(1, 5000 // n)
+        legacy = bench(lambda: LegacyReader(payload).read_payload(), number)
+        current = bench(lambda: LevinReader(payload).read_payload(), number)
+        print("%-10d %8d %14.1f %14.1f %7.2fx" % (n, len(payload), legacy, current, current / legacy))
+
+    print()
+    print("%-10s %14s %14s %8s" % ("peers", "full query/s", "lazy query/s", "speedup"))
+    for n in peers:
+        payload = handshake_response(n)
+        number = max(1, 5000 // n)
+        full = bench(lambda: query(LevinReader(payload).read_payload()), number)
+        lazy = bench(lambda: query(LevinReader(payload, lazy=True).read_payload()), number)
+        print("%-10d %14.1f %14.1f %7.2fx" % (n, full, lazy, lazy / full))
+
+
+if __name__ == '__main__':
+    main(tuple(int(a) for a in sys.argv[1:]) or (10, 250, 5000))
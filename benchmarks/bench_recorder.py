@@ -0,0 +1,150 @@
+"""
+Cost of the traffic recorder: feeding frames through LevinFrameDecoder,
+framed only and decoded, and a ping loop over a local server connection,
+with recording off and on. The writer thread's time counts too (it shares
+the CPU on a single core). Everything recorded, into small files so they
+rotate, is read back through `levin.capture.replay` and compared with what
+went over the wire, including handshakes rendered with
+`MessageTemplate.render_into()` into one reused buffer.
+
+    python -m benchmarks.bench_recorder [frames]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+from levin import recorder
+from levin.aio import LevinConnection
+from levin.bucket import Bucket
+from levin.capture import replay, ReplayStats
+from levin.framing import LevinFrameDecoder
+from levin.section import Section
+from levin.server import LevinServer
+from levin.template import handshake_template
+from levin.constants import *
+from benchmarks.corpus import timed_sync_response, new_transactions
+
+PEER = ('10.0.0.1', 18080)
+
+
+def _frames():
+    ping = Bucket.create_response(P2P_COMMAND_PING.value, section=Section.ping_response(1))
+    timed_sync = Bucket.create_response(P2P_COMMAND_TIMED_SYNC.value, payload=timed_sync_response(peers=250))
+    txs = Bucket.create_request(NOTIFY_NEW_TRANSACTIONS.value, payload=new_transactions(4))
+    for name, bucket in (('ping', ping), ('timed_sync_250', timed_sync), ('new_transactions_4', txs)):
+        yield name, bucket.header() + bucket.payload()
+
+
+def _feed(stream: bytes, decode: bool = False, chunk: int = 65536):
+    decoder = LevinFrameDecoder(decode=decode, peer=PEER)
+    for i in range(0, len(stream), chunk):
+        decoder.feed(stream[i:i + chunk])
+
+
+async def _pings(n: int) -> float:
+    async with LevinServer('127.0.0.1', 0) as server:
+        conn = await LevinConnection.connect('127.0.0.1', server.port)
+        try:
+            await conn.request(P2P_COMMAND_PING, Section())
+            started = time.perf_counter()
+            for _ in range(n):
+                await conn.request(P2P_COMMAND_PING, Section())
+            return (time.perf_counter() - started) / n
+        finally:
+            conn.writer.close()
+
+
+async def _rendered(n: int):
+    """`n` handshakes rendered into the same buffer, my_port counting up"""
+    template = handshake_template()
+    buffer = bytearray(template.size)
+    async with LevinServer('127.0.0.1', 0) as server:
+        conn = await LevinConnection.connect('127.0.0.1', server.port)
+        try:
+            for i in range(n):
+                await conn.request(P2P_COMMAND_HANDSHAKE, frame=template.render_into(buffer, my_port=i, peer_id=i))
+        finally:
+            conn.writer.close()
+
+
+def _read_back(r: recorder.Recorder) -> tuple:
+    stats = ReplayStats()
+    frames = {}
+    for path in r.files():
+        for frame in replay(path, decode=False, stats=stats):
+            key = (frame.bucket.command.value, frame.bucket.is_response)
+            frames[key] = frames.get(key, 0) + 1
+    return stats, frames
+
+
+def main(frames: int = 2000):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'traffic.dump')
+    try:
+        print("feed, %d frames" % frames)
+        for name, frame in _frames():
+            stream = frame * frames
+            times = []
+            for decode in (False, True):
+                recorder.disable()
+                times.append(min(timeit.repeat(lambda: _feed(stream, decode), number=1, repeat=5)) / frames)
+                recorder.enable(path)
+                times.append(min(timeit.repeat(lambda: _feed(stream, decode), number=1, repeat=5)) / frames)
+                recorder.disable()
+                for p in os.listdir(directory):
+                    os.remove(os.path.join(directory, p))
+
+            # once more into files a third of the stream, to rotate; the writer thread
+            # shares the CPU, so this includes its time until everything is written
+            r = recorder.enable(path, max_bytes=len(stream) // 3 + 4096, backups=8)
+            started = time.perf_counter()
+            _feed(stream)
+            r.flush()
+            written = (time.perf_counter() - started) / frames
+            recorder.disable()
+            stats, _ = _read_back(r)
+            print("  %-20s %6d B  framed %7.2f -> %7.2f us (%+4.0f%%)  decoded %7.2f -> %7.2f us (%+4.0f%%)"
+                  "  recorded %7.2f us/frame  %r"
+                  % (name, len(frame), times[0] * 1e6, times[1] * 1e6, 100 * (times[1] / times[0] - 1),
+                     times[2] * 1e6, times[3] * 1e6, 100 * (times[3] / times[2] - 1), written * 1e6, r))
+            assert r.dropped == 0 and r.rotations >= 2 and stats.frames == r.frames == frames, (stats, r)
+            assert stats.bytes == r.bytes == len(stream), (stats, r)
+            for p in r.files():
+                os.remove(p)
+
+        n = frames
+        off = asyncio.run(_pings(n))
+        r = recorder.enable(path)
+        on = asyncio.run(_pings(n))
+        recorder.disable()
+        stats, recorded = _read_back(r)
+        print("ping round trips over loopback: off %.1f us  on %.1f us (%+.1f%%)  %r"
+              % (off * 1e6, on * 1e6, 100 * (on / off - 1), r))
+        # both ends of each ping, as seen by the client and by the server
+        ping = P2P_COMMAND_PING.value
+        assert recorded[(ping, False)] == recorded[(ping, True)] == 2 * (n + 1), recorded
+        assert stats.decode_errors == stats.stream_errors == 0, stats
+        for p in r.files():
+            os.remove(p)
+
+        # the client's copy of each handshake, and the server's
+        r = recorder.enable(path)
+        asyncio.run(_rendered(100))
+        recorder.disable()
+        ports = sorted(frame.bucket.payload_section.entries['node_data'].entries['my_port'].value
+                       for frame in replay(path) if frame.bucket.command.value == P2P_COMMAND_HANDSHAKE.value
+                       and frame.bucket.is_request)
+        assert ports == sorted(list(range(100)) * 2), ports
+        print("100 handshakes rendered into one buffer recorded intact  %r" % r)
+    finally:
+        recorder.disable()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
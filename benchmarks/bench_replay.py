@@ -0,0 +1,158 @@
+"""
+Offline replay of captures: the same synthetic traffic written as a dump
+file and as a pcap of segmented TCP streams (with retransmissions and
+reordered segments), then framed and decoded back. Checks that every
+frame comes back and reports throughput, Python heap peak, and the
+process pool over several files.
+
+    python -m benchmarks.bench_replay [megabytes] [files]
+"""
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from levin.bucket import Bucket
+from levin.capture import DumpWriter, replay, replay_files, ReplayStats, IN, OUT
+from benchmarks.corpus import CASES, new_transactions
+
+_PCAP_HEADER = struct.Struct('<IHHiIII')
+_PACKET = struct.Struct('<IIII')
+_ETHERNET = b'\x00\x00\x00\x00\x00\x02' + b'\x00\x00\x00\x00\x00\x01' + b'\x08\x00'
+_IPV4 = struct.Struct('>BBHHHBBH4s4s')
+_TCP = struct.Struct('>HHIIBBHHH')
+MSS = 1448
+SERVER = ('10.0.0.1', 18080)
+
+
+def traffic(megabytes: float, seed: int = 0):
+    """(client, server to client, command, raw frame) of `megabytes` of frames over 8 connections"""
+    rnd = random.Random(seed)
+    cases = [(name, case) for name, case in CASES.items() if not name.endswith(('1000', '5000'))]
+    payloads = {name: case[2]() for name, case in cases}
+    # tx notifications as they usually come, a few at a time
+    cases.append(('new_transactions_4', CASES['new_transactions_1000']))
+    payloads['new_transactions_4'] = new_transactions(4)
+    clients = [('10.0.1.%d' % (i + 1), 40000 + i) for i in range(8)]
+    total = 0
+    while total < megabytes * 1e6:
+        name, (command, is_response, _) = rnd.choice(cases)
+        if is_response:
+            bucket = Bucket.create_response(command, payload=payloads[name])
+        else:
+            bucket = Bucket.create_request(command, payload=payloads[name])
+        frame = bucket.header() + bucket.payload()
+        total += len(frame)
+        yield rnd.choice(clients), is_response, command, frame
+
+
+def write_dump(path: str, frames: list):
+    with DumpWriter(path) as writer:
+        for i, (client, inbound, _, frame) in enumerate(frames):
+            writer.write(frame, client, IN if inbound else OUT, timestamp=1.7e9 + i * 0.001)
+
+
+def write_pcap(path: str, frames: list, seed: int = 0):
+    """Ethernet/IPv4 pcap of the frames as TCP segments, 2% of them retransmitted and 2% swapped with the next"""
+    rnd = random.Random(seed)
+    seqs = {}
+
+    def packet(src, dst, seq, flags, data=b''):
+        tcp = _TCP.pack(src[1], dst[1], seq, 0, 5 << 4, flags, 65535, 0, 0)
+        ip = _IPV4.pack(0x45, 0, 20 + len(tcp) + len(data), 0, 0, 64, 6, 0,
+                        bytes(map(int, src[0].split('.'))), bytes(map(int, dst[0].split('.'))))
+        return _ETHERNET + ip + tcp + data
+
+    with open(path, 'wb') as f:
+        f.write(_PCAP_HEADER.pack(0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        clock = 1.7e9
+
+        def emit(data):
+            nonlocal clock
+            clock += 0.0001
+            seconds = int(clock)
+            f.write(_PACKET.pack(seconds, int((clock - seconds) * 1e6), len(data), len(data)))
+            f.write(data)
+
+        for client, inbound, _, frame in frames:
+            src, dst = (SERVER, client) if inbound else (client, SERVER)
+            if (src, dst) not in seqs:
+                seqs[(src, dst)] = rnd.getrandbits(32)
+                emit(packet(src, dst, seqs[(src, dst)], 0x02))
+                seqs[(src, dst)] += 1
+            segments = []
+            for i in range(0, len(frame), MSS):
+                segments.append(packet(src, dst, seqs[(src, dst)] & 0xffffffff, 0x18, frame[i:i + MSS]))
+                seqs[(src, dst)] += len(frame[i:i + MSS])
+            i = 0
+            while i < len(segments):
+                if i + 1 < len(segments) and rnd.random() < 0.02:
+                    emit(segments[i + 1])
+                    emit(segments[i])
+                    i += 2
+                    continue
+                emit(segments[i])
+                if rnd.random() < 0.02:
+                    emit(segments[i])
+                i += 1
+
+
+def measure(path: str, expected: list, **options) -> tuple:
+    stats = ReplayStats()
+    started = time.perf_counter()
+    commands = [frame.bucket.command.value for frame in replay(path, stats=stats, **options)]
+    elapsed = time.perf_counter() - started
+    if sorted(commands) != sorted(expected):
+        raise AssertionError("%s: %d frames replayed, %d expected" % (path, len(commands), len(expected)))
+
+    # again for the heap peak; tracemalloc slows it down too much to time it
+    tracemalloc.start()
+    for _ in replay(path, **options):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return stats, elapsed, peak
+
+
+def main(megabytes: float = 50, files: int = 4):
+    frames = list(traffic(megabytes))
+    expected = [command for _, _, command, _ in frames]
+    directory = tempfile.mkdtemp()
+    dump, pcap = os.path.join(directory, 'capture.dump'), os.path.join(directory, 'capture.pcap')
+    try:
+        write_dump(dump, frames)
+        write_pcap(pcap, frames)
+        del frames
+        print("%d frames, dump %.1f MB, pcap %.1f MB" % (len(expected), os.path.getsize(dump) / 1e6,
+                                                        os.path.getsize(pcap) / 1e6))
+
+        for path in (dump, pcap):
+            for name, options in (('frame only', {'decode': False}), ('native', {'native': True}),
+                                  ('full decode', {})):
+                stats, elapsed, peak = measure(path, expected, **options)
+                print("  %-5s %-12s %8.1f MB/s %9.0f frames/s  heap peak %6.1f MB  %r"
+                      % (os.path.splitext(path)[1][1:], name, os.path.getsize(path) / 1e6 / elapsed,
+                         stats.frames / elapsed, peak / 1e6, stats))
+
+        paths = [pcap] * files
+        output = os.path.join(directory, 'records.jsonl')
+        for processes in sorted({1, min(files, os.cpu_count() or 1), files}):
+            started = time.perf_counter()
+            stats = replay_files(paths, output, processes=processes)
+            elapsed = time.perf_counter() - started
+            with open(output) as f:
+                records = sum(1 for _ in f)
+            assert records == stats.frames == len(expected) * files
+            print("  %d files, %d processes: %6.1f MB/s %9.0f records/s"
+                  % (files, processes, os.path.getsize(pcap) * files / 1e6 / elapsed, records / elapsed))
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main(*(float(a) if i == 0 else int(a) for i, a in enumerate(sys.argv[1:])))
@@ -0,0 +1,54 @@
+"""
+Decode and encode time of the schema-compiled messages against the generic
+Section path.
+
+    python -m benchmarks.bench_schema
+"""
+import timeit
+
+from levin.reader import LevinReader
+from levin.section import Section
+from levin.writer import LevinWriter
+from levin.schema import HandshakeRequest, HandshakeResponse, PingResponse, SupportFlagsResponse
+from benchmarks.corpus import handshake_response
+
+
+def _encode_section(section):
+    return LevinWriter().write_payload(section).getvalue()
+
+
+def main():
+    cases = [
+        ('handshake request', bytes(Section.handshake_request()), HandshakeRequest),
+        ('handshake response 250', handshake_response(peers=250), HandshakeResponse),
+        ('handshake response 5000', handshake_response(peers=5000), HandshakeResponse),
+        ('ping response', bytes(Section.ping_response(1)), PingResponse),
+        ('support_flags response', bytes(Section.create_flags_response()), SupportFlagsResponse),
+    ]
+    for name, payload, cls in cases:
+        number = max(1, 200000 // len(payload))
+        timings = [
+            ('Section', lambda: LevinReader(payload).read_payload()),
+            ('Section native', lambda: LevinReader(payload, native=True).read_payload()),
+            ('schema', lambda: cls.decode(payload)),
+        ]
+        baseline = None
+        for label, fn in timings:
+            t = min(timeit.repeat(fn, number=number, repeat=5)) / number
+            baseline = baseline or t
+            print("decode %-24s %-15s %10.1f us  %5.1fx" % (name, label, t * 1e6, baseline / t))
+
+        section, message = LevinReader(payload).read_payload(), cls.decode(payload)
+        timings = [
+            ('Section', lambda: _encode_section(section)),
+            ('schema', lambda: message.encode()),
+        ]
+        baseline = None
+        for label, fn in timings:
+            t = min(timeit.repeat(fn, number=number, repeat=5)) / number
+            baseline = baseline or t
+            print("encode %-24s %-15s %10.1f us  %5.1fx" % (name, label, t * 1e6, baseline / t))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Sending buckets over a socketpair: two send() calls per bucket vs one
+sendmsg() per bucket vs batches of buckets per sendmsg().
+
+    python -m benchmarks.bench_send [buckets]
+"""
+import socket
+import sys
+import threading
+import time
+
+from levin.bucket import Bucket
+from levin.template import PING, handshake_template
+
+
+def drain(sock: socket.socket, total: int):
+    buffer = bytearray(1 << 16)
+    while total > 0:
+        total -= sock.recv_into(buffer)
+
+
+def run(name: str, buckets: list, send):
+    a, b = socket.socketpair()
+    total = sum(len(x.header()) + len(x.payload()) for x in buckets)
+    reader = threading.Thread(target=drain, args=(b, total))
+    reader.start()
+    started = time.perf_counter()
+    send(a, buckets)
+    reader.join()
+    elapsed = time.perf_counter() - started
+    a.close()
+    b.close()
+    print("%-22s %10.0f buckets/s" % (name, len(buckets) / elapsed))
+
+
+def two_sends(sock, buckets):
+    for bucket in buckets:
+        sock.sendall(bucket.header())
+        sock.sendall(bucket.payload())
+
+
+def sendmsg_each(sock, buckets):
+    for bucket in buckets:
+        bucket.send(sock)
+
+
+def sendmsg_batched(sock, buckets, batch=64):
+    for i in range(0, len(buckets), batch):
+        Bucket.send_many(sock, buckets[i:i + batch])
+
+
+def main(count: int = 50000):
+    buckets = [PING.bucket() if i % 2 else handshake_template().bucket(my_port=0, peer_id=i)
+               for i in range(count)]
+    run("two send() calls", buckets, two_sends)
+    run("sendmsg per bucket", buckets, sendmsg_each)
+    run("sendmsg, 64 per call", buckets, sendmsg_batched)
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
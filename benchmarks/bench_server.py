@@ -0,0 +1,83 @@
+"""
+Load test of LevinServer: many local clients handshake and then stay
+connected idle. Reports handshakes/sec and the server's resident memory per
+idle connection. The server runs in its own process.
+
+    python -m benchmarks.bench_server [clients] [concurrency]
+"""
+import asyncio
+import multiprocessing
+import sys
+import time
+
+from levin.framing import LevinFrameDecoder
+from levin.server import LevinServer
+from levin.template import handshake_template
+from benchmarks.corpus import handshake_response
+
+
+def _rss() -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _serve(conn):
+    async def main():
+        loop = asyncio.get_event_loop()
+        peers = [('10.0.%d.%d' % (i // 256, i % 256), 18080) for i in range(250)]
+        async with LevinServer('127.0.0.1', 0, peers=peers, max_connections=1 << 20) as server:
+            conn.send(server.port)
+            while await loop.run_in_executor(None, conn.recv):
+                conn.send((len(server.connections), _rss()))
+    asyncio.run(main())
+
+
+async def _client(port: int, frame: bytes, semaphore: asyncio.Semaphore, writers: list):
+    async with semaphore:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(frame)
+        decoder = LevinFrameDecoder(decode=False)
+        while not decoder.feed(await reader.read(65536)):
+            pass
+        writers.append(writer)
+
+
+async def run(clients: int, concurrency: int, port: int, conn):
+    frame = bytes(handshake_template().render(my_port=0, peer_id=1))
+    semaphore = asyncio.Semaphore(concurrency)
+    writers = []
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(port, frame, semaphore, writers) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    conn.send(True)
+    connections, rss = conn.recv()
+    for writer in writers:
+        writer.close()
+    return elapsed, connections, rss
+
+
+def main(clients: int = 5000, concurrency: int = 500):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(child,), daemon=True)
+    process.start()
+    port = parent.recv()
+    parent.send(True)
+    _, baseline = parent.recv()
+
+    elapsed, connections, rss = asyncio.run(run(clients, concurrency, port, parent))
+    print("clients=%d concurrency=%d: %.0f handshakes/s (%.2fs)" % (
+        clients, concurrency, clients / elapsed, elapsed))
+    print("idle connections=%d server rss +%.1f MiB, %.1f KiB per connection" % (
+        connections, (rss - baseline) / 2 ** 20, (rss - baseline) / max(connections, 1) / 1024))
+
+    parent.send(False)
+    process.join(5)
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,41 @@
+"""
+Building outgoing handshake/ping frames from a Section vs a MessageTemplate.
+
+    python -m benchmarks.bench_template
+"""
+import random
+import timeit
+
+from levin.bucket import Bucket
+from levin.section import Section
+from levin.template import handshake_template, PING
+from levin.constants import *
+
+
+def rate(func, number: int = 20000) -> float:
+    return number / min(timeit.repeat(func, number=number, repeat=3))
+
+
+def section_handshake():
+    section = Section.handshake_request(peer_id=random.getrandbits(64))
+    bucket = Bucket.create_request(P2P_COMMAND_HANDSHAKE.value, section=section)
+    return bucket.header() + bucket.payload()
+
+
+def main():
+    template = handshake_template()
+    buffer = bytearray(template.size)
+    ping = Bucket.create_request(P2P_COMMAND_PING.value, section=Section())
+
+    print("%-28s %12.0f frames/s" % ("handshake from Section", rate(section_handshake)))
+    print("%-28s %12.0f frames/s" % ("handshake template.render", rate(
+        lambda: template.render(my_port=0, peer_id=random.getrandbits(64)))))
+    print("%-28s %12.0f frames/s" % ("handshake render_into", rate(
+        lambda: template.render_into(buffer, my_port=0, peer_id=random.getrandbits(64)))))
+    print("%-28s %12.0f frames/s" % ("ping from Section", rate(
+        lambda: Bucket.create_request(P2P_COMMAND_PING.value, section=Section()).header() + ping.payload())))
+    print("%-28s %12.0f frames/s" % ("ping template.render", rate(PING.render)))
+
+
+if __name__ == '__main__':
+    main()
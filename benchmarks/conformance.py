@@ -0,0 +1,272 @@
+"""
+Conformance corpus for the two codec backends: every payload is decoded
+(plain, native, views and columnar, and into typed `levin.schema` messages)
+and every section encoded with the C extension
+and with the pure Python code, and the results, or the class of the errors
+raised, must be identical. The Python codec only stands in for the C one
+on input it reports as `Unsupported`, so a malformed payload fails in C
+with C's own error; how often C fell back is reported. Typed messages
+decoded in C validate the fields the Python decoder skips, so they may
+fail where it does not, but must fail wherever it does. Includes the
+benchmark corpus, hand-written edge cases and seeded random corruptions of
+them.
+
+    python setup.py build_ext --inplace
+    python -m benchmarks.conformance
+"""
+import random
+import struct
+import sys
+from array import array
+
+import levin.reader
+import levin.schema
+import levin.writer
+from dataclasses import fields
+from levin.reader import LevinReader
+from levin.schema import Message, HandshakeResponse, TimedSyncResponse, NewTransactions, ResponseGetObjects
+from levin.section import Section, StringArray
+from levin.writer import LevinWriter, pack_var_int
+from levin.ctypes import *
+from benchmarks.corpus import CASES
+
+_SIGNATURE = struct.pack('<IIB', 0x01011101, 0x01020101, 1)
+
+
+def describe(value):
+    """A comparable rendering of a decoded value: types, values and Section.types"""
+    if isinstance(value, Section):
+        return ('Section', type(value).__name__, dict(value.types) if value.types else None,
+                [(k, describe(v)) for k, v in value.entries.items()])
+    if isinstance(value, Message):
+        return (type(value).__name__, [(f.name, describe(getattr(value, f.name))) for f in fields(value)])
+    if isinstance(value, (list, tuple, StringArray)):
+        return (type(value).__name__, [describe(v) for v in value])
+    if isinstance(value, array):
+        return ('array', value.typecode, value.tolist())
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return (type(value).__name__, bytes(value))
+    if hasattr(value, 'value'):
+        return (type(value).__name__, repr(value.value))
+    return (type(value).__name__, repr(value))
+
+
+def outcome(fn):
+    try:
+        return 'ok', fn()
+    except Exception as e:
+        return 'error', type(e).__name__, str(e)
+
+
+def same(fast: tuple, slow: tuple) -> bool:
+    """equal results, or errors of the same class; which problem is found first may differ"""
+    return fast[:2] == slow[:2]
+
+
+class Fallbacks:
+    """counts the calls into the C codec that raised `Unsupported`"""
+    def __init__(self, speedups):
+        self.speedups = speedups
+        self.Unsupported = speedups.Unsupported
+        self.calls = self.unsupported = 0
+
+    def _count(self, fn, *args):
+        self.calls += 1
+        try:
+            return fn(*args)
+        except self.Unsupported:
+            self.unsupported += 1
+            raise
+
+    def read_section(self, *args):
+        return self._count(self.speedups.read_section, *args)
+
+    def encode_section(self, *args):
+        return self._count(self.speedups.encode_section, *args)
+
+
+def both(fn) -> tuple:
+    """fn() with the C codec and with the Python one"""
+    speedups = levin.reader._speedups
+    try:
+        fast = outcome(fn)
+        levin.reader._speedups = levin.writer._speedups = levin.schema._speedups = None
+        slow = outcome(fn)
+    finally:
+        levin.reader._speedups = levin.writer._speedups = levin.schema._speedups = speedups
+    return fast, slow
+
+
+def payloads(seed: int = 0, corruptions: int = 300):
+    """(name, payload) of the conformance corpus"""
+    for name, (_, _, build) in CASES.items():
+        if not name.endswith('5000'):
+            yield name, build()
+
+    def body(*fields) -> bytes:
+        return _SIGNATURE + pack_var_int(len(fields)) + b''.join(fields)
+
+    def field(name: str, _type: int, value: bytes) -> bytes:
+        return bytes([len(name)]) + name.encode() + bytes([_type]) + value
+
+    scalars = [(1, '<q', -2 ** 63), (2, '<i', -5), (3, '<h', -300), (4, '<b', -1), (5, '<Q', 2 ** 64 - 1),
+               (6, '<I', 2 ** 32 - 1), (7, '<H', 65535), (8, '<B', 255), (9, '<d', 1.5), (11, '<?', True)]
+    yield 'scalars', body(*(field('t%d' % t, t, struct.pack(fmt, v)) for t, fmt, v in scalars))
+    yield 'scalar arrays', body(*(field('a%d' % t, t | 0x80, pack_var_int(3) + struct.pack(fmt, v) * 3)
+                                  for t, fmt, v in scalars))
+    yield 'array type 13', body(field('a', 13, bytes([0x8a]) + pack_var_int(2) + b'\x04ab\x00'))
+    yield 'array type 13 unflagged', body(field('a', 13, bytes([0x0a]) + b'\x04ab'))
+    strings = pack_var_int(3) + b'\x00' + b'\x04a' + pack_var_int(300) + b'x' * 300
+    yield 'string array', body(field('s', 0x8a, strings))
+    yield 'truncated string array', body(field('s', 0x8a, strings[:-1]))
+    yield 'empty arrays', body(field('o', 0x8c, b'\x00'), field('s', 0x8a, b'\x00'), field('q', 0x85, b'\x00'))
+    yield 'nested', body(field('o', 0x0c, pack_var_int(1) + field('p', 0x8c, pack_var_int(2) + b'\x00' * 2)))
+    for size in (0, 63, 64, 16383, 16384, 70000):
+        yield 'string %d' % size, body(field('s', 10, pack_var_int(size) + b'x' * size))
+    yield 'unknown type', body(field('x', 14, b'\x00'), field('y', 5, b'\x00' * 8))
+    yield 'truncated array of arrays', body(field('x', 0x8d, b'\x04'))
+    yield 'arrays of arrays', body(field('x', 0x8d, pack_var_int(3) + b'\x85' + pack_var_int(1) + b'\x00' * 8
+                                         + b'\x8a' + pack_var_int(1) + b'\x04ab'
+                                         + b'\x8d' + pack_var_int(1) + b'\x8c' + pack_var_int(1) + b'\x00'))
+    yield 'non-ascii name', body(field('n', 5, b'\x00' * 8).replace(b'n', b'\xff', 1))
+    yield 'bad signature', b'\x00' * 9 + b'\x00'
+    yield 'empty', _SIGNATURE + b'\x00'
+
+    rnd = random.Random(seed)
+    base = [CASES[name][2]() for name in ('handshake_10', 'stat_info')]
+    for i in range(corruptions):
+        data = bytearray(rnd.choice(base))
+        for _ in range(rnd.randint(1, 4)):
+            if len(data) <= 9:
+                break
+            position = rnd.randrange(9, len(data))
+            if rnd.random() < 0.3:
+                del data[position:]
+            else:
+                data[position] = rnd.randrange(256)
+        yield 'corrupted %d' % i, bytes(data)
+
+
+def sections():
+    """(name, section) for encoding only: values the decoder never produces"""
+    s = Section()
+    s.add('native', 5)
+    s.types = {'native': 6}
+    yield 'native int with type', s
+
+    s = Section()
+    s.add('native', 5)
+    yield 'native int without type', s
+
+    s = Section()
+    s.add('b', True)
+    s.add('f', 2.25)
+    s.add('str', 'text')
+    s.add('tuple', (c_uint32(1), c_uint32(2)))
+    s.add('bools', [True, False, c_bool(True)])
+    s.add('doubles', [1, 2.5, c_double(3)])
+    s.add('empty', [])
+    s.add('strings', [b'a', bytearray(b'b'), memoryview(b'c'), c_string(b'd'), 'e'])
+    s.add('array', array('H', [1, 2, 3]))
+    s.add('string_array', StringArray.from_list([b'x', b'yz']))
+    yield 'mixed values', s
+
+    s = Section()
+    s.add('raw', c_uint64(b'AAAAAAAA'))
+    yield 'ctype with bytes value', s
+
+    s = Section()
+    big = c_uint32(0)
+    big.value = 2 ** 32
+    s.add('big', big)
+    yield 'out of range scalar', s
+
+    s = Section()
+    s.add('big', [c_uint16(1), 70000])
+    s.types = {'big': 0x87}
+    yield 'out of range array', s
+
+    s = Section()
+    s.add('wrong', [c_uint64(1), b'x'])
+    yield 'mixed list', s
+
+    s = Section()
+    s.add('name' * 70, c_ubyte(1))
+    yield 'long name', s
+
+    s = Section()
+    s.add('memoryview', memoryview(array('I', [1, 2])))
+    yield 'wide memoryview', s
+
+
+def stricter(fast: tuple, slow: tuple) -> bool:
+    """the same result, or a failure of the C decoder wherever the Python one fails"""
+    return fast[0] == 'error' if slow[0] == 'error' else fast[0] == 'error' or fast == slow
+
+
+def main():
+    if levin.reader._speedups is None:
+        print("levin._speedups is not built; run `python setup.py build_ext --inplace` first")
+        sys.exit(1)
+
+    speedups = levin.reader._speedups
+    counted = Fallbacks(speedups)
+    levin.reader._speedups = levin.writer._speedups = levin.schema._speedups = counted
+    try:
+        failures, checked, rejected = compare()
+    finally:
+        levin.reader._speedups = levin.writer._speedups = levin.schema._speedups = speedups
+
+    for i in [0, 1, 63, 64, 16383, 16384, 2 ** 30 - 1, 2 ** 30, 2 ** 62 - 1]:
+        checked += 1
+        packed = pack_var_int(i)
+        if speedups.pack_var_int(i) != packed or speedups.read_var_int(packed, 0) != (i, len(packed)):
+            failures += 1
+            print("varint mismatch: %d" % i)
+
+    print("%d checks, %d mismatches; %d of %d C codec calls left to Python as unsupported; "
+          "%d typed decodes rejected by C only" % (checked, failures, counted.unsupported, counted.calls, rejected))
+    sys.exit(1 if failures else 0)
+
+
+def compare() -> tuple:
+    failures = checked = rejected = 0
+    for name, payload in payloads():
+        for options in ({}, {'native': True}, {'views': True}, {'columnar': True}, {'columnar': True, 'native': True}):
+            fast, slow = both(lambda: describe(LevinReader(payload, **options).read_payload()))
+            checked += 1
+            if not same(fast, slow):
+                failures += 1
+                print("decode mismatch: %s %r\n  C:      %.200r\n  Python: %.200r" % (name, options, fast, slow))
+                continue
+            if fast[0] == 'ok':
+                section = LevinReader(payload, **options).read_payload()
+                fast, slow = both(lambda: LevinWriter().write_payload(section).getvalue())
+                checked += 1
+                if not same(fast, slow):
+                    failures += 1
+                    print("encode mismatch: %s %r" % (name, options))
+
+        if not isinstance(payload, bytes):
+            continue
+        for cls in (HandshakeResponse, TimedSyncResponse, NewTransactions, ResponseGetObjects):
+            for options in ({}, {'columnar': True}):
+                fast, slow = both(lambda: describe(cls.decode(payload, **options)))
+                checked += 1
+                rejected += fast[0] == 'error' and slow[0] == 'ok'
+                if not stricter(fast, slow):
+                    failures += 1
+                    print("schema mismatch: %s %s %r\n  C:      %.200r\n  Python: %.200r"
+                          % (name, cls.__name__, options, fast, slow))
+
+    for name, section in sections():
+        fast, slow = both(lambda: LevinWriter().write_payload(section).getvalue())
+        checked += 1
+        if not same(fast, slow):
+            failures += 1
+            print("encode mismatch: %s\n  C:      %.200r\n  Python: %.200r" % (name, fast, slow))
+    return failures, checked, rejected
+
+
+if __name__ == '__main__':
+    main()
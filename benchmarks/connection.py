@@ -0,0 +1,183 @@
+"""
+Behaviour check of LevinConnection against a scripted stand-in node:
+request/response matching (concurrent requests of one command included),
+timeouts, incoming requests answered by handlers, a peer that hangs up or
+sends garbage, and close() with requests outstanding. Also times ping
+round trips.
+
+    python -m benchmarks.connection [pings]
+"""
+import asyncio
+import sys
+import time
+
+from levin.aio import LevinConnection
+from levin.bucket import Bucket
+from levin.framing import LevinFrameDecoder
+from levin.section import Section
+from levin.constants import *
+from levin.ctypes import *
+
+
+class StandIn:
+    """
+    A node that answers handshakes and pings, never answers timed_syncs,
+    and can be told to send a request of its own, send garbage or hang up.
+    """
+    def __init__(self):
+        self.server = None
+        self.port = None
+        self.writers = []
+        self.responses = []
+        self.tasks = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def _serve(self, reader, writer):
+        self.tasks.add(asyncio.current_task())
+        self.writers.append(writer)
+        decoder = LevinFrameDecoder()
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            for bucket in decoder.feed(data):
+                if bucket.is_response:
+                    self.responses.append(bucket)
+                elif bucket.command.value == P2P_COMMAND_HANDSHAKE.value:
+                    self._send(writer, Bucket.create_response(
+                        P2P_COMMAND_HANDSHAKE.value, section=Section.handshake_response([('1.2.3.4', 18080)])))
+                elif bucket.command.value == P2P_COMMAND_PING.value:
+                    self._send(writer, Bucket.create_response(
+                        P2P_COMMAND_PING.value, section=Section.ping_response(1)))
+        writer.close()
+
+    @staticmethod
+    def _send(writer, bucket: Bucket):
+        writer.writelines(bucket.buffers())
+
+    def request(self, command: int):
+        """sends a request to every connected client"""
+        for writer in self.writers:
+            self._send(writer, Bucket.create_request(int(command)))
+
+    def garbage(self):
+        for writer in self.writers:
+            writer.write(b'\x00' * 64)
+
+    def hang_up(self):
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+    async def close(self):
+        self.hang_up()
+        self.server.close()
+        await self.server.wait_closed()
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+
+
+async def _fails(awaitable, error) -> str:
+    try:
+        await awaitable
+    except error as e:
+        return '%s: %s' % (type(e).__name__, e)
+    raise AssertionError("no %s" % error.__name__)
+
+
+async def check(node: StandIn):
+    port = node.port
+
+    # responses are matched to requests of the same command, in order
+    conn = await LevinConnection.connect('127.0.0.1', port)
+    handshake = await conn.request(P2P_COMMAND_HANDSHAKE, Section.handshake_request(), timeout=5)
+    assert handshake.get_peers()[0]['ip'].ip == '1.2.3.4', handshake
+    pings = await asyncio.gather(*(conn.request(P2P_COMMAND_PING, timeout=5) for _ in range(20)))
+    assert all(b.command.value == P2P_COMMAND_PING.value and b.is_response for b in pings)
+    print("request/response: handshake and 20 concurrent pings answered")
+
+    # an unanswered request times out and leaves nothing behind
+    print("timeout:", await _fails(conn.request(P2P_COMMAND_TIMED_SYNC, timeout=0.1), asyncio.TimeoutError))
+    assert not conn._pending.get(P2P_COMMAND_TIMED_SYNC.value)
+    await conn.request(P2P_COMMAND_PING, timeout=5)
+
+    # a cancelled request is withdrawn as well
+    task = asyncio.ensure_future(conn.request(P2P_COMMAND_TIMED_SYNC))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.wait((task,))
+    assert task.cancelled() and not conn._pending.get(P2P_COMMAND_TIMED_SYNC.value)
+
+    # incoming requests go to the handlers; support_flags is answered by default
+    conn.add_handler(P2P_COMMAND_TIMED_SYNC, lambda bucket: Section.timed_sync_response())
+    node.request(P2P_COMMAND_REQUEST_SUPPORT_FLAGS)
+    node.request(P2P_COMMAND_TIMED_SYNC)
+    node.request(P2P_COMMAND_REQUEST_STAT_INFO)
+    for _ in range(100):
+        if len(node.responses) == 3:
+            break
+        await asyncio.sleep(0.01)
+    codes = sorted((b.command.value, b.return_code.value) for b in node.responses)
+    assert codes == sorted([(P2P_COMMAND_TIMED_SYNC.value, 0), (P2P_COMMAND_REQUEST_SUPPORT_FLAGS.value, 0),
+                            (P2P_COMMAND_REQUEST_STAT_INFO.value, LEVIN_ERROR_CONNECTION_HANDLER_NOT_DEFINED)]), codes
+    print("incoming requests: answered by handlers, unknown ones refused")
+
+    # close() fails what is outstanding, stops the read loop and is idempotent
+    pending = asyncio.ensure_future(conn.request(P2P_COMMAND_TIMED_SYNC))
+    await asyncio.sleep(0.05)
+    await conn.close()
+    print("close:", await _fails(pending, ConnectionError))
+    # the read loop ends cancelled, not as if it had returned
+    assert conn.closed and conn._read_task.cancelled() and not conn._pending
+    await conn.close()
+    print("send after close:", await _fails(conn.request(P2P_COMMAND_PING), ConnectionError))
+
+    # cancelling the caller of close() is not swallowed
+    conn = await LevinConnection.connect('127.0.0.1', port)
+    task = asyncio.ensure_future(conn.close())
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.wait((task,))
+    assert task.cancelled()
+    await conn.close()
+
+    # the peer hanging up or sending garbage fails outstanding requests
+    for name, act in (('hang up', node.hang_up), ('garbage', node.garbage)):
+        conn = await LevinConnection.connect('127.0.0.1', port)
+        await conn.request(P2P_COMMAND_PING, timeout=5)
+        pending = asyncio.ensure_future(conn.request(P2P_COMMAND_TIMED_SYNC))
+        await asyncio.sleep(0.05)
+        act()
+        print("%s:" % name, await _fails(pending, (ConnectionError, IOError)))
+        await asyncio.wait_for(conn.wait_closed(), 5)
+        await conn.close()
+
+
+async def pings(node: StandIn, n: int) -> float:
+    async with await LevinConnection.connect('127.0.0.1', node.port) as conn:
+        await conn.request(P2P_COMMAND_PING)
+        started = time.perf_counter()
+        for _ in range(n):
+            await conn.request(P2P_COMMAND_PING)
+        return (time.perf_counter() - started) / n
+
+
+async def run(n: int):
+    node = await StandIn().start()
+    try:
+        await check(node)
+        print("ping round trip: %.1f us" % (await pings(node, n) * 1e6))
+    finally:
+        await node.close()
+
+
+def main(n: int = 2000):
+    asyncio.run(run(n))
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,126 @@
+"""
+Realistic payloads for the benchmarks, generated with LevinWriter.
+"""
+import random
+import socket
+import struct
+from time import time
+
+from levin.section import Section
+from levin.constants import *
+from levin.ctypes import *
+
+
+def _peer(rnd: random.Random, ip: str = None, port: int = 18080):
+    addr = Section()
+    m_ip = struct.unpack('<I', socket.inet_aton(ip))[0] if ip else rnd.getrandbits(32)
+    addr.add("m_ip", c_uint32(m_ip))
+    addr.add("m_port", c_uint16(port))
+
+    adr = Section()
+    adr.add("addr", addr)
+    adr.add("type", c_ubyte(1))
+
+    peer = Section()
+    peer.add("adr", adr)
+    peer.add("id", c_uint64(rnd.getrandbits(64)))
+    peer.add("last_seen", c_int64(int(time()) - rnd.randint(0, 86400)))
+    peer.add("pruning_seed", c_uint32(0))
+    peer.add("rpc_port", c_uint16(0))
+    peer.add("rpc_credits_per_hash", c_uint32(0))
+    return peer
+
+
+def handshake_response(peers: int = 250, seed: int = 0, addresses: list = None) -> bytes:
+    """
+    COMMAND_HANDSHAKE response body carrying `peers` random IPv4 peerlist
+    entries, or one entry per (ip, port) in `addresses`.
+    """
+    rnd = random.Random(seed)
+    section = Section.handshake_request(my_port=18080, peer_id=rnd.getrandbits(64))
+    section.entries["node_data"].add("rpc_port", c_uint16(18089))
+    section.entries["node_data"].add("support_flags", c_uint32(P2P_SUPPORT_FLAGS.value))
+
+    if addresses is not None:
+        entries = [_peer(rnd, *address) for address in addresses]
+    else:
+        entries = [_peer(rnd) for _ in range(peers)]
+    section.add("local_peerlist_new", entries)
+    return bytes(section)
+
+
+def chain_entry(blocks: int = 10000, seed: int = 0) -> bytes:
+    """NOTIFY_RESPONSE_CHAIN_ENTRY-like body: a uint64 array plus a hash array"""
+    from array import array
+    from levin.section import StringArray
+    rnd = random.Random(seed)
+    section = Section()
+    section.add("start_height", c_uint64(3000000))
+    section.add("total_height", c_uint64(3000000 + blocks))
+    section.add("m_block_weights", array('Q', (rnd.getrandbits(20) for _ in range(blocks))))
+    section.add("m_block_ids", StringArray.from_list([rnd.getrandbits(256).to_bytes(32, 'little')
+                                                      for _ in range(blocks)]))
+    return bytes(section)
+
+
+def timed_sync_response(peers: int = 250, seed: int = 0) -> bytes:
+    """COMMAND_TIMED_SYNC response body with `peers` random IPv4 peerlist entries"""
+    rnd = random.Random(seed)
+    return bytes(Section.timed_sync_response([_peer(rnd) for _ in range(peers)]))
+
+
+def stat_info_response(seed: int = 0) -> bytes:
+    """COMMAND_REQUEST_STAT_INFO response body"""
+    rnd = random.Random(seed)
+    payload_info = Section()
+    payload_info.add("tx_pool_size", c_uint64(rnd.randint(0, 5000)))
+    payload_info.add("blockchain_height", c_uint64(3000000))
+    payload_info.add("mining_speed", c_uint64(0))
+    payload_info.add("alternative_blocks", c_uint64(rnd.randint(0, 10)))
+    payload_info.add("top_block_id_str", c_string(rnd.getrandbits(256).to_bytes(32, 'little').hex().encode()))
+
+    section = Section()
+    section.add("version", c_string(b"0.18.3.1-release"))
+    section.add("os_version", c_string(b"Linux 6.1.0"))
+    section.add("connections_count", c_uint64(rnd.randint(0, 100)))
+    section.add("incoming_connections_count", c_uint64(rnd.randint(0, 100)))
+    section.add("payload_info", payload_info)
+    return bytes(section)
+
+
+def new_transactions(txs: int = 1000, size: int = 2000, seed: int = 0) -> bytes:
+    """NOTIFY_NEW_TRANSACTIONS body with `txs` random blobs of `size` bytes"""
+    from levin.section import StringArray
+    rnd = random.Random(seed)
+    section = Section()
+    section.add("txs", StringArray.from_list([rnd.getrandbits(8 * size).to_bytes(size, 'little')
+                                             for _ in range(txs)]))
+    section.add("_", c_string(b""))
+    section.add("dandelionpp_fluff", c_bool(True))
+    return bytes(section)
+
+
+def response_chain_entry(blocks: int = 10000, seed: int = 0) -> bytes:
+    """NOTIFY_RESPONSE_CHAIN_ENTRY body as monerod sends it, ids and weights as POD blobs"""
+    rnd = random.Random(seed)
+    section = Section()
+    section.add("start_height", c_uint64(3000000))
+    section.add("total_height", c_uint64(3000000 + blocks))
+    section.add("cumulative_difficulty", c_uint64(rnd.getrandbits(63)))
+    section.add("cumulative_difficulty_top64", c_uint64(0))
+    section.add("m_block_ids", c_string(rnd.getrandbits(256 * blocks).to_bytes(32 * blocks, 'little')))
+    section.add("m_block_weights", c_string(b''.join(struct.pack('<Q', rnd.getrandbits(20)) for _ in range(blocks))))
+    section.add("first_block", c_string(rnd.getrandbits(8 * 300).to_bytes(300, 'little')))
+    return bytes(section)
+
+
+# name -> (command, is_response, payload); the payloads of the benchmark suite
+CASES = {
+    'handshake_10': (P2P_COMMAND_HANDSHAKE.value, True, lambda: handshake_response(peers=10)),
+    'handshake_250': (P2P_COMMAND_HANDSHAKE.value, True, lambda: handshake_response(peers=250)),
+    'handshake_5000': (P2P_COMMAND_HANDSHAKE.value, True, lambda: handshake_response(peers=5000)),
+    'timed_sync_250': (P2P_COMMAND_TIMED_SYNC.value, True, lambda: timed_sync_response(peers=250)),
+    'stat_info': (P2P_COMMAND_REQUEST_STAT_INFO.value, True, stat_info_response),
+    'new_transactions_1000': (NOTIFY_NEW_TRANSACTIONS.value, False, new_transactions),
+    'chain_entry_10000': (NOTIFY_RESPONSE_CHAIN_ENTRY.value, False, response_chain_entry),
+}
@@ -0,0 +1,128 @@
+"""
+A simulated network of fake nodes on 127.0.0.1. Every node answers a
+handshake (and timed_sync) with a fixed peer list of `degree` other fake nodes.
+"""
+import asyncio
+import multiprocessing
+import random
+
+from levin.aio import LevinConnection
+from levin.constants import *
+from benchmarks.corpus import handshake_response
+
+
+class FakeNetwork:
+    def __init__(self, nodes: int = 100, degree: int = 16, seed: int = 0, host: str = '127.0.0.1'):
+        self.size = nodes
+        self.degree = degree
+        self.seed = seed
+        self.host = host
+        self.servers = []
+        self.addresses = []
+        self.connections = 0
+        self._payloads = []
+
+    async def start(self, addresses: list = None):
+        await self.bind()
+        self.build_peerlists(addresses or self.addresses)
+        return self
+
+    async def bind(self):
+        for i in range(self.size):
+            payload = {}
+            server = await asyncio.start_server(self._serve(payload), self.host, 0)
+            self.servers.append(server)
+            self.addresses.append((self.host, server.sockets[0].getsockname()[1]))
+            self._payloads.append(payload)
+        return self.addresses
+
+    def build_peerlists(self, addresses: list):
+        """every node advertises `degree` random entries of `addresses`"""
+        rnd = random.Random(self.seed)
+        for i, payload in enumerate(self._payloads):
+            peers = rnd.sample(addresses, min(self.degree, len(addresses)))
+            payload['handshake'] = handshake_response(addresses=peers, seed=i)
+
+    def _serve(self, payload: dict):
+        async def serve(reader, writer):
+            self.connections += 1
+            conn = LevinConnection(reader, writer)
+            conn.add_handler(P2P_COMMAND_HANDSHAKE, lambda bucket: payload['handshake'])
+            conn.add_handler(P2P_COMMAND_TIMED_SYNC, lambda bucket: payload['handshake'])
+            await conn.wait_closed()
+        return serve
+
+    @property
+    def seeds(self) -> list:
+        return self.addresses[:1]
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+        await asyncio.gather(*(server.wait_closed() for server in self.servers))
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def _serve_process(nodes: int, degree: int, seed: int, conn):
+    async def main():
+        network = FakeNetwork(nodes=nodes, degree=degree, seed=seed)
+        conn.send(await network.bind())
+        addresses = await asyncio.get_event_loop().run_in_executor(None, conn.recv)
+        network.build_peerlists(addresses)
+        conn.send(True)
+        await asyncio.get_event_loop().run_in_executor(None, conn.recv)
+        await network.close()
+    asyncio.run(main())
+
+
+class FakeNetworkProcesses:
+    """
+    A FakeNetwork spread over `processes` processes, so serving the fake
+    nodes does not compete with the crawler for one core.
+
+        with FakeNetworkProcesses(nodes=2000, processes=4) as network:
+            crawl(network.seeds)
+    """
+    def __init__(self, nodes: int = 1000, degree: int = 16, processes: int = 2):
+        self.nodes = nodes
+        self.degree = degree
+        self.processes = processes
+        self.addresses = []
+        self._workers = []
+
+    def start(self):
+        per_process = -(-self.nodes // self.processes)
+        for i in range(self.processes):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_process, args=(per_process, self.degree, i, child),
+                                              daemon=True)
+            process.start()
+            self._workers.append((process, parent))
+        for process, conn in self._workers:
+            self.addresses.extend(conn.recv())
+        for process, conn in self._workers:
+            conn.send(self.addresses)
+        for process, conn in self._workers:
+            conn.recv()
+        return self
+
+    @property
+    def seeds(self) -> list:
+        return self.addresses[:1]
+
+    def close(self):
+        for process, conn in self._workers:
+            conn.send(None)
+        for process, conn in self._workers:
+            process.join(5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,239 @@
+"""
+Hostile payloads and seeded mutations against the decoder limits. Every
+payload is decoded in each reader mode (and as a typed message) with the C
+extension, if built, and with the pure Python decoder, under tracemalloc;
+the run fails if a decode raises anything but a decode error or if its
+peak allocation is not bounded by the payload size and `DecoderLimits`.
+
+    python -m benchmarks.fuzz_limits [mutations] [seed]
+"""
+import random
+import struct
+import sys
+import time
+import tracemalloc
+
+import levin.reader
+import levin.schema
+import levin.writer
+from levin.reader import LevinReader, DecoderLimits
+from levin.schema import decode_message
+from levin.section import Section, LazyArray
+from levin.writer import pack_var_int
+from levin.exceptions import BadPortableStorageSignature
+from benchmarks.corpus import CASES
+
+_SIGNATURE = struct.pack('<IIB', 0x01011101, 0x01020101, 1)
+
+LIMITS = DecoderLimits(max_objects=2000, max_depth=64, max_array_length=1000000, max_string_length=1 << 20)
+
+# peak allocation allowed per payload byte (a c_ubyte wrapper per uint8 is
+# the worst case) and per decoded section
+PER_BYTE = 128
+PER_OBJECT = 1024
+SLACK = 256 * 1024
+
+MODES = (
+    ('plain', {}),
+    ('native', {'native': True}),
+    ('lazy', {'lazy': True}),
+    ('columnar', {'columnar': True}),
+    ('views', {'views': True}),
+)
+
+# a truncated or nonsensical payload may fail with these, nothing else
+EXPECTED = (IOError, BadPortableStorageSignature, UnicodeDecodeError)
+
+
+def body(*fields) -> bytes:
+    return _SIGNATURE + pack_var_int(len(fields)) + b''.join(fields)
+
+
+def field(name: str, _type: int, value: bytes) -> bytes:
+    return bytes([len(name)]) + name.encode() + bytes([_type]) + value
+
+
+def count(n: int) -> bytes:
+    """a varint claiming `n`, 8 bytes wide for anything pack_var_int can't encode"""
+    if n < 2 ** 62:
+        return pack_var_int(n)
+    return struct.pack('<Q', (n << 2 | 3) & (2 ** 64 - 1))
+
+
+def nested(depth: int) -> bytes:
+    """`depth` sections, each the only field of the one before"""
+    return _SIGNATURE + (pack_var_int(1) + field('o', 0x0c, b'')) * depth + b'\x00'
+
+
+def nested_arrays(depth: int) -> bytes:
+    """`depth` sections, each the only element of an array in the one before"""
+    return _SIGNATURE + (pack_var_int(1) + field('a', 0x8c, pack_var_int(1))) * depth + b'\x00'
+
+
+def arrays_of_arrays(depth: int) -> bytes:
+    """an empty array of uint8s, the only element of `depth` arrays of arrays"""
+    return body(field('a', 0x8d, count(1) + (bytes([0x8d]) + count(1)) * (depth - 1) + bytes([0x88]) + count(0)))
+
+
+def hostile():
+    """(name, payload) built to make a naive decoder allocate, recurse or spin"""
+    huge = 2 ** 62 - 1
+    for t, name in ((5, 'uint64'), (8, 'uint8'), (10, 'string'), (12, 'object'), (0x0d, 'unknown')):
+        yield 'array of %s claiming 2^62' % name, body(field('a', t | 0x80, count(huge)))
+        yield 'array of %s claiming 2^30' % name, body(field('a', t | 0x80, count(2 ** 30)) + b'\x00' * 64)
+    yield 'type 13 array claiming 2^62', body(field('a', 13, bytes([0x8c]) + count(huge)))
+    yield 'string claiming 2^62', body(field('s', 10, count(huge)))
+    yield 'string claiming 2GB', body(field('s', 10, count(2000000000)) + b'x' * 64)
+    yield 'string over max_string_length', body(field('s', 10, count(LIMITS.max_string_length + 1))
+                                                + b'x' * (LIMITS.max_string_length + 1))
+    yield 'section claiming 2^62 fields', _SIGNATURE + count(huge)
+    yield 'nested section claiming 2^62 fields', body(field('o', 0x0c, count(huge)))
+    yield 'nesting 64', nested(63)
+    yield 'nesting 65', nested(64)
+    yield 'nesting 100000', nested(100000)
+    yield 'nested arrays 100000', nested_arrays(100000)
+    yield 'arrays of arrays 100000', arrays_of_arrays(100000)
+    yield 'array of 2^30 arrays', body(field('a', 0x8d, count(2 ** 30) + b'\x88\x00' * 64))
+    yield '10000 empty objects', body(field('a', 0x8c, count(10000) + b'\x00' * 10000))
+    yield '100000 tiny strings', body(field('a', 0x8a, count(100000) + b'\x04x' * 100000))
+    yield '500000 uint8s', body(field('a', 0x88, count(500000) + b'\x00' * 500000))
+    yield 'uint8s over max_array_length', body(field('a', 0x88, count(1 << 20) + b'\x00' * (1 << 20)))
+    yield 'many fields', _SIGNATURE + count(50000) + field('x', 8, b'\x00') * 50000
+
+
+def strict():
+    """(name, payload) every decoder must reject, however it reads them"""
+    for t in (0, 14, 0x7f):
+        yield 'unknown type %d' % t, body(field('x', t, b'\x00' * 8))
+        yield 'unknown type %d after a known one' % t, body(field('y', 5, b'\x00' * 8), field('x', t, b'\x00'))
+        yield 'array of unknown type %d' % t, body(field('a', t | 0x80, count(2) + b'\x00' * 16))
+        yield 'empty array of unknown type %d' % t, body(field('a', t | 0x80, count(0)))
+        yield 'type 13 array of unknown type %d' % t, body(field('a', 13, bytes([t | 0x80]) + count(1) + b'\x00'))
+    yield 'array of unflagged arrays', body(field('a', 0x8d, count(2) + b'\x00' * 4))
+    yield 'array of arrays of unknown type', body(field('a', 0x8d, count(1) + bytes([0x8e]) + count(1) + b'\x00'))
+    yield 'unknown type in a nested section', body(field('o', 0x0c, count(1) + field('x', 14, b'\x00')))
+    yield 'unknown type in an array of sections', body(field('a', 0x8c, count(1) + count(1) + field('x', 0, b'')))
+
+
+def deep():
+    """nesting far past the default depth limit, decoded with the limits raised"""
+    yield 'nesting 100000, unlimited', nested(100000)
+    yield 'nested arrays 100000, unlimited', nested_arrays(100000)
+    yield 'arrays of arrays 100000, unlimited', arrays_of_arrays(100000)
+
+
+def mutations(n: int, seed: int):
+    """(name, payload) of seeded corruptions of the corpus, biased towards oversized counts"""
+    rnd = random.Random(seed)
+    base = [build() for name, (_, _, build) in CASES.items() if not name.endswith(('1000', '5000', '10000'))]
+    claims = [count(c) for c in (2 ** 62 - 1, 2 ** 30 - 1, 2 ** 30, 16384, 64)]
+
+    for i in range(n):
+        data = bytearray(rnd.choice(base))
+        for _ in range(rnd.randint(1, 4)):
+            if len(data) <= 9:
+                # truncated down to the storage header
+                break
+            position = rnd.randrange(9, len(data))
+            r = rnd.random()
+            if r < 0.2:
+                del data[position:]
+            elif r < 0.5:
+                data[position:position + rnd.randint(1, 8)] = rnd.choice(claims)
+            elif r < 0.7:
+                # splice a chunk of itself in, e.g. a section into its own field
+                start = rnd.randrange(9, len(data))
+                data[position:position] = data[start:start + rnd.randint(1, 200)]
+            else:
+                data[position] = rnd.randrange(256)
+        yield 'mutation %d' % i, bytes(data)
+
+
+def decoders(payload: bytes, limits: DecoderLimits, lazy: bool = True):
+    for mode, options in MODES:
+        if options.get('lazy') and not lazy:
+            continue
+        yield mode, lambda: walk(LevinReader(payload, limits=limits, **options).read_payload())
+    yield 'schema', lambda: decode_message(1001, payload, True, limits=limits)
+
+
+def walk(value):
+    """touches every value, so lazy sections are decoded too"""
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, Section):
+            pending.extend(value.entries[k] for k in list(value.entries))
+        elif isinstance(value, (list, LazyArray)):
+            pending.extend(value)
+
+
+def measure(fn) -> tuple:
+    tracemalloc.start()
+    try:
+        try:
+            fn()
+            result = 'ok'
+        except EXPECTED as e:
+            result = type(e).__name__
+        except Exception as e:
+            result = 'UNEXPECTED %s: %s' % (type(e).__name__, e)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(payloads, limits: DecoderLimits, backends: list, verbose: bool, lazy: bool = True,
+        reject: bool = False) -> tuple:
+    """decodes each payload every way; with `reject` any decode that succeeds is a failure too"""
+    failures = checked = 0
+    worst = 0.0
+    for name, payload in payloads:
+        bound = PER_BYTE * len(payload) + PER_OBJECT * limits.max_objects + SLACK
+        for backend, speedups in backends:
+            levin.reader._speedups = levin.writer._speedups = levin.schema._speedups = speedups
+            for mode, fn in decoders(payload, limits, lazy):
+                result, peak = measure(fn)
+                checked += 1
+                worst = max(worst, peak / bound)
+                bad = result.startswith('UNEXPECTED') or peak > bound or (reject and result == 'ok')
+                if bad:
+                    failures += 1
+                if bad or verbose:
+                    print("  %-40s %-6s %-8s %-22.60s peak %9d bound %9d"
+                          % (name, backend, mode, result, peak, bound))
+    return checked, failures, worst
+
+
+def main(n: int = 1000, seed: int = 0):
+    speedups = levin.reader._speedups
+    backends = [('python', None)]
+    if speedups is not None:
+        backends.insert(0, ('c', speedups))
+
+    try:
+        print("hostile payloads, %r" % LIMITS)
+        started = time.perf_counter()
+        checked, failures, worst = run(hostile(), LIMITS, backends, verbose=True)
+        print("unsupported types")
+        c, f, w = run(strict(), LIMITS, backends, verbose=False, reject=True)
+        checked, failures, worst = checked + c, failures + f, max(worst, w)
+        # the decoder keeps its own stack, so this works with the default recursion limit;
+        # not lazily, each lazy level skims everything below it again
+        unlimited = DecoderLimits(max_objects=10 ** 6, max_depth=10 ** 6)
+        print("deep nesting, %r" % unlimited)
+        c, f, w = run(deep(), unlimited, backends, verbose=True, lazy=False)
+        checked, failures, worst = checked + c, failures + f, max(worst, w)
+        print("%d mutations (seed %d)" % (n, seed))
+        c, f, w = run(mutations(n, seed), LIMITS, backends, verbose=False)
+        checked, failures, worst = checked + c, failures + f, max(worst, w)
+    finally:
+        levin.reader._speedups = levin.writer._speedups = levin.schema._speedups = speedups
+
+    print("%d decodes in %.1fs, %d failures, worst peak at %.0f%% of its bound"
+          % (checked, time.perf_counter() - started, failures, worst * 100))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,76 @@
+"""
+A simulated gossip network for the propagation monitor. Every node is a
+`LevinServer` on 127.0.0.1; relaying between nodes is simulated in-process:
+a node that learns an object hands it to each of its `degree` neighbours
+after a random link delay, and pushes it to its connected clients (the
+monitor) as a NOTIFY_NEW_TRANSACTIONS or NOTIFY_NEW_FLUFFY_BLOCK.
+
+The true arrival time of every object at every node is kept in `arrivals`.
+"""
+import asyncio
+import os
+import random
+import time
+
+from levin.server import LevinServer
+from levin.monitor import blob_id, TX
+from levin.schema import NewTransactions, NewFluffyBlock, BlockCompleteEntry
+from levin.constants import *
+
+
+class GossipNetwork:
+    def __init__(self, nodes: int = 20, degree: int = 4, delay: tuple = (0.005, 0.05), seed: int = 0):
+        self.size = nodes
+        self.degree = degree
+        self.delay = delay
+        self.random = random.Random(seed)
+        self.servers = []
+        self.neighbours = []
+        # object id -> {node index: time.monotonic() it learned the object}
+        self.arrivals = {}
+
+    @property
+    def addresses(self) -> list:
+        return [(server.host, server.port) for server in self.servers]
+
+    async def start(self):
+        for i in range(self.size):
+            self.servers.append(await LevinServer('127.0.0.1', 0, peer_id=i + 1).start())
+        for i in range(self.size):
+            others = [j for j in range(self.size) if j != i]
+            self.neighbours.append(self.random.sample(others, min(self.degree, len(others))))
+        return self
+
+    def inject(self, kind: str = TX, blob: bytes = None, origin: int = None) -> bytes:
+        """Lets `origin` (a random node by default) learn a new object; returns its id"""
+        blob = os.urandom(300 if kind == TX else 2000) if blob is None else blob
+        if kind == TX:
+            payload = NewTransactions(txs=[blob], _=b'', dandelionpp_fluff=True).encode()
+            command = NOTIFY_NEW_TRANSACTIONS
+        else:
+            payload = NewFluffyBlock(b=BlockCompleteEntry(block=blob, txs=[]), current_blockchain_height=1).encode()
+            command = NOTIFY_NEW_FLUFFY_BLOCK
+        _id = blob_id(blob)
+        self.arrivals[_id] = {}
+        origin = self.random.randrange(self.size) if origin is None else origin
+        self._learn(origin, _id, command, payload)
+        return _id
+
+    def _learn(self, node: int, _id: bytes, command, payload: bytes):
+        arrivals = self.arrivals[_id]
+        if node in arrivals:
+            return
+        arrivals[node] = time.monotonic()
+        self.servers[node].broadcast(command, payload=payload)
+        loop = asyncio.get_event_loop()
+        for neighbour in self.neighbours[node]:
+            loop.call_later(self.random.uniform(*self.delay), self._learn, neighbour, _id, command, payload)
+
+    async def close(self):
+        await asyncio.gather(*(server.close() for server in self.servers))
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
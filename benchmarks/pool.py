@@ -0,0 +1,145 @@
+"""
+Behaviour check of SessionPool against local LevinServers: reuse (and one
+shared handshake for concurrent callers), eviction by `max_per_host` and
+`max_sessions`, idle sessions closed, failed health checks dropping their
+session, and close() with handshakes still in flight. Also times requests
+over a pooled session against a new session each time.
+
+    python -m benchmarks.pool [requests]
+"""
+import asyncio
+import sys
+import time
+
+from levin.server import LevinServer
+from levin.session import LevinSession, SessionPool
+from levin.constants import *
+
+
+async def _servers(*hosts: str) -> list:
+    return [await LevinServer(host, 0).start() for host in hosts]
+
+
+async def _fails(awaitable, error) -> str:
+    try:
+        await awaitable
+    except error as e:
+        return '%s: %s' % (type(e).__name__, e)
+    raise AssertionError("no %s" % error.__name__)
+
+
+def _empty(pool: SessionPool):
+    assert not len(pool) and not pool._per_host and not pool._reserved and not pool._opening, (
+        pool._sessions, pool._per_host, pool._reserved, pool._opening)
+
+
+async def check():
+    # the open session is handed out again; concurrent callers share one handshake
+    server, = await _servers('127.0.0.1')
+    async with SessionPool() as pool:
+        sessions = await asyncio.gather(*(pool.session('127.0.0.1', server.port) for _ in range(10)))
+        assert all(s is sessions[0] for s in sessions) and server.stats.handshakes == 1, server.stats
+        await pool.peers('127.0.0.1', server.port)
+        assert pool.stats.opened == 1 and pool.stats.reused == 10, pool.stats
+    print("reuse: 11 lookups, 1 handshake  %r" % pool.stats)
+
+    # a lost session is reopened on the next request
+    async with SessionPool() as pool:
+        first = await pool.session('127.0.0.1', server.port)
+        for conn in list(server.connections):
+            conn.close()
+        await asyncio.wait_for(first.conn.wait_closed(), 5)
+        await pool.request('127.0.0.1', server.port, P2P_COMMAND_PING)
+        assert pool._sessions[('127.0.0.1', server.port)] is not first and pool.stats.opened == 2, pool.stats
+    await server.close()
+    print("lost session: reopened on the next request")
+
+    # max_per_host counts every port of a host; max_sessions every session
+    servers = await _servers('127.0.0.1', '127.0.0.1', '127.0.0.2', '127.0.0.3')
+    async with SessionPool(max_per_host=1, max_sessions=2) as pool:
+        a = await pool.session('127.0.0.1', servers[0].port)
+        b = await pool.session('127.0.0.1', servers[1].port)
+        assert a.closed and list(pool._sessions) == [('127.0.0.1', servers[1].port)], pool._sessions
+        await pool.session('127.0.0.2', servers[2].port)
+        await pool.session('127.0.0.3', servers[3].port)
+        assert b.closed and list(pool._sessions) == [('127.0.0.2', servers[2].port), ('127.0.0.3', servers[3].port)]
+        assert pool.stats.evicted_limit == 2 and pool._reserved == 2, pool.stats
+    _empty(pool)
+    print("eviction: %r" % pool.stats)
+
+    # idle sessions are closed by the maintenance task
+    async with SessionPool(idle_timeout=0.2, health_interval=0) as pool:
+        session = await pool.session('127.0.0.1', servers[0].port)
+        await asyncio.sleep(0.5)
+        assert session.closed and not len(pool) and pool.stats.evicted_idle == 1, pool.stats
+    print("idle: closed after 0.2s  %r" % pool.stats)
+
+    # a node that stops answering pings loses its session; a healthy one keeps it
+    mute, = await _servers('127.0.0.1')
+    mute.handlers[P2P_COMMAND_PING.value] = lambda conn, bucket: asyncio.sleep(3600)
+    async with SessionPool(max_per_host=2, idle_timeout=0, health_interval=0.1, timeout=0.2) as pool:
+        healthy = await pool.session('127.0.0.1', servers[0].port)
+        muted = await pool.session('127.0.0.1', mute.port)
+        await asyncio.sleep(0.8)
+        assert muted.closed and not healthy.closed and list(pool._sessions) == [('127.0.0.1', servers[0].port)]
+        assert pool.stats.health_failed == 1 and pool.stats.health_checks > 1, pool.stats
+    print("health check: %r" % pool.stats)
+
+    # close() cancels handshakes in flight; nothing is counted or inserted after it
+    slow, = await _servers('127.0.0.1')
+    handshake = slow.handlers[P2P_COMMAND_HANDSHAKE.value]
+
+    async def slow_handshake(conn, bucket):
+        await asyncio.sleep(0.3)
+        return handshake(conn, bucket)
+
+    slow.handlers[P2P_COMMAND_HANDSHAKE.value] = slow_handshake
+    pool = SessionPool()
+    callers = [asyncio.ensure_future(pool.session('127.0.0.1', slow.port)) for _ in range(3)]
+    callers.append(asyncio.ensure_future(pool.session('127.0.0.1', servers[0].port)))
+    await asyncio.sleep(0.05)
+    assert pool._reserved == 1 and len(pool._opening) == 2, (pool._reserved, pool._opening)
+    await pool.close()
+    for caller in callers:
+        print("close, handshake in flight:", await _fails(caller, ConnectionError))
+    await asyncio.sleep(0.5)
+    _empty(pool)
+    assert pool.stats.failed == 0 and pool.stats.opened == 0, pool.stats
+    print("session after close:", await _fails(pool.session('127.0.0.1', servers[0].port), ConnectionError))
+
+    for s in servers + [mute, slow]:
+        await s.close()
+
+
+async def timing(n: int) -> tuple:
+    server, = await _servers('127.0.0.1')
+    try:
+        async with SessionPool() as pool:
+            await pool.request('127.0.0.1', server.port, P2P_COMMAND_PING)
+            started = time.perf_counter()
+            for _ in range(n):
+                await pool.request('127.0.0.1', server.port, P2P_COMMAND_PING)
+            pooled = (time.perf_counter() - started) / n
+
+        started = time.perf_counter()
+        for _ in range(n):
+            async with LevinSession('127.0.0.1', server.port) as session:
+                await session.request(P2P_COMMAND_PING)
+        fresh = (time.perf_counter() - started) / n
+    finally:
+        await server.close()
+    return pooled, fresh
+
+
+async def run(n: int):
+    await check()
+    pooled, fresh = await timing(n)
+    print("ping over a pooled session %.1f us, over a new session %.1f us" % (pooled * 1e6, fresh * 1e6))
+
+
+def main(n: int = 500):
+    asyncio.run(run(n))
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
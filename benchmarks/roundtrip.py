@@ -0,0 +1,136 @@
+"""
+Round-trip property check of the portable storage codec: seeded random
+sections of every serialize type, arrays of every type and arrays of arrays
+nested a few levels deep, integers also given as raw value bytes (e.g.
+`c_uint64(b'AAAAAAAA')`), are encoded, decoded in each reader mode with the
+C extension, if built, and with the pure Python codec, and encoded again;
+the bytes must come out identical. Empty arrays are only generated of
+sections, as a plain decode can't tell the element type of an empty array.
+
+    python -m benchmarks.roundtrip [sections] [seed]
+"""
+import random
+import sys
+
+import levin.reader
+import levin.writer
+from levin.reader import LevinReader
+from levin.section import Section
+from levin.writer import LevinWriter
+from levin.ctypes import *
+
+MODES = (
+    ('plain', {}),
+    ('native', {'native': True}),
+    ('lazy', {'lazy': True}),
+    ('columnar', {'columnar': True}),
+    ('views', {'views': True}),
+)
+
+# ctype, random value
+_SCALARS = (
+    (c_int64, lambda rnd: rnd.randrange(-2 ** 63, 2 ** 63)),
+    (c_int32, lambda rnd: rnd.randrange(-2 ** 31, 2 ** 31)),
+    (c_int16, lambda rnd: rnd.randrange(-2 ** 15, 2 ** 15)),
+    (c_byte, lambda rnd: rnd.randrange(-2 ** 7, 2 ** 7)),
+    (c_uint64, lambda rnd: rnd.randrange(2 ** 64)),
+    (c_uint32, lambda rnd: rnd.randrange(2 ** 32)),
+    (c_uint16, lambda rnd: rnd.randrange(2 ** 16)),
+    (c_ubyte, lambda rnd: rnd.randrange(2 ** 8)),
+    (c_double, lambda rnd: rnd.uniform(-1e9, 1e9)),
+    (c_bool, lambda rnd: rnd.random() < 0.5),
+)
+
+
+def scalar(rnd: random.Random, ctype, value):
+    """`ctype(value(rnd))`, one in five integers as raw value bytes instead"""
+    if ctype not in (c_double, c_bool) and rnd.random() < 0.2:
+        return ctype(bytes(rnd.randrange(256) for _ in range(ctype.NBYTES)))
+    return ctype(value(rnd))
+
+
+def string(rnd: random.Random) -> bytes:
+    return bytes(rnd.randrange(256) for _ in range(rnd.choice((0, 1, 7, 64, 300))))
+
+
+def array_of(rnd: random.Random, depth: int) -> list:
+    """a non-empty list of one random element type, or a possibly empty list of sections"""
+    kind = rnd.randrange(len(_SCALARS) + 3 if depth > 0 else len(_SCALARS) + 1)
+    size = rnd.randint(1, 6)
+    if kind < len(_SCALARS):
+        ctype, value = _SCALARS[kind]
+        return [scalar(rnd, ctype, value) for _ in range(size)]
+    if kind == len(_SCALARS):
+        return [string(rnd) for _ in range(size)]
+    if kind == len(_SCALARS) + 1:
+        return [section(rnd, depth - 1) for _ in range(rnd.randint(0, 3))]
+    # an array of arrays, each of its own element type
+    return [array_of(rnd, depth - 1) for _ in range(size)]
+
+
+def section(rnd: random.Random, depth: int = 3) -> Section:
+    s = Section()
+    for i in range(rnd.randint(0, 8)):
+        kind = rnd.randrange(4 if depth > 0 else 2)
+        if kind == 0:
+            ctype, value = rnd.choice(_SCALARS)
+            s.add('f%d' % i, scalar(rnd, ctype, value))
+        elif kind == 1:
+            s.add('f%d' % i, string(rnd))
+        elif kind == 2:
+            s.add('f%d' % i, array_of(rnd, depth))
+        else:
+            s.add('f%d' % i, section(rnd, depth - 1))
+    return s
+
+
+def nests_arrays(value) -> bool:
+    if isinstance(value, Section):
+        return any(nests_arrays(v) for v in value.entries.values())
+    if isinstance(value, list):
+        return any(isinstance(v, list) or nests_arrays(v) for v in value)
+    return False
+
+
+def check(payload: bytes) -> list:
+    """the (codec, mode) combinations that don't re-encode `payload` byte for byte"""
+    failures = []
+    speedups = levin.reader._speedups
+    codecs = (('C', speedups), ('Python', None)) if speedups is not None else (('Python', None),)
+    try:
+        for codec, module in codecs:
+            levin.reader._speedups = levin.writer._speedups = module
+            for mode, options in MODES:
+                try:
+                    decoded = LevinReader(payload, **options).read_payload()
+                    again = LevinWriter().write_payload(decoded).getvalue()
+                except Exception as e:
+                    failures.append((codec, mode, '%s: %s' % (type(e).__name__, e)))
+                    continue
+                if again != payload:
+                    failures.append((codec, mode, 'encoded differently'))
+    finally:
+        levin.reader._speedups = levin.writer._speedups = speedups
+    return failures
+
+
+def main(sections: int = 500, seed: int = 0):
+    rnd = random.Random(seed)
+    failed = nested = 0
+    for i in range(sections):
+        s = section(rnd)
+        payload = LevinWriter().write_payload(s).getvalue()
+        nested += nests_arrays(s)
+        failures = check(payload)
+        if failures:
+            failed += 1
+            print("section %d (%d bytes):" % (i, len(payload)))
+            for codec, mode, problem in failures:
+                print("  %-6s %-8s %s" % (codec, mode, problem))
+    print("%d sections (%d with arrays of arrays) x %d modes, %s: %d failed"
+          % (sections, nested, len(MODES), 'C and Python' if levin.reader._speedups else 'Python', failed))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,153 @@
+"""
+The benchmark suite: decode/encode ops/sec, allocations and peak memory
+for every payload in `corpus.CASES`, framing throughput, and the crawl rate
+against a local fake network. Results are written as JSON so runs on
+different commits can be compared.
+
+    python -m benchmarks.suite -o before.json
+    git checkout ...
+    python -m benchmarks.suite -o after.json --compare before.json
+
+Ops/sec are the best of `--repeat` runs; compare runs on the same machine only.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+from levin.bucket import Bucket
+from levin.framing import LevinFrameDecoder
+from levin.reader import LevinReader
+from levin.writer import LevinWriter
+from levin.schema import CODECS
+from benchmarks.corpus import CASES
+
+# fraction of a second each timing run should take at least
+_MIN_TIME = 0.2
+
+
+def ops_per_sec(fn, repeat: int = 5) -> float:
+    number, _ = timeit.Timer(fn).autorange()
+    number = max(1, int(number * _MIN_TIME / 0.2))
+    return number / min(timeit.repeat(fn, number=number, repeat=repeat))
+
+
+def memory(fn) -> dict:
+    """allocated blocks and bytes still held by the result of `fn()`, and the peak while running it"""
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    retained_blocks = sys.getallocatedblocks() - blocks
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {'allocated_blocks': retained_blocks, 'retained_bytes': current - before, 'peak_bytes': peak - before}
+
+
+def _encode_section(section) -> bytes:
+    return LevinWriter().write_payload(section).getvalue()
+
+
+def codec_benchmarks(repeat: int, only: str = None):
+    for name, (command, response, build) in CASES.items():
+        payload = build()
+        frame = bytes(Bucket.create_response(command, payload=payload).header()) + payload
+        codec = CODECS.get((command, response))
+        section = LevinReader(payload).read_payload()
+
+        cases = [
+            ('decode/%s/section' % name, lambda: LevinReader(payload).read_payload()),
+            ('decode/%s/native' % name, lambda: LevinReader(payload, native=True).read_payload()),
+            ('encode/%s/section' % name, lambda: bytes(section)),
+            ('encode/%s/writer' % name, lambda: _encode_section(section)),
+            ('framing/%s' % name, lambda: LevinFrameDecoder().feed(frame)),
+        ]
+        if codec is not None:
+            message = codec.decode(payload)
+            cases += [
+                ('decode/%s/schema' % name, lambda: codec.decode(payload)),
+                ('encode/%s/schema' % name, lambda: message.encode()),
+            ]
+        for key, fn in cases:
+            if only and only not in key:
+                continue
+            result = {'bytes': len(payload), 'ops_per_sec': ops_per_sec(fn, repeat)}
+            if key.startswith('decode/'):
+                result.update(memory(fn))
+            yield key, result
+
+
+def crawl_benchmark(nodes: int = 300, concurrency: int = 100) -> dict:
+    from levin.crawler import Crawler
+    from benchmarks.fakenet import FakeNetwork
+
+    async def run():
+        async with FakeNetwork(nodes=nodes, degree=32) as network:
+            crawler = Crawler(seeds=network.seeds, concurrency=concurrency, timeout=5.0, retries=0)
+            return await crawler.run()
+
+    stats = asyncio.run(run())
+    return {'nodes': stats.nodes_ok, 'failed': stats.nodes_failed, 'seconds': stats.elapsed,
+            'nodes_per_sec': stats.nodes_per_sec}
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'time': int(time.time()),
+    }
+
+
+def compare(results: dict, baseline: dict):
+    """ratio of the headline number of every benchmark to the baseline's"""
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        metric = 'ops_per_sec' if 'ops_per_sec' in result else 'nodes_per_sec'
+        print("%-44s %12.1f -> %12.1f  %5.2fx" % (key, old[metric], result[metric], result[metric] / old[metric]))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run the benchmark suite')
+    parser.add_argument('-o', '--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--only', help='only benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-crawl', action='store_true', help='skip the crawl benchmark')
+    args = parser.parse_args(args)
+
+    results = {}
+    for key, result in codec_benchmarks(args.repeat, args.only):
+        results[key] = result
+        print("%-44s %12.1f ops/s" % (key, result['ops_per_sec']), flush=True)
+
+    if not args.no_crawl and (not args.only or args.only in 'crawl'):
+        results['crawl'] = crawl_benchmark()
+        print("%-44s %12.1f nodes/s" % ('crawl', results['crawl']['nodes_per_sec']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)['results'])
+
+
+if __name__ == '__main__':
+    main()
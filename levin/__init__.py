@@ -1,4 +1,4 @@
-from levin.reader import LevinReader
+from levin.reader import LevinReader, DecoderLimits
 from levin.writer import LevinWriter
 from levin.section import Section
 from levin.bucket import Bucket
@@ -0,0 +1,1016 @@
+/*
+ * Optional C implementation of the portable storage codec: varints,
+ * sections and arrays. Used by LevinReader.read_section() and
+ * LevinWriter.put_section() when it could be built; anything this module
+ * does not handle raises `Unsupported` and the pure Python code takes over,
+ * so both backends produce the same results. Malformed payloads raise the
+ * same OSError (IOError) as the Python decoder.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+
+#define TYPE_INT64 1
+#define TYPE_INT32 2
+#define TYPE_INT16 3
+#define TYPE_INT8 4
+#define TYPE_UINT64 5
+#define TYPE_UINT32 6
+#define TYPE_UINT16 7
+#define TYPE_UINT8 8
+#define TYPE_DOUBLE 9
+#define TYPE_STRING 10
+#define TYPE_BOOL 11
+#define TYPE_OBJECT 12
+#define TYPE_ARRAY 13
+#define FLAG_ARRAY 0x80
+
+/* sections are decoded recursively here; deeper nesting is left to the
+   iterative Python decoder */
+#define MAX_C_DEPTH 200
+
+static PyObject *Unsupported;
+static PyObject *str_entries;
+static PyObject *str_types;
+static PyObject *str_value;
+
+/* width of fixed-width values by serialize type, 0 for the rest */
+static const int WIDTHS[14] = {0, 8, 4, 2, 1, 8, 4, 2, 1, 8, 0, 1, 0, 0};
+/* array.array typecode of columnar arrays by serialize type, as reader._TYPECODES */
+static const char TYPECODES[14] = {0, 'q', 'i', 'h', 'b', 'Q', 'I', 'H', 'B', 'd', 0, 0, 0, 0};
+
+static int
+width_of(int type)
+{
+    return type > 0 && type < 14 ? WIDTHS[type] : 0;
+}
+
+static uint64_t
+load_le(const unsigned char *p, int n)
+{
+    uint64_t v = 0;
+    for (int i = n - 1; i >= 0; i--)
+        v = (v << 8) | p[i];
+    return v;
+}
+
+static void
+store_le(unsigned char *p, uint64_t v, int n)
+{
+    for (int i = 0; i < n; i++) {
+        p[i] = (unsigned char)(v & 0xff);
+        v >>= 8;
+    }
+}
+
+static PyObject *
+unsupported(const char *what)
+{
+    PyErr_SetString(Unsupported, what);
+    return NULL;
+}
+
+/* decoding */
+
+typedef struct {
+    const unsigned char *data;
+    Py_ssize_t size;
+    Py_ssize_t offset;
+    int native;
+    PyObject *view;         /* memoryview to slice strings from, or NULL for bytes */
+    PyObject *types_cache;  /* LevinReader._types */
+    PyObject *section_cls;
+    PyObject *ctypes;       /* tuple: serialize type -> ctype class or None */
+    PyObject *array_cls;    /* array.array in columnar mode, else NULL */
+    PyObject *string_array_cls;
+    /* DecoderLimits */
+    Py_ssize_t objects, max_objects;
+    Py_ssize_t depth, max_depth;
+    uint64_t max_array, max_string;
+} Reader;
+
+static PyObject *read_section(Reader *r);
+
+static PyObject *
+decode_error(const char *what)
+{
+    PyErr_SetString(PyExc_OSError, what);
+    return NULL;
+}
+
+static PyObject *
+nesting(Reader *r)
+{
+    if (r->depth + 1 > r->max_depth)
+        return decode_error("payload nested too deeply");
+    return unsupported("nesting");
+}
+
+static int
+eof(void)
+{
+    PyErr_SetString(PyExc_OSError, "unexpected end of payload");
+    return -1;
+}
+
+static int
+need(Reader *r, Py_ssize_t n)
+{
+    if (n < 0 || r->offset + n > r->size)
+        return eof();
+    return 0;
+}
+
+static int
+read_var_int(Reader *r, uint64_t *out)
+{
+    /* contrib/epee/include/storages/portable_storage_from_bin.h:read_varint */
+    if (need(r, 1) < 0)
+        return -1;
+    int n = 1 << (r->data[r->offset] & 0x03);
+    if (need(r, n) < 0)
+        return -1;
+    *out = load_le(r->data + r->offset, n) >> 2;
+    r->offset += n;
+    return 0;
+}
+
+static PyObject *
+scalar(Reader *r, int type)
+{
+    int n = WIDTHS[type];
+    if (need(r, n) < 0)
+        return NULL;
+    uint64_t raw = load_le(r->data + r->offset, n);
+    r->offset += n;
+
+    PyObject *value;
+    switch (type) {
+    case TYPE_INT64: value = PyLong_FromLongLong((int64_t)raw); break;
+    case TYPE_INT32: value = PyLong_FromLong((int32_t)raw); break;
+    case TYPE_INT16: value = PyLong_FromLong((int16_t)raw); break;
+    case TYPE_INT8: value = PyLong_FromLong((int8_t)raw); break;
+    case TYPE_DOUBLE: {
+        double d;
+        memcpy(&d, &raw, sizeof(d));
+        value = PyFloat_FromDouble(d);
+        break;
+    }
+    case TYPE_BOOL: value = PyBool_FromLong(raw != 0); break;
+    default: value = PyLong_FromUnsignedLongLong(raw); break;
+    }
+    if (value == NULL || r->native)
+        return value;
+
+    PyObject *ctype = PyTuple_GET_ITEM(r->ctypes, type);
+    PyObject *wrapped = PyObject_CallOneArg(ctype, value);
+    Py_DECREF(value);
+    return wrapped;
+}
+
+static PyObject *
+string(Reader *r)
+{
+    uint64_t count;
+    if (read_var_int(r, &count) < 0)
+        return NULL;
+    if (count > r->max_string)
+        return PyErr_Format(PyExc_OSError, "string too long: %llu bytes", (unsigned long long)count);
+    if (count > (uint64_t)(r->size - r->offset)) {
+        eof();
+        return NULL;
+    }
+    Py_ssize_t start = r->offset;
+    r->offset += (Py_ssize_t)count;
+    if (r->view != NULL)
+        return PySequence_GetSlice(r->view, start, r->offset);
+    return PyBytes_FromStringAndSize((const char *)r->data + start, (Py_ssize_t)count);
+}
+
+static PyObject *
+read_value(Reader *r, int type)
+{
+    if (width_of(type))
+        return scalar(r, type);
+    if (type == TYPE_STRING)
+        return string(r);
+    if (type == TYPE_OBJECT)
+        return read_section(r);
+    return PyErr_Format(PyExc_OSError, "unsupported type: %d", type);
+}
+
+static PyObject *
+column(Reader *r, int type, uint64_t size)
+{
+    /* a run of fixed-width numbers as one array.array */
+    char typecode[2] = {TYPECODES[type], 0};
+    Py_ssize_t n = (Py_ssize_t)size * WIDTHS[type];
+    PyObject *values = PyObject_CallFunction(r->array_cls, "s", typecode);
+    if (values == NULL)
+        return NULL;
+    PyObject *done = PyObject_CallMethod(values, "frombytes", "y#", (const char *)r->data + r->offset, n);
+#if PY_BIG_ENDIAN
+    if (done != NULL) {
+        Py_DECREF(done);
+        done = PyObject_CallMethod(values, "byteswap", NULL);
+    }
+#endif
+    if (done == NULL) {
+        Py_DECREF(values);
+        return NULL;
+    }
+    Py_DECREF(done);
+    r->offset += n;
+    return values;
+}
+
+static PyObject *
+offsets(Reader *r, const uint64_t *values, uint64_t size)
+{
+    PyObject *column = PyObject_CallFunction(r->array_cls, "s", "Q");
+    if (column == NULL)
+        return NULL;
+    PyObject *done = PyObject_CallMethod(column, "frombytes", "y#", (const char *)values,
+                                         (Py_ssize_t)(size * sizeof(uint64_t)));
+    if (done == NULL) {
+        Py_DECREF(column);
+        return NULL;
+    }
+    Py_DECREF(done);
+    return column;
+}
+
+static PyObject *
+string_column(Reader *r, uint64_t size)
+{
+    /* the strings' bytes, varints included, and where each one starts and ends in them */
+    PyObject *data = NULL, *starts = NULL, *ends = NULL, *result = NULL;
+    Py_ssize_t begin = r->offset;
+    uint64_t *bounds = PyMem_Malloc((size_t)(2 * size + 1) * sizeof(uint64_t));
+    if (bounds == NULL)
+        return PyErr_NoMemory();
+
+    for (uint64_t i = 0; i < size; i++) {
+        uint64_t count;
+        if (read_var_int(r, &count) < 0)
+            goto done;
+        if (count > r->max_string) {
+            PyErr_Format(PyExc_OSError, "string too long: %llu bytes", (unsigned long long)count);
+            goto done;
+        }
+        if (count > (uint64_t)(r->size - r->offset)) {
+            eof();
+            goto done;
+        }
+        bounds[i] = (uint64_t)(r->offset - begin);
+        bounds[size + i] = bounds[i] + count;
+        r->offset += (Py_ssize_t)count;
+    }
+
+    data = PyBytes_FromStringAndSize((const char *)r->data + begin, r->offset - begin);
+    if (data != NULL)
+        starts = offsets(r, bounds, size);
+    if (starts != NULL)
+        ends = offsets(r, bounds + size, size);
+    if (ends != NULL)
+        result = PyObject_CallFunctionObjArgs(r->string_array_cls, data, starts, ends, NULL);
+done:
+    PyMem_Free(bounds);
+    Py_XDECREF(data);
+    Py_XDECREF(starts);
+    Py_XDECREF(ends);
+    return result;
+}
+
+static PyObject *
+read_array(Reader *r, int type)
+{
+    uint64_t size;
+    int n = width_of(type);
+    if (type == TYPE_ARRAY)
+        return unsupported("arrays of arrays");
+    if (!n && type != TYPE_STRING && type != TYPE_OBJECT)
+        return PyErr_Format(PyExc_OSError, "unsupported type: %d", type);
+    if (read_var_int(r, &size) < 0)
+        return NULL;
+    if (size > r->max_array)
+        return PyErr_Format(PyExc_OSError, "array too long: %llu elements", (unsigned long long)size);
+
+    if (n) {
+        if (size > (uint64_t)(r->size - r->offset) / n) {
+            eof();
+            return NULL;
+        }
+    }
+    else if (size > (uint64_t)(r->size - r->offset)) {
+        /* every string or object takes at least one byte */
+        eof();
+        return NULL;
+    }
+
+    if (r->array_cls != NULL) {
+        if (n && TYPECODES[type])
+            return column(r, type, size);
+        if (type == TYPE_STRING)
+            return string_column(r, size);
+    }
+
+    /* an array of sections is a level of nesting of its own */
+    int nested = type == TYPE_OBJECT;
+    if (nested) {
+        if (r->depth + 1 > r->max_depth || r->depth + 1 > MAX_C_DEPTH)
+            return nesting(r);
+        r->depth++;
+    }
+    PyObject *list = PyList_New((Py_ssize_t)size);
+    if (list != NULL) {
+        for (Py_ssize_t i = 0; i < (Py_ssize_t)size; i++) {
+            PyObject *value = read_value(r, type);
+            if (value == NULL) {
+                Py_CLEAR(list);
+                break;
+            }
+            PyList_SET_ITEM(list, i, value);
+        }
+    }
+    if (nested)
+        r->depth--;
+    return list;
+}
+
+static PyObject *
+share_types(Reader *r, PyObject *types)
+{
+    /* sections of the same shape share one types dict */
+    PyObject *items = PyDict_Items(types);
+    if (items == NULL)
+        return NULL;
+    PyObject *key = PyList_AsTuple(items);
+    Py_DECREF(items);
+    if (key == NULL)
+        return NULL;
+    PyObject *shared = PyDict_SetDefault(r->types_cache, key, types);
+    Py_DECREF(key);
+    Py_XINCREF(shared);
+    return shared;
+}
+
+static PyObject *
+read_section(Reader *r)
+{
+    PyObject *section = NULL, *entries = NULL, *types = NULL, *name = NULL, *value = NULL;
+    uint64_t count;
+
+    if (r->depth + 1 > r->max_depth || r->depth + 1 > MAX_C_DEPTH)
+        return nesting(r);
+    if (++r->objects > r->max_objects)
+        return decode_error("too many objects in payload");
+    if (Py_EnterRecursiveCall(" while decoding a section"))
+        return NULL;
+    r->depth++;
+    section = PyObject_CallNoArgs(r->section_cls);
+    if (section == NULL)
+        goto error;
+    entries = PyObject_GetAttr(section, str_entries);
+    if (entries == NULL)
+        goto error;
+    if (r->native && (types = PyDict_New()) == NULL)
+        goto error;
+    if (read_var_int(r, &count) < 0)
+        goto error;
+    /* every field takes at least one byte */
+    if (count > (uint64_t)(r->size - r->offset)) {
+        eof();
+        goto error;
+    }
+
+    while (count > 0) {
+        if (need(r, 1) < 0)
+            goto error;
+        Py_ssize_t len_name = r->data[r->offset];
+        r->offset += 1;
+        if (need(r, len_name + 1) < 0)
+            goto error;
+        name = PyUnicode_DecodeASCII((const char *)r->data + r->offset, len_name, NULL);
+        if (name == NULL)
+            goto error;
+        int type = r->data[r->offset + len_name];
+        r->offset += len_name + 1;
+
+        if (types != NULL) {
+            int stored = type;
+            if (type == TYPE_ARRAY) {
+                if (need(r, 1) < 0)
+                    goto error;
+                stored = r->data[r->offset];
+            }
+            PyObject *t = PyLong_FromLong(stored);
+            if (t == NULL || PyDict_SetItem(types, name, t) < 0) {
+                Py_XDECREF(t);
+                goto error;
+            }
+            Py_DECREF(t);
+        }
+
+        if (type & FLAG_ARRAY) {
+            value = read_array(r, type & ~FLAG_ARRAY);
+        }
+        else if (type == TYPE_ARRAY) {
+            if (need(r, 1) < 0)
+                goto error;
+            int element = r->data[r->offset];
+            r->offset += 1;
+            if (!(element & FLAG_ARRAY)) {
+                PyErr_SetString(PyExc_OSError, "wrong type sequences");
+                goto error;
+            }
+            value = read_array(r, element & ~FLAG_ARRAY);
+        }
+        else {
+            value = read_value(r, type);
+        }
+        if (value == NULL || PyObject_SetItem(entries, name, value) < 0)
+            goto error;
+        Py_CLEAR(name);
+        Py_CLEAR(value);
+        count--;
+    }
+
+    if (types != NULL) {
+        PyObject *shared = share_types(r, types);
+        if (shared == NULL || PyObject_SetAttr(section, str_types, shared) < 0) {
+            Py_XDECREF(shared);
+            goto error;
+        }
+        Py_DECREF(shared);
+    }
+    Py_XDECREF(types);
+    Py_DECREF(entries);
+    r->depth--;
+    Py_LeaveRecursiveCall();
+    return section;
+
+error:
+    Py_XDECREF(name);
+    Py_XDECREF(value);
+    Py_XDECREF(types);
+    Py_XDECREF(entries);
+    Py_XDECREF(section);
+    r->depth--;
+    Py_LeaveRecursiveCall();
+    return NULL;
+}
+
+static int
+limit(PyObject *limits, const char *name, Py_ssize_t *out)
+{
+    PyObject *value = PyObject_GetAttrString(limits, name);
+    if (value == NULL)
+        return -1;
+    *out = PyLong_AsSsize_t(value);
+    Py_DECREF(value);
+    if (*out == -1 && PyErr_Occurred()) {
+        if (!PyErr_ExceptionMatches(PyExc_OverflowError))
+            return -1;
+        /* larger than anything a buffer can hold */
+        PyErr_Clear();
+        *out = PY_SSIZE_T_MAX;
+    }
+    if (*out < 0)
+        *out = 0;
+    return 0;
+}
+
+PyDoc_STRVAR(py_read_section_doc,
+"read_section(buffer, offset, native, views, types_cache, section_cls, ctypes, limits, objects, columnar)"
+" -> (section, offset, objects); columnar is None or (array.array, StringArray)");
+
+static PyObject *
+py_read_section(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    if (nargs != 10) {
+        PyErr_SetString(PyExc_TypeError, "read_section() takes 10 arguments");
+        return NULL;
+    }
+    Py_buffer buffer;
+    if (PyObject_GetBuffer(args[0], &buffer, PyBUF_SIMPLE) < 0)
+        return NULL;
+
+    Reader r;
+    r.data = buffer.buf;
+    r.size = buffer.len;
+    r.offset = PyLong_AsSsize_t(args[1]);
+    r.native = PyObject_IsTrue(args[2]);
+    r.view = PyObject_IsTrue(args[3]) ? args[0] : NULL;
+    r.types_cache = args[4];
+    r.section_cls = args[5];
+    r.ctypes = args[6];
+    r.array_cls = r.string_array_cls = NULL;
+    r.depth = 0;
+
+    PyObject *result = NULL;
+    Py_ssize_t max_array, max_string;
+    if (r.offset == -1 && PyErr_Occurred())
+        goto done;
+    r.objects = PyLong_AsSsize_t(args[8]);
+    if (r.objects == -1 && PyErr_Occurred())
+        goto done;
+    if (limit(args[7], "max_objects", &r.max_objects) < 0 || limit(args[7], "max_depth", &r.max_depth) < 0 ||
+            limit(args[7], "max_array_length", &max_array) < 0 ||
+            limit(args[7], "max_string_length", &max_string) < 0)
+        goto done;
+    r.max_array = (uint64_t)max_array;
+    r.max_string = (uint64_t)max_string;
+    if (!PyDict_Check(r.types_cache) || !PyTuple_Check(r.ctypes) || PyTuple_GET_SIZE(r.ctypes) < 14) {
+        PyErr_SetString(PyExc_TypeError, "read_section(): bad types_cache or ctypes");
+        goto done;
+    }
+    if (args[9] != Py_None) {
+        /* columnar: (array.array, StringArray) */
+        if (!PyTuple_Check(args[9]) || PyTuple_GET_SIZE(args[9]) != 2) {
+            PyErr_SetString(PyExc_TypeError, "read_section(): bad columnar classes");
+            goto done;
+        }
+        r.array_cls = PyTuple_GET_ITEM(args[9], 0);
+        r.string_array_cls = PyTuple_GET_ITEM(args[9], 1);
+    }
+    if (r.offset < 0 || r.offset > r.size) {
+        eof();
+        goto done;
+    }
+    PyObject *section = read_section(&r);
+    if (section != NULL)
+        result = Py_BuildValue("(Nnn)", section, r.offset, r.objects);
+
+done:
+    PyBuffer_Release(&buffer);
+    return result;
+}
+
+PyDoc_STRVAR(py_read_var_int_doc, "read_var_int(buffer, offset) -> (value, offset)");
+
+static PyObject *
+py_read_var_int(PyObject *module, PyObject *args)
+{
+    Py_buffer buffer;
+    Py_ssize_t offset;
+    if (!PyArg_ParseTuple(args, "y*n", &buffer, &offset))
+        return NULL;
+
+    Reader r = {buffer.buf, buffer.len, offset};
+    uint64_t value;
+    PyObject *result = NULL;
+    if (offset < 0 || offset > r.size)
+        eof();
+    else if (read_var_int(&r, &value) == 0)
+        result = Py_BuildValue("(Kn)", (unsigned long long)value, r.offset);
+    PyBuffer_Release(&buffer);
+    return result;
+}
+
+/* encoding */
+
+typedef struct {
+    unsigned char *data;
+    Py_ssize_t size;
+    Py_ssize_t capacity;
+    PyObject *section_cls;
+    PyObject *ctypes;  /* dict: ctype class -> serialize type */
+} Writer;
+
+static int write_section(Writer *w, PyObject *section);
+
+static unsigned char *
+reserve(Writer *w, Py_ssize_t n)
+{
+    if (w->size + n > w->capacity) {
+        Py_ssize_t capacity = w->capacity * 2;
+        if (capacity < w->size + n)
+            capacity = w->size + n;
+        unsigned char *data = PyMem_Realloc(w->data, capacity);
+        if (data == NULL) {
+            PyErr_NoMemory();
+            return NULL;
+        }
+        w->data = data;
+        w->capacity = capacity;
+    }
+    unsigned char *p = w->data + w->size;
+    w->size += n;
+    return p;
+}
+
+static int
+write_bytes(Writer *w, const void *data, Py_ssize_t n)
+{
+    unsigned char *p = reserve(w, n);
+    if (p == NULL)
+        return -1;
+    memcpy(p, data, n);
+    return 0;
+}
+
+static int
+write_byte(Writer *w, int b)
+{
+    unsigned char *p = reserve(w, 1);
+    if (p == NULL)
+        return -1;
+    *p = (unsigned char)b;
+    return 0;
+}
+
+static int
+write_var_int(Writer *w, uint64_t i)
+{
+    /* contrib/epee/include/storages/portable_storage_to_bin.h:pack_varint */
+    int n;
+    if (i <= 63)
+        n = 1;
+    else if (i <= 16383)
+        n = 2;
+    else if (i <= 1073741823)
+        n = 4;
+    else if (i <= 4611686018427387903ULL)
+        n = 8;
+    else {
+        unsupported("varint too big");
+        return -1;
+    }
+    unsigned char *p = reserve(w, n);
+    if (p == NULL)
+        return -1;
+    store_le(p, (i << 2) | (n == 1 ? 0 : n == 2 ? 1 : n == 4 ? 2 : 3), n);
+    return 0;
+}
+
+/* value of a fixed-width entry; values struct.pack would reject are unsupported */
+static int
+write_scalar(Writer *w, int type, PyObject *value)
+{
+    uint64_t raw;
+    int n = WIDTHS[type];
+
+    if (type == TYPE_BOOL) {
+        int b = PyObject_IsTrue(value);
+        if (b < 0)
+            return -1;
+        raw = b;
+    }
+    else if (type == TYPE_DOUBLE) {
+        if (!PyFloat_Check(value) && !PyLong_Check(value)) {
+            unsupported("double value");
+            return -1;
+        }
+        double d = PyFloat_AsDouble(value);
+        if (d == -1.0 && PyErr_Occurred()) {
+            PyErr_Clear();
+            unsupported("double value");
+            return -1;
+        }
+        memcpy(&raw, &d, sizeof(d));
+    }
+    else if (!PyLong_Check(value)) {
+        unsupported("integer value");
+        return -1;
+    }
+    else if (type >= TYPE_UINT64) {
+        unsigned long long v = PyLong_AsUnsignedLongLong(value);
+        if (PyErr_Occurred() || (n < 8 && v >> (8 * n))) {
+            PyErr_Clear();
+            unsupported("integer out of range");
+            return -1;
+        }
+        raw = v;
+    }
+    else {
+        long long v = PyLong_AsLongLong(value);
+        long long limit = n < 8 ? 1LL << (8 * n - 1) : 0;
+        if (PyErr_Occurred() || (n < 8 && (v < -limit || v >= limit))) {
+            PyErr_Clear();
+            unsupported("integer out of range");
+            return -1;
+        }
+        raw = (uint64_t)v;
+    }
+
+    unsigned char *p = reserve(w, n);
+    if (p == NULL)
+        return -1;
+    store_le(p, raw, n);
+    return 0;
+}
+
+/* serialize type of a ctype instance, 0 if `value` is none */
+static int
+ctype_of(Writer *w, PyObject *value)
+{
+    PyObject *stype = PyDict_GetItemWithError(w->ctypes, (PyObject *)Py_TYPE(value));
+    if (stype == NULL)
+        return PyErr_Occurred() ? -1 : 0;
+    return (int)PyLong_AsLong(stype);
+}
+
+static int
+bytes_like(PyObject *value)
+{
+    if (PyBytes_Check(value) || PyByteArray_Check(value))
+        return 1;
+    if (PyMemoryView_Check(value)) {
+        Py_buffer *view = PyMemoryView_GET_BUFFER(value);
+        return view->ndim == 1 && view->itemsize == 1 && PyBuffer_IsContiguous(view, 'C');
+    }
+    return 0;
+}
+
+static int
+write_blob(Writer *w, PyObject *value)
+{
+    Py_buffer view;
+    if (PyObject_GetBuffer(value, &view, PyBUF_SIMPLE) < 0)
+        return -1;
+    int rc = write_var_int(w, (uint64_t)view.len);
+    if (rc == 0)
+        rc = write_bytes(w, view.buf, view.len);
+    PyBuffer_Release(&view);
+    return rc;
+}
+
+/* a ctype element of a list unwrapped to its value; new reference */
+static PyObject *
+unwrap(Writer *w, PyObject *item, int *stype)
+{
+    *stype = ctype_of(w, item);
+    if (*stype < 0)
+        return NULL;
+    if (*stype)
+        return PyObject_GetAttr(item, str_value);
+    Py_INCREF(item);
+    return item;
+}
+
+static int
+element_type(Writer *w, PyObject *value)
+{
+    int stype = ctype_of(w, value);
+    if (stype)
+        return stype;
+    int is_section = PyObject_IsInstance(value, w->section_cls);
+    if (is_section < 0)
+        return -1;
+    if (is_section)
+        return TYPE_OBJECT;
+    if (bytes_like(value))
+        return TYPE_STRING;
+    if (PyBool_Check(value))
+        return TYPE_BOOL;
+    if (PyFloat_Check(value))
+        return TYPE_DOUBLE;
+    unsupported("list element");
+    return -1;
+}
+
+static int
+write_list(Writer *w, PyObject *list, PyObject *hint)
+{
+    Py_ssize_t size = PySequence_Fast_GET_SIZE(list);
+    PyObject **items = PySequence_Fast_ITEMS(list);
+    int type;
+
+    if (hint != NULL) {
+        type = (int)PyLong_AsLong(hint) & ~FLAG_ARRAY;
+        if (type == -1 && PyErr_Occurred())
+            return -1;
+    }
+    else if (size) {
+        type = element_type(w, items[0]);
+        if (type < 0)
+            return -1;
+    }
+    else {
+        type = TYPE_OBJECT;
+    }
+
+    if (width_of(type) == 0 && type != TYPE_STRING && type != TYPE_OBJECT) {
+        unsupported("array element type");
+        return -1;
+    }
+    if (write_byte(w, type | FLAG_ARRAY) < 0 || write_var_int(w, (uint64_t)size) < 0)
+        return -1;
+
+    for (Py_ssize_t i = 0; i < size; i++) {
+        PyObject *item = items[i];
+        int rc, stype;
+
+        if (type == TYPE_OBJECT) {
+            int is_section = PyObject_IsInstance(item, w->section_cls);
+            if (is_section <= 0) {
+                if (is_section == 0)
+                    unsupported("array element");
+                return -1;
+            }
+            if (write_section(w, item) < 0)
+                return -1;
+            continue;
+        }
+
+        PyObject *value = unwrap(w, item, &stype);
+        if (value == NULL)
+            return -1;
+        if (type == TYPE_STRING) {
+            if (stype && stype != TYPE_STRING) {
+                Py_DECREF(value);
+                unsupported("array element");
+                return -1;
+            }
+            rc = bytes_like(value) ? write_blob(w, value) : (unsupported("array element"), -1);
+        }
+        else if ((type == TYPE_BOOL || type == TYPE_DOUBLE) && stype && stype != type) {
+            rc = (unsupported("array element"), -1);
+        }
+        else if (type == TYPE_DOUBLE || type == TYPE_BOOL || PyLong_Check(value)) {
+            rc = write_scalar(w, type, value);
+        }
+        else {
+            rc = (unsupported("array element"), -1);
+        }
+        Py_DECREF(value);
+        if (rc < 0)
+            return -1;
+    }
+    return 0;
+}
+
+/* type and value of one entry; `hint` is the serialize type from Section.types */
+static int
+write_value(Writer *w, PyObject *value, PyObject *hint)
+{
+    int stype = ctype_of(w, value);
+    if (stype < 0)
+        return -1;
+    if (stype) {
+        PyObject *inner = PyObject_GetAttr(value, str_value);
+        if (inner == NULL)
+            return -1;
+        int rc;
+        if (stype == TYPE_STRING)
+            rc = bytes_like(inner) ? (write_byte(w, TYPE_STRING) < 0 ? -1 : write_blob(w, inner))
+                                   : (unsupported("string value"), -1);
+        else if (PyBytes_Check(inner))
+            rc = (unsupported("raw ctype value"), -1);
+        else
+            rc = write_byte(w, stype) < 0 ? -1 : write_scalar(w, stype, inner);
+        Py_DECREF(inner);
+        return rc;
+    }
+
+    int is_section = PyObject_IsInstance(value, w->section_cls);
+    if (is_section < 0)
+        return -1;
+    if (is_section)
+        return write_byte(w, TYPE_OBJECT) < 0 ? -1 : write_section(w, value);
+    if (bytes_like(value))
+        return write_byte(w, TYPE_STRING) < 0 ? -1 : write_blob(w, value);
+    if (PyList_CheckExact(value) || PyTuple_CheckExact(value))
+        return write_list(w, value, hint);
+    if (PyBool_Check(value))
+        return write_byte(w, TYPE_BOOL) < 0 ? -1 : write_scalar(w, TYPE_BOOL, value);
+    if (PyFloat_CheckExact(value))
+        return write_byte(w, TYPE_DOUBLE) < 0 ? -1 : write_scalar(w, TYPE_DOUBLE, value);
+    if (PyLong_CheckExact(value) && hint != NULL) {
+        int type = (int)PyLong_AsLong(hint);
+        if (width_of(type))
+            return write_byte(w, type) < 0 ? -1 : write_scalar(w, type, value);
+    }
+    unsupported("entry value");
+    return -1;
+}
+
+static int
+write_section(Writer *w, PyObject *section)
+{
+    int rc = -1;
+    PyObject *types = NULL, *entries = NULL, *items = NULL;
+
+    if (Py_EnterRecursiveCall(" while encoding a section"))
+        return -1;
+    types = PyObject_GetAttr(section, str_types);
+    if (types == NULL)
+        goto done;
+    if (types != Py_None && !PyDict_Check(types)) {
+        unsupported("Section.types");
+        goto done;
+    }
+    entries = PyObject_GetAttr(section, str_entries);
+    if (entries == NULL)
+        goto done;
+    items = PyMapping_Items(entries);
+    if (items == NULL)
+        goto done;
+
+    Py_ssize_t count = PyList_GET_SIZE(items);
+    if (write_var_int(w, (uint64_t)count) < 0)
+        goto done;
+    for (Py_ssize_t i = 0; i < count; i++) {
+        PyObject *item = PyList_GET_ITEM(items, i);
+        PyObject *key = PyTuple_GET_ITEM(item, 0), *value = PyTuple_GET_ITEM(item, 1);
+        if (!PyUnicode_Check(key) || !PyUnicode_IS_ASCII(key) || PyUnicode_GET_LENGTH(key) > 255) {
+            unsupported("entry name");
+            goto done;
+        }
+        Py_ssize_t len;
+        const char *name = PyUnicode_AsUTF8AndSize(key, &len);
+        if (name == NULL || write_byte(w, (int)len) < 0 || write_bytes(w, name, len) < 0)
+            goto done;
+
+        PyObject *hint = NULL;
+        if (types != Py_None) {
+            hint = PyDict_GetItemWithError(types, key);
+            if (hint == NULL && PyErr_Occurred())
+                goto done;
+        }
+        if (write_value(w, value, hint) < 0)
+            goto done;
+    }
+    rc = 0;
+
+done:
+    Py_XDECREF(items);
+    Py_XDECREF(entries);
+    Py_XDECREF(types);
+    Py_LeaveRecursiveCall();
+    return rc;
+}
+
+PyDoc_STRVAR(py_encode_section_doc,
+"encode_section(section, section_cls, ctypes) -> bytes; the section body without the storage signature");
+
+static PyObject *
+py_encode_section(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    if (nargs != 3) {
+        PyErr_SetString(PyExc_TypeError, "encode_section() takes 3 arguments");
+        return NULL;
+    }
+    if (!PyDict_Check(args[2])) {
+        PyErr_SetString(PyExc_TypeError, "encode_section(): ctypes must be a dict");
+        return NULL;
+    }
+    Writer w = {NULL, 0, 0, args[1], args[2]};
+    PyObject *result = NULL;
+    if (write_section(&w, args[0]) == 0)
+        result = PyBytes_FromStringAndSize((const char *)w.data, w.size);
+    PyMem_Free(w.data);
+    return result;
+}
+
+PyDoc_STRVAR(py_pack_var_int_doc, "pack_var_int(i) -> bytes");
+
+static PyObject *
+py_pack_var_int(PyObject *module, PyObject *arg)
+{
+    unsigned long long i = PyLong_AsUnsignedLongLong(arg);
+    if (i == (unsigned long long)-1 && PyErr_Occurred()) {
+        PyErr_Clear();
+        return unsupported("varint out of range");
+    }
+    Writer w = {NULL, 0, 0, NULL, NULL};
+    PyObject *result = NULL;
+    if (write_var_int(&w, i) == 0)
+        result = PyBytes_FromStringAndSize((const char *)w.data, w.size);
+    PyMem_Free(w.data);
+    return result;
+}
+
+static PyMethodDef methods[] = {
+    {"read_section", (PyCFunction)(void (*)(void))py_read_section, METH_FASTCALL, py_read_section_doc},
+    {"read_var_int", py_read_var_int, METH_VARARGS, py_read_var_int_doc},
+    {"encode_section", (PyCFunction)(void (*)(void))py_encode_section, METH_FASTCALL, py_encode_section_doc},
+    {"pack_var_int", py_pack_var_int, METH_O, py_pack_var_int_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef module = {
+    PyModuleDef_HEAD_INIT, "levin._speedups", "C implementation of the portable storage codec", -1, methods
+};
+
+PyMODINIT_FUNC
+PyInit__speedups(void)
+{
+    PyObject *m = PyModule_Create(&module);
+    if (m == NULL)
+        return NULL;
+
+    Unsupported = PyErr_NewExceptionWithDoc("levin._speedups.Unsupported",
+                                            "input the C codec leaves to the pure Python one", NULL, NULL);
+    str_entries = PyUnicode_InternFromString("entries");
+    str_types = PyUnicode_InternFromString("types");
+    str_value = PyUnicode_InternFromString("value");
+    if (Unsupported == NULL || str_entries == NULL || str_types == NULL || str_value == NULL ||
+            PyModule_AddObjectRef(m, "Unsupported", Unsupported) < 0) {
+        Py_DECREF(m);
+        return NULL;
+    }
+    return m;
+}
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import struct
+import time
+from collections import deque
+
+from levin import metrics, recorder
+from levin.bucket import Bucket
+from levin.framing import LevinFrameDecoder
+from levin.section import Section
+from levin.constants import *
+from levin.ctypes import *
+
+log = logging.getLogger()
+
+_COMMAND = struct.Struct('<I')
+
+
+class LevinConnection:
+    """
+    asyncio Levin connection. Frames buckets off a StreamReader, matches
+    responses to outstanding `request()` calls by command (in order) and
+    dispatches incoming requests to handlers registered with `add_handler()`.
+    Framing is done by `LevinFrameDecoder`; `decoder_options` (schema, views,
+    spill_threshold, max_packet_size, ...) are passed on to it.
+
+        conn = await LevinConnection.connect('212.83.175.67', 18080)
+        bucket = await conn.request(P2P_COMMAND_HANDSHAKE, Section.handshake_request())
+        peers = bucket.get_peers()
+    """
+    READ_SIZE = 65536
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, **decoder_options):
+        self.reader = reader
+        self.writer = writer
+        self.peername = writer.get_extra_info('peername')
+        self.handlers = {}
+        self._pending = {}
+        self._closed = asyncio.Event()
+        self._error = None
+        self._tasks = set()
+        self.decoder_options = decoder_options
+
+        self.add_handler(P2P_COMMAND_REQUEST_SUPPORT_FLAGS, lambda bucket: Section.create_flags_response())
+        self._read_task = asyncio.ensure_future(self._read_loop())
+
+    @classmethod
+    async def connect(cls, host: str, port: int, timeout: float = None, **decoder_options):
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except asyncio.TimeoutError:
+            if metrics.hooks is not None:
+                metrics.hooks.error(LEVIN_ERROR_CONNECTION_TIMEDOUT)
+            raise
+        except OSError:
+            if metrics.hooks is not None:
+                metrics.hooks.error(LEVIN_ERROR_CONNECTION)
+            raise
+        return cls(reader, writer, **decoder_options)
+
+    def add_handler(self, command: int, handler):
+        """
+        Registers `handler(bucket)` for incoming requests of `command`. It may
+        be a coroutine function. When the peer expects data back, the returned
+        `Section`, raw payload bytes or None (empty payload) is sent as the
+        response.
+        """
+        self.handlers[int(command)] = handler
+
+    def remove_handler(self, command: int):
+        self.handlers.pop(int(command), None)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def send(self, bucket: Bucket):
+        if self.closed:
+            raise ConnectionError("connection closed")
+        if metrics.hooks is not None:
+            metrics.hooks.frame_out(bucket.command.value, LEVIN_HEADER_SIZE + bucket.cb.value)
+        buffers = bucket.buffers()
+        if recorder.active is not None:
+            recorder.active.frame_out(self.peername, buffers)
+        self.writer.writelines(buffers)
+
+    def send_many(self, buckets: list):
+        """Queues several buckets at once, e.g. a pipelined burst of requests"""
+        if self.closed:
+            raise ConnectionError("connection closed")
+        buffers = []
+        for bucket in buckets:
+            frame = bucket.buffers()
+            buffers.extend(frame)
+            if metrics.hooks is not None:
+                metrics.hooks.frame_out(bucket.command.value, LEVIN_HEADER_SIZE + bucket.cb.value)
+            if recorder.active is not None:
+                recorder.active.frame_out(self.peername, frame)
+        self.writer.writelines(buffers)
+
+    def send_frame(self, frame: bytes):
+        """Sends a complete, already serialized bucket (e.g. a rendered `MessageTemplate`)"""
+        if self.closed:
+            raise ConnectionError("connection closed")
+        if metrics.hooks is not None:
+            metrics.hooks.frame_out(_COMMAND.unpack_from(frame, 17)[0], len(frame))
+        if recorder.active is not None:
+            recorder.active.frame_out(self.peername, (frame,))
+        self.writer.write(frame)
+
+    async def request(self, command: int, section: Section = None, timeout: float = None,
+                      frame: bytes = None) -> Bucket:
+        """
+        Sends a request and waits for the response bucket of the same command.
+        The request is built from `section`, or sent as given in `frame`.
+        """
+        command = int(command)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(command, deque()).append(future)
+        hooks = metrics.hooks
+        if hooks is not None:
+            hooks.queue('requests', 1)
+            started = time.perf_counter()
+        try:
+            if frame is not None:
+                self.send_frame(frame)
+            else:
+                self.send(Bucket.create_request(command, section=section))
+            await self.writer.drain()
+            bucket = await asyncio.wait_for(future, timeout)
+            if hooks is not None and command == P2P_COMMAND_HANDSHAKE.value:
+                hooks.handshake(time.perf_counter() - started)
+            return bucket
+        except asyncio.TimeoutError:
+            if hooks is not None:
+                hooks.error(LEVIN_ERROR_CONNECTION_TIMEDOUT)
+            raise
+        finally:
+            if hooks is not None:
+                hooks.queue('requests', -1)
+            waiters = self._pending.get(command)
+            if waiters and future in waiters:
+                waiters.remove(future)
+
+    async def notify(self, command: int, section: Section = None):
+        """Sends a request the peer should not answer"""
+        bucket = Bucket.create_request(int(command), section=section)
+        bucket.return_data = c_bool(False)
+        self.send(bucket)
+        await self.writer.drain()
+
+    async def _read_loop(self):
+        decoder = LevinFrameDecoder(peer=self.peername, **self.decoder_options)
+        try:
+            while True:
+                data = await self.reader.read(self.READ_SIZE)
+                if not data:
+                    raise ConnectionError("eof")
+                for bucket in decoder.feed(data):
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("<< received packet '%s'", P2P_COMMANDS[bucket.command])
+                    if bucket.is_response:
+                        self._on_response(bucket)
+                    else:
+                        # handlers may issue requests of their own; keep reading
+                        task = asyncio.ensure_future(self._on_request(bucket))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+        except asyncio.CancelledError:
+            self._error = ConnectionError("connection closed")
+            raise
+        except ConnectionError as e:
+            self._error = ConnectionError("connection lost: %s" % e)
+            if metrics.hooks is not None:
+                metrics.hooks.error(LEVIN_ERROR_CONNECTION_DESTROYED)
+        except Exception as e:
+            log.debug("closing %s: %s", self.peername, e)
+            self._error = e
+            if metrics.hooks is not None:
+                metrics.hooks.error(LEVIN_ERROR_FORMAT)
+        finally:
+            self._shutdown()
+
+    def _on_response(self, bucket: Bucket):
+        waiters = self._pending.get(bucket.command.value)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(bucket)
+                return
+        log.debug("unsolicited response '%s' from %s", P2P_COMMANDS[bucket.command], self.peername)
+
+    async def _on_request(self, bucket: Bucket):
+        hooks = metrics.hooks
+        if hooks is None:
+            return await self._handle(bucket)
+        hooks.queue('handlers', 1)
+        try:
+            await self._handle(bucket)
+        finally:
+            hooks.queue('handlers', -1)
+
+    async def _handle(self, bucket: Bucket):
+        handler = self.handlers.get(bucket.command.value)
+        if handler is None:
+            if bucket.return_data.value:
+                self.send(Bucket.create_response(
+                    bucket.command.value, return_code=LEVIN_ERROR_CONNECTION_HANDLER_NOT_DEFINED))
+            return
+
+        try:
+            result = handler(bucket)
+            if asyncio.iscoroutine(result):
+                result = await result
+            if isinstance(result, (bytes, bytearray)):
+                response = Bucket.create_response(bucket.command.value, payload=result)
+            else:
+                response = Bucket.create_response(bucket.command.value, section=result)
+        except ConnectionError:
+            return
+        except Exception as e:
+            log.debug("handler for '%s' failed: %s", P2P_COMMANDS[bucket.command], e)
+            if metrics.hooks is not None:
+                metrics.hooks.error(LEVIN_ERROR_FORMAT)
+            response = Bucket.create_response(bucket.command.value, return_code=LEVIN_ERROR_FORMAT)
+
+        if bucket.return_data.value and not self.closed:
+            self.send(response)
+
+    def _shutdown(self):
+        if self.closed:
+            return
+        self._closed.set()
+        error = self._error or ConnectionError("connection closed")
+        for waiters in self._pending.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(error)
+        self._pending.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        self.writer.close()
+
+    async def close(self):
+        self._read_task.cancel()
+        # waits for the read loop without swallowing a cancellation of this task
+        await asyncio.wait((self._read_task,))
+        self._shutdown()
+
+    async def wait_closed(self):
+        await self._closed.wait()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -1,16 +1,23 @@
 import logging
+import random
 import sys
 import struct
 import socket
+import time
 from io import BytesIO
 
+from levin import metrics, recorder
 from levin.section import Section
 from levin.constants import *
 from levin.exceptions import BadArgumentException
+from levin.utils import recv_into, sendmsg_all
 from levin.ctypes import *
 
 log = logging.getLogger()
 
+# signature, cb, return_data, command, return_code, flags, protocol_version
+_HEADER = struct.Struct('<QQ?IiII')
+
 class Bucket:
     def __init__(self):
         self.signature = LEVIN_SIGNATURE
@@ -24,6 +31,8 @@ class Bucket:
         self.flags = None
         self.protocol_version = None
         self.payload_section = None
+        # time.monotonic() when the last byte of the frame was read
+        self.received = None
 
     @classmethod
     def create_request(cls, command: int, payload: bytes = None, section: Section = None):
@@ -35,25 +44,25 @@ class Bucket:
         bucket.flags = LEVIN_PACKET_REQUEST
         bucket.protocol_version = LEVIN_PROTOCOL_VER_1
 
-        if payload:
-            bucket.cb = c_uint64(len(payload))
-            bucket.payload_section = payload
-
-        if section:
-            bucket.payload_section = bytes(section)
-            bucket.cb = c_uint64(len(bucket.payload_section))
-
+        bucket.set_payload(payload, section)
         return bucket
 
     @classmethod
-    def create_response(cls, command: int, payload: bytes, return_code: int):
+    def create_response(cls, command: int, payload: bytes = None, return_code: int = 0, section: Section = None):
         bucket = cls()
-        bucket.cb = c_uint64(len(payload))
         bucket.return_data = c_bool(False)
         bucket.command = c_uint32(command)
-        bucket.return_code = c_uint32(return_code)
+        bucket.return_code = c_int32(return_code)
         bucket.flags = LEVIN_PACKET_RESPONSE
         bucket.protocol_version = LEVIN_PROTOCOL_VER_1
+        bucket.set_payload(payload, section)
+        return bucket
+
+    def set_payload(self, payload: bytes = None, section: Section = None):
+        if section is not None:
+            payload = bytes(section)
+        self.payload_section = payload or b''
+        self.cb = c_uint64(len(self.payload_section))
 
     @staticmethod
     def create_handshake_request(
@@ -67,95 +76,199 @@ class Bucket:
         :param my_port: defaults to 0
         :param network_id: defaults to mainnet
         :param peer_id:
-        :param verbose:
         :return:
         """
-        handshake_section = Section.handshake_request(peer_id=peer_id, network_id=network_id, my_port=my_port)
-        bucket = Bucket.create_request(P2P_COMMAND_HANDSHAKE.value, section=handshake_section)
-
-        log.debug(">> created packet '%s'" % P2P_COMMANDS[bucket.command])
+        from levin.template import handshake_template
+        bucket = handshake_template(network_id).bucket(my_port=my_port, peer_id=_peer_id(peer_id))
 
-        header = bucket.header()
-        body = bucket.payload()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(">> created packet '%s'", P2P_COMMANDS[bucket.command])
         return bucket
 
     @staticmethod
     def create_stat_info_request(
         peer_id: bytes = b"\x41\x41\x41\x41\x41\x41\x41\x41",
     ):
-        stat_info_section = Section.stat_info_request(peer_id=peer_id)
-        log.debug(stat_info_section.entries["proof_of_trust"].entries.keys())
-        bucket = Bucket.create_request(
-            P2P_COMMAND_REQUEST_STAT_INFO.value, section=stat_info_section
-        )
+        from levin.template import STAT_INFO
+        bucket = STAT_INFO.bucket(peer_id=_peer_id(peer_id))
 
-        log.debug(">> created packet '%s'" % P2P_COMMANDS[bucket.command])
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(">> created packet '%s'", P2P_COMMANDS[bucket.command])
         return bucket
 
+    @staticmethod
+    def create_ping_request():
+        from levin.template import PING
+        return PING.bucket()
+
+    @staticmethod
+    def create_support_flags_request():
+        from levin.template import SUPPORT_FLAGS
+        return SUPPORT_FLAGS.bucket()
+
     @classmethod
-    def from_buffer(cls, signature: c_uint64, sock: socket.socket):
-        if isinstance(signature, bytes):
-            signature = c_uint64(signature)
-        # if isinstance(buffer, bytes):
-        #     buffer = BytesIO(buffer)
-        bucket = cls()
-        bucket.signature = signature
-        bucket.cb = c_uint64.from_buffer(sock)
-        bucket.return_data = c_bool.from_buffer(sock)
-        bucket.command = c_uint32.from_buffer(sock)
-        bucket.return_code = c_int32.from_buffer(sock)
-        bucket.flags = c_uint32.from_buffer(sock)
-        bucket.protocol_version = c_uint32.from_buffer(sock)
-
-        if bucket.signature != LEVIN_SIGNATURE:
-            raise IOError("Bender's nightmare missing")
+    def from_buffer(cls, signature: c_uint64, sock: socket.socket, buffer: 'ReceiveBuffer' = None):
+        """
+        Reads the rest of a bucket whose 8 byte signature was already read
+        from `sock`. Pass the same `ReceiveBuffer` for every bucket on a
+        connection to reuse its memory; `bucket.payload` is then a view into
+        that buffer and only valid until the next bucket is received.
+        """
+        if isinstance(signature, c_uint64):
+            signature = bytes(signature)
+        if buffer is None:
+            buffer = ReceiveBuffer(0)
 
-        if bucket.cb > LEVIN_DEFAULT_MAX_PACKET_SIZE:
-            raise IOError("payload too large")
+        header = memoryview(buffer.header)
+        header[:8] = signature
+        recv_into(sock, header[8:])
+        return cls._recv_payload(header, sock, buffer)
+
+    @classmethod
+    def recv(cls, sock: socket.socket, buffer: 'ReceiveBuffer' = None):
+        """Reads one bucket off `sock`; see `from_buffer()`"""
+        if buffer is None:
+            buffer = ReceiveBuffer(0)
+
+        header = memoryview(buffer.header)
+        recv_into(sock, header)
+        return cls._recv_payload(header, sock, buffer)
+
+    @classmethod
+    def _recv_payload(cls, header: memoryview, sock: socket.socket, buffer: 'ReceiveBuffer'):
+        bucket = cls.from_header(header)
+        payload = buffer.payload(bucket.cb.value)
+        recv_into(sock, payload)
+        bucket.received = time.monotonic()
+        if recorder.active is not None:
+            recorder.active.frame_in(sock.getpeername(), bytes(header), bytes(payload))
+
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug("<< received packet '%s'", P2P_COMMANDS[bucket.command])
+        hooks = metrics.hooks
+        if hooks is None:
+            bucket.read_payload(payload)
+        else:
+            hooks.bytes_in(LEVIN_HEADER_SIZE + bucket.cb.value)
+            started = time.perf_counter()
+            bucket.read_payload(payload)
+            hooks.frame_in(bucket.command.value, LEVIN_HEADER_SIZE + bucket.cb.value, time.perf_counter() - started)
+            if bucket.is_response and bucket.return_code.value < 0:
+                hooks.error(bucket.return_code.value)
+        if debug:
+            log.debug("<< parsed packet '%s'", P2P_COMMANDS[bucket.command])
+        return bucket
 
-        if bucket.command.value not in P2P_COMMANDS:
-            raise IOError("unregonized command: %d" % bucket.command.value)
+    @classmethod
+    def from_header(cls, header: bytes, max_packet_size: int = LEVIN_DEFAULT_MAX_PACKET_SIZE):
+        """
+        Parses and validates a 33 byte levin header. The payload (`bucket.cb`
+        bytes) is to be passed to `read_payload()` once it arrived.
+        """
+        if len(header) < LEVIN_HEADER_SIZE:
+            raise IOError("short header: %d bytes" % len(header))
 
-        bucket.payload = sock.recv(bucket.cb.value)
+        signature, cb, return_data, command, return_code, flags, protocol_version = \
+            _HEADER.unpack_from(header)
 
-        while len(bucket.payload) < bucket.cb.value:
-            bufsize = 2048
-            remaining = bucket.cb.value - len(bucket.payload)
-            if remaining < bufsize:
-                bufsize = remaining
-            bucket.payload += sock.recv(bufsize)
+        if signature != LEVIN_SIGNATURE:
+            raise IOError("Bender's nightmare missing")
 
-        bucket.payload_section = None
+        if cb > max_packet_size:
+            raise IOError("payload too large")
 
-        log.debug("<< received packet '%s'" % P2P_COMMANDS[bucket.command])
+        if command not in P2P_COMMANDS:
+            raise IOError("unregonized command: %d" % command)
 
+        bucket = cls()
+        bucket.signature = c_uint64(signature)
+        bucket.cb = c_uint64(cb)
+        bucket.return_data = c_bool(return_data)
+        bucket.command = c_uint32(command)
+        bucket.return_code = c_int32(return_code)
+        bucket.flags = c_uint32(flags)
+        bucket.protocol_version = c_uint32(protocol_version)
+        return bucket
+
+    def read_payload(self, payload: bytes, schema=False, **options):
+        """
+        Decodes `payload`; `options` are passed on to `LevinReader`. With
+        `schema=True` commands known to `levin.schema` decode into their typed
+        message instead of a `Section`; `schema` may also be a set of the
+        commands to decode that way.
+        """
         from levin.reader import LevinReader
-        bucket.payload_section = LevinReader(BytesIO(bucket.payload)).read_payload()
+        self.payload = payload
+        if payload and schema and (schema is True or self.command.value in schema):
+            from levin.schema import decode_message
+            self.payload_section = decode_message(self.command.value, payload, self.is_response, **options)
+        elif payload:
+            self.payload_section = LevinReader(payload, **options).read_payload()
+        else:
+            self.payload_section = None
+        return self.payload_section
 
-        log.debug("<< parsed packet '%s'" % P2P_COMMANDS[bucket.command])
-        return bucket
+    @property
+    def is_request(self) -> bool:
+        return bool(self.flags & LEVIN_PACKET_REQUEST)
+
+    @property
+    def is_response(self) -> bool:
+        return bool(self.flags & LEVIN_PACKET_RESPONSE)
 
     def header(self):
-        return b''.join((
-            bytes(LEVIN_SIGNATURE),
-            bytes(self.cb),
-            b'\x01' if self.return_data else b'\x00',
-            bytes(self.command),
-            bytes(self.return_code),
-            bytes(self.flags),
-            bytes(self.protocol_version)
-        ))
+        return _HEADER.pack(
+            LEVIN_SIGNATURE.value,
+            self.cb.value,
+            bool(self.return_data.value),
+            self.command.value,
+            self.return_code.value,
+            self.flags.value,
+            self.protocol_version.value
+        )
+
+    def buffers(self) -> list:
+        """header and payload, ready for a vectored write"""
+        return [self.header(), self.payload()]
+
+    def send(self, sock: socket.socket):
+        """Sends header and payload in one sendmsg call, retrying partial writes"""
+        if metrics.hooks is not None:
+            metrics.hooks.frame_out(self.command.value, LEVIN_HEADER_SIZE + self.cb.value)
+        buffers = self.buffers()
+        if recorder.active is not None:
+            recorder.active.frame_out(sock.getpeername(), buffers)
+        sendmsg_all(sock, buffers)
+
+    @staticmethod
+    def send_many(sock: socket.socket, buckets: list):
+        """Sends several buckets back to back, batched into as few syscalls as possible"""
+        buffers = []
+        for bucket in buckets:
+            buffers.extend(bucket.buffers())
+            if metrics.hooks is not None:
+                metrics.hooks.frame_out(bucket.command.value, LEVIN_HEADER_SIZE + bucket.cb.value)
+        if recorder.active is not None:
+            peer = sock.getpeername()
+            for i in range(0, len(buffers), 2):
+                recorder.active.frame_out(peer, buffers[i:i + 2])
+        sendmsg_all(sock, buffers)
 
     def payload(self):
         return self.payload_section
 
     def get_peers(self):
-        # helper function to retreive peerlisting where buckets.command was 1001
-        if self.command != 1001:
-            raise Exception("Only handshake has peerlisting")
+        # helper function to retreive peerlisting where buckets.command was 1001 or 1002
+        if self.command not in (1001, 1002):
+            raise Exception("Only handshake and timed_sync have peerlisting")
 
         peers = []
 
+        if self.payload_section is None:
+            # an empty payload
+            return peers
+
         if 'local_peerlist_new' not in self.payload_section.entries:
             return
 
@@ -168,18 +281,56 @@ class Bucket:
             if not ipv4 and not "addr" in addr:
                 continue
 
-            if ipv4 and len(addr["m_ip"]) == 4:
-                m_ip, m_port = addr['m_ip'], addr['m_port']
-                m_ip = c_uint32(m_ip.to_bytes(), endian='big')
+            if ipv4 and isinstance(addr["m_ip"], int):
+                # decoded with native values
+                m_ip = c_uint32(c_uint32(addr['m_ip']).to_bytes(), endian='big')
+            elif ipv4 and len(addr["m_ip"]) == 4:
+                m_ip = c_uint32(addr['m_ip'].to_bytes(), endian='big')
             elif len(addr["addr"]) == 16:
-                m_ip, m_port = addr['addr'], addr["m_port"]
-                m_ip = c_uint64(m_ip, endian="big")
+                m_ip = c_uint64(addr['addr'], endian="big")
             else:
                 continue
+            # a plain int when decoded with native values, for either address family
+            m_port = addr['m_port']
+            if isinstance(m_port, int):
+                m_port = c_uint16(m_port)
 
-            peers.append({
+            entry = {
                 'ip': m_ip,
                 'port': m_port
-            })
+            }
+            if 'id' in peer:
+                _id = peer['id']
+                entry['id'] = c_uint64(_id) if isinstance(_id, int) else _id
+            if 'last_seen' in peer:
+                last_seen = peer['last_seen']
+                entry['last_seen'] = c_int64(last_seen) if isinstance(last_seen, int) else last_seen
+            peers.append(entry)
 
         return peers
+
+
+class ReceiveBuffer:
+    """
+    Header and payload memory for receiving buckets on one connection. The
+    payload area only grows; a new bytearray is allocated when it has to, so
+    views handed out earlier stay intact.
+    """
+    def __init__(self, size: int = 65536):
+        self.header = bytearray(LEVIN_HEADER_SIZE)
+        self._buffer = bytearray(size)
+
+    def payload(self, size: int) -> memoryview:
+        if size > len(self._buffer):
+            grow = min(2 * len(self._buffer), LEVIN_DEFAULT_MAX_PACKET_SIZE)
+            self._buffer = bytearray(max(size, grow))
+        return memoryview(self._buffer)[:size]
+
+
+def _peer_id(peer_id) -> int:
+    # peer ids given as raw bytes go on the wire as-is
+    if peer_id is None:
+        return random.getrandbits(64)
+    if isinstance(peer_id, bytes):
+        return int.from_bytes(peer_id, 'big')
+    return int(peer_id)
@@ -0,0 +1,613 @@
+"""
+Offline decoding of recorded Levin traffic. Capture files are libpcap
+captures, whose TCP streams are reassembled here, or dump files: the
+length-prefixed records written by `DumpWriter` and `levin.recorder`.
+Both are read through a read-only mmap, so multi-GB captures are never
+loaded into memory.
+
+    for frame in replay('node.pcap'):
+        print(frame.time, frame.source, frame.bucket.command)
+
+    python -m levin.capture records.jsonl a.pcap b.dump --processes 4
+"""
+import csv
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import shutil
+import socket
+import struct
+import sys
+import time
+
+from levin.framing import LevinFrameDecoder
+from levin.section import Section
+from levin.exceptions import BadPortableStorageSignature
+from levin.constants import *
+
+log = logging.getLogger()
+
+IN = 0
+OUT = 1
+# endpoint of our own side of a dumped frame
+LOCAL = 'local'
+
+# dump file: magic and version, then records of time (unix seconds),
+# direction, len(peer), len(data), the peer as 'host:port' and the data
+DUMP_MAGIC = b'LEVINDMP'
+DUMP_VERSION = 1
+_DUMP_HEADER = struct.Struct('<8sH')
+_RECORD = struct.Struct('<dBBI')
+
+# libpcap magic -> (byte order, timestamp resolution)
+_PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+_PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'
+_LINKTYPE_NULL = 0
+_LINKTYPE_ETHERNET = 1
+_LINKTYPE_RAW = (12, 14, 101)
+_LINKTYPE_LINUX_SLL = 113
+_LINKTYPE_LINUX_SLL2 = 276
+_ETHERTYPE_IPV4 = 0x0800
+_ETHERTYPE_IPV6 = 0x86dd
+_ETHERTYPE_VLAN = (0x8100, 0x88a8)
+_BE16 = struct.Struct('>H')
+_TCP = struct.Struct('>HHI')
+_TCP_FIN = 0x01
+_TCP_SYN = 0x02
+_TCP_RST = 0x04
+_SEQ_MASK = 0xffffffff
+
+_SIGNATURE = bytes(LEVIN_SIGNATURE)
+
+FIELDS = ('file', 'time', 'source', 'destination', 'command', 'name', 'response', 'return_code', 'size',
+          'summary', 'error')
+
+
+class Chunk(tuple):
+    """
+    (time, source, destination, data): stream bytes sent from `source` to
+    `destination` ('host:port', or LOCAL for our side of a dump) at `time`
+    (unix seconds). `data` is a memoryview of the mapped file, or None
+    where bytes of the stream are missing from the capture.
+    """
+    __slots__ = ()
+
+    time = property(lambda self: self[0])
+    source = property(lambda self: self[1])
+    destination = property(lambda self: self[2])
+    data = property(lambda self: self[3])
+
+
+class Frame(tuple):
+    """
+    (time, source, destination, bucket, error): a bucket framed from a
+    replayed stream. `error` is the decode error of its payload, if any.
+    """
+    __slots__ = ()
+
+    time = property(lambda self: self[0])
+    source = property(lambda self: self[1])
+    destination = property(lambda self: self[2])
+    bucket = property(lambda self: self[3])
+    error = property(lambda self: self[4])
+
+
+class ReplayStats:
+    __slots__ = ('files', 'chunks', 'bytes', 'frames', 'decode_errors', 'stream_errors', 'gaps', 'skipped')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def add(self, other: 'ReplayStats'):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def __repr__(self):
+        return '<ReplayStats %s>' % ' '.join('%s=%d' % (name, getattr(self, name)) for name in self.__slots__)
+
+
+def endpoint(peer) -> str:
+    """'host:port' of a (host, port) tuple; IPv6 hosts in brackets"""
+    if isinstance(peer, str):
+        return peer
+    host, port = peer[0], peer[1]
+    if ':' in host:
+        return '[%s]:%d' % (host, port)
+    return '%s:%d' % (host, port)
+
+
+def record_header(timestamp: float, direction: int, peer, size: int) -> bytes:
+    """Dump record header for `size` bytes of data, which follow it in the file"""
+    peer = endpoint(peer).encode('ascii')[:255]
+    return _RECORD.pack(timestamp, direction, len(peer), size) + peer
+
+
+class DumpWriter:
+    """
+    Appends records to a dump file, writing the file header first if the
+    file is new. Not thread-safe.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(_DUMP_HEADER.pack(DUMP_MAGIC, DUMP_VERSION))
+        self.size = self._file.tell()
+
+    def write(self, data, peer, direction: int, timestamp: float = None):
+        header = record_header(time.time() if timestamp is None else timestamp, direction, peer, len(data))
+        self._file.write(header)
+        self._file.write(data)
+        self.size += len(header) + len(data)
+
+    def write_raw(self, data):
+        """Appends already packed records"""
+        self._file.write(data)
+        self.size += len(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _map(path: str):
+    """Read-only mapping of `path`, or None if it is empty"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapped, 'madvise'):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    return mapped
+
+
+def _unmap(mapped: mmap.mmap, view: memoryview):
+    try:
+        view.release()
+        mapped.close()
+    except BufferError:
+        # chunks still referenced by the caller; the mapping goes with them
+        pass
+
+
+def read_dump(path: str):
+    """Chunks of a dump file, one per record"""
+    mapped = _map(path)
+    if mapped is None:
+        return
+    view = memoryview(mapped)
+    try:
+        if len(mapped) < _DUMP_HEADER.size:
+            raise IOError("%s: not a dump file" % path)
+        magic, version = _DUMP_HEADER.unpack_from(mapped)
+        if magic != DUMP_MAGIC:
+            raise IOError("%s: not a dump file" % path)
+        if version != DUMP_VERSION:
+            raise IOError("%s: unsupported dump version %d" % (path, version))
+
+        size = len(mapped)
+        offset = _DUMP_HEADER.size
+        peers = {}
+        while offset < size:
+            if offset + _RECORD.size > size:
+                log.warning("%s: truncated record at %d", path, offset)
+                break
+            timestamp, direction, peer_size, length = _RECORD.unpack_from(mapped, offset)
+            start = offset + _RECORD.size + peer_size
+            end = start + length
+            if end > size:
+                log.warning("%s: truncated record at %d", path, offset)
+                break
+            raw = mapped[start - peer_size:start]
+            peer = peers.get(raw)
+            if peer is None:
+                peer = peers[raw] = raw.decode('ascii')
+            offset = end
+
+            if direction == IN:
+                yield Chunk((timestamp, peer, LOCAL, view[start:end]))
+            else:
+                yield Chunk((timestamp, LOCAL, peer, view[start:end]))
+    finally:
+        _unmap(mapped, view)
+
+
+class _Flow:
+    """Reassembly state of one direction of a TCP connection"""
+    __slots__ = ('source', 'destination', 'next', 'pending', 'pending_size')
+
+    def __init__(self, source: str, destination: str):
+        self.source = source
+        self.destination = destination
+        self.next = None
+        # out of order segments: seq -> bytes
+        self.pending = {}
+        self.pending_size = 0
+
+    def segment(self, seq: int, data, max_pending: int):
+        """The in-order data made available by a segment; None marks bytes lost for good"""
+        if self.next is None:
+            # capture started mid-connection
+            self.next = seq
+        rel = _distance(self.next, seq)
+        if rel < 0:
+            # retransmission, possibly with some new data at the end
+            if -rel >= len(data):
+                return
+            data = data[-rel:]
+        elif rel > 0:
+            if len(data) > len(self.pending.get(seq, b'')):
+                self.pending_size += len(data) - len(self.pending.get(seq, b''))
+                self.pending[seq] = bytes(data)
+            if self.pending_size > max_pending:
+                # the missing segment is not coming; skip ahead to what we have
+                self.next = min(self.pending, key=lambda s: _distance(self.next, s))
+                yield None
+                yield from self._drain()
+            return
+
+        self.next = (self.next + len(data)) & _SEQ_MASK
+        yield data
+        if self.pending:
+            yield from self._drain()
+
+    def _drain(self):
+        while self.pending:
+            ready = [seq for seq in self.pending if _distance(self.next, seq) <= 0]
+            if not ready:
+                break
+            for seq in sorted(ready, key=lambda s: _distance(self.next, s)):
+                data = self.pending.pop(seq)
+                self.pending_size -= len(data)
+                overlap = -_distance(self.next, seq)
+                if overlap < len(data):
+                    data = data[overlap:]
+                    self.next = (self.next + len(data)) & _SEQ_MASK
+                    yield data
+
+
+def _distance(a: int, b: int) -> int:
+    """b - a in sequence number space"""
+    d = (b - a) & _SEQ_MASK
+    return d - 0x100000000 if d & 0x80000000 else d
+
+
+def _ip_start(linktype: int, packet, start: int, end: int):
+    """(offset of the IP header, version) in a captured packet, or None"""
+    if linktype == _LINKTYPE_ETHERNET:
+        offset, ethertype = start + 14, _BE16.unpack_from(packet, start + 12)[0]
+        while ethertype in _ETHERTYPE_VLAN and offset + 4 <= end:
+            ethertype = _BE16.unpack_from(packet, offset + 2)[0]
+            offset += 4
+    elif linktype == _LINKTYPE_LINUX_SLL:
+        offset, ethertype = start + 16, _BE16.unpack_from(packet, start + 14)[0]
+    elif linktype == _LINKTYPE_LINUX_SLL2:
+        offset, ethertype = start + 20, _BE16.unpack_from(packet, start)[0]
+    elif linktype == _LINKTYPE_NULL:
+        # address family in the byte order of the capturing host
+        family = packet[start] or packet[start + 3]
+        offset, ethertype = start + 4, _ETHERTYPE_IPV4 if family == 2 else _ETHERTYPE_IPV6
+    elif linktype in _LINKTYPE_RAW:
+        offset, ethertype = start, _ETHERTYPE_IPV4 if packet[start] >> 4 == 4 else _ETHERTYPE_IPV6
+    else:
+        return None
+
+    if offset >= end:
+        return None
+    if ethertype == _ETHERTYPE_IPV4:
+        return offset, 4
+    if ethertype == _ETHERTYPE_IPV6:
+        return offset, 6
+    return None
+
+
+def read_pcap(path: str, max_pending: int = 4 * 1024 * 1024):
+    """
+    Chunks of the reassembled TCP streams of a libpcap file, in capture
+    order. Retransmitted bytes are dropped and out of order segments held
+    back until the gap before them is filled; when more than `max_pending`
+    bytes of a stream wait on a segment that never came, a chunk with
+    `data=None` marks the loss and the stream continues after it. IPv4
+    fragments and IPv6 extension headers are not handled.
+    """
+    mapped = _map(path)
+    if mapped is None:
+        return
+    view = memoryview(mapped)
+    try:
+        if len(mapped) < 24 or mapped[:4] not in _PCAP_MAGIC:
+            raise IOError("%s: not a pcap file" % path)
+        endian, resolution = _PCAP_MAGIC[mapped[:4]]
+        linktype = struct.unpack_from(endian + 'I', mapped, 20)[0] & 0xffff
+        header = struct.Struct(endian + 'IIII')
+
+        flows = {}
+        size = len(mapped)
+        offset = 24
+        while offset + header.size <= size:
+            seconds, fraction, captured, _ = header.unpack_from(mapped, offset)
+            start = offset + header.size
+            end = start + captured
+            if end > size:
+                log.warning("%s: truncated packet at %d", path, offset)
+                break
+            offset = end
+
+            ip = _ip_start(linktype, mapped, start, end)
+            if ip is None:
+                continue
+            ip, version = ip
+            if version == 4:
+                if end - ip < 20 or mapped[ip + 9] != 6 or _BE16.unpack_from(mapped, ip + 6)[0] & 0x3fff:
+                    continue
+                tcp = ip + (mapped[ip] & 0x0f) * 4
+                ip_end = min(end, ip + _BE16.unpack_from(mapped, ip + 2)[0])
+                addresses = mapped[ip + 12:ip + 20]
+            else:
+                if end - ip < 40 or mapped[ip + 6] != 6:
+                    continue
+                tcp = ip + 40
+                ip_end = min(end, tcp + _BE16.unpack_from(mapped, ip + 4)[0])
+                addresses = mapped[ip + 8:ip + 40]
+            if tcp + 20 > ip_end:
+                continue
+
+            source_port, destination_port, seq = _TCP.unpack_from(mapped, tcp)
+            flags = mapped[tcp + 13]
+            key = (addresses, source_port, destination_port)
+            flow = flows.get(key)
+            if flow is None:
+                flow = flows[key] = _new_flow(addresses, source_port, destination_port)
+            if flags & _TCP_SYN:
+                flow.next = (seq + 1) & _SEQ_MASK
+                flow.pending.clear()
+                flow.pending_size = 0
+
+            data_start = tcp + (mapped[tcp + 12] >> 4) * 4
+            if data_start < ip_end:
+                timestamp = seconds + fraction * resolution
+                for data in flow.segment(seq, view[data_start:ip_end], max_pending):
+                    yield Chunk((timestamp, flow.source, flow.destination, data))
+            if flags & (_TCP_FIN | _TCP_RST):
+                del flows[key]
+    finally:
+        _unmap(mapped, view)
+
+
+def _new_flow(addresses: bytes, source_port: int, destination_port: int) -> _Flow:
+    if len(addresses) == 8:
+        source, destination = socket.inet_ntoa(addresses[:4]), socket.inet_ntoa(addresses[4:])
+    else:
+        source = socket.inet_ntop(socket.AF_INET6, addresses[:16])
+        destination = socket.inet_ntop(socket.AF_INET6, addresses[16:])
+    return _Flow(endpoint((source, source_port)), endpoint((destination, destination_port)))
+
+
+def chunks(path: str, **options):
+    """Chunks of a pcap or dump file, told apart by their magic"""
+    with open(path, 'rb') as f:
+        magic = f.read(8)
+    if magic == DUMP_MAGIC:
+        return read_dump(path)
+    if magic[:4] in _PCAP_MAGIC:
+        return read_pcap(path, **options)
+    if magic[:4] == _PCAPNG_MAGIC:
+        raise IOError("%s: pcapng is not supported, convert it with `editcap -F pcap`" % path)
+    raise IOError("%s: unknown capture format" % path)
+
+
+def replay(path: str, decode: bool = True, max_packet_size: int = LEVIN_DEFAULT_MAX_PACKET_SIZE,
+           spill_threshold: int = None, stats: ReplayStats = None, **options):
+    """
+    Frames of every Levin stream in the capture at `path`, as a generator.
+    Each stream is framed by its own `LevinFrameDecoder`; a stream that
+    fails to frame, or has bytes missing, is out of sync and skipped up to
+    the next Levin signature. Payloads are decoded with the reader
+    `options` (lazy, native, schema, limits, ...) unless `decode=False`; a
+    payload that fails to decode is still yielded, with its error.
+    """
+    if stats is None:
+        stats = ReplayStats()
+    stats.files += 1
+    # (source, destination) -> LevinFrameDecoder, None while out of sync
+    streams = {}
+
+    for chunk in chunks(path):
+        stats.chunks += 1
+        key = (chunk[1], chunk[2])
+        data = chunk[3]
+        if data is None:
+            stats.gaps += 1
+            streams[key] = None
+            continue
+
+        stats.bytes += len(data)
+        decoder = streams.get(key)
+        if decoder is None:
+            i = bytes(data).find(_SIGNATURE)
+            if i < 0:
+                stats.skipped += len(data)
+                continue
+            stats.skipped += i
+            data = data[i:]
+            decoder = streams[key] = LevinFrameDecoder(max_packet_size, decode=False,
+                                                        spill_threshold=spill_threshold)
+        try:
+            buckets = decoder.feed(data)
+        except IOError as e:
+            stats.stream_errors += 1
+            log.debug("%s: %s -> %s out of sync: %s", path, key[0], key[1], e)
+            streams[key] = None
+            continue
+
+        for bucket in buckets:
+            error = None
+            if decode:
+                try:
+                    bucket.read_payload(bucket.payload, **options)
+                except (IOError, ValueError, BadPortableStorageSignature) as e:
+                    stats.decode_errors += 1
+                    error = str(e) or type(e).__name__
+            stats.frames += 1
+            yield Frame((chunk[0], key[0], key[1], bucket, error))
+
+
+def _count(value) -> int:
+    return len(value) if value is not None else 0
+
+
+def _int(value):
+    return value.value if hasattr(value, 'value') else value
+
+
+def _sync_summary(e) -> dict:
+    summary = {'peers': _count(e.get('local_peerlist_new'))}
+    payload = e.get('payload_data')
+    if isinstance(payload, Section) and 'current_height' in payload.entries:
+        summary['height'] = _int(payload.entries['current_height'])
+    return summary
+
+
+def _block_summary(e) -> dict:
+    block = e.get('b')
+    summary = {'height': _int(e.get('current_blockchain_height'))}
+    if isinstance(block, Section):
+        summary['txs'] = _count(block.entries.get('txs'))
+    return summary
+
+
+# command -> summary of a decoded Section's entries, for the records
+SUMMARIES = {
+    P2P_COMMAND_HANDSHAKE.value: _sync_summary,
+    P2P_COMMAND_TIMED_SYNC.value: _sync_summary,
+    NOTIFY_NEW_BLOCK.value: _block_summary,
+    NOTIFY_NEW_FLUFFY_BLOCK.value: _block_summary,
+    NOTIFY_NEW_TRANSACTIONS.value: lambda e: {'txs': _count(e.get('txs'))},
+    NOTIFY_REQUEST_GET_OBJECTS.value: lambda e: {'blocks': _count(e.get('blocks')) // 32},
+    NOTIFY_RESPONSE_GET_OBJECTS.value: lambda e: {'blocks': _count(e.get('blocks')),
+                                                  'height': _int(e.get('current_blockchain_height'))},
+    NOTIFY_REQUEST_CHAIN.value: lambda e: {'block_ids': _count(e.get('block_ids')) // 32},
+    NOTIFY_RESPONSE_CHAIN_ENTRY.value: lambda e: {'start_height': _int(e.get('start_height')),
+                                                  'total_height': _int(e.get('total_height')),
+                                                  'block_ids': _count(e.get('m_block_ids')) // 32},
+}
+
+
+def record(frame: Frame, path: str = None) -> dict:
+    """A JSON-able record of a replayed frame; see FIELDS"""
+    bucket = frame[3]
+    command = bucket.command.value
+    error = frame[4]
+    summary = None
+    section = bucket.payload_section
+    if error is None and isinstance(section, Section) and command in SUMMARIES:
+        try:
+            summary = SUMMARIES[command](section.entries)
+        except (IOError, ValueError, TypeError) as e:
+            error = str(e) or type(e).__name__
+    return {
+        'file': path,
+        'time': frame[0],
+        'source': frame[1],
+        'destination': frame[2],
+        'command': command,
+        'name': P2P_COMMANDS.get(command),
+        'response': bucket.is_response,
+        'return_code': bucket.return_code.value,
+        'size': bucket.cb.value,
+        'summary': summary,
+        'error': error,
+    }
+
+
+def write_records(path: str, out, fmt: str = 'jsonl', **options) -> ReplayStats:
+    """Replays `path`, writing a record per frame to the text file `out` as JSON lines or CSV rows"""
+    stats = ReplayStats()
+    options.setdefault('native', True)
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        for frame in replay(path, stats=stats, **options):
+            r = record(frame, path)
+            if r['summary'] is not None:
+                r['summary'] = ' '.join('%s=%s' % item for item in r['summary'].items())
+            writer.writerow([r[field] for field in FIELDS])
+    else:
+        for frame in replay(path, stats=stats, **options):
+            out.write(json.dumps(record(frame, path)))
+            out.write('\n')
+    return stats
+
+
+def _write_part(job: tuple) -> tuple:
+    path, part, fmt, options = job
+    with open(part, 'w', newline='') as out:
+        return part, write_records(path, out, fmt, **options)
+
+
+def replay_files(paths: list, output: str, processes: int = None, **options) -> ReplayStats:
+    """
+    Replays capture files in parallel, one per process of a pool, into
+    `output`: CSV if it ends in `.csv`, else JSON lines. The records of each
+    file go to a part file next to `output` and are appended to it in the
+    order of `paths`. `options` are those of `replay()`.
+    """
+    fmt = 'csv' if output.endswith('.csv') else 'jsonl'
+    processes = min(processes or multiprocessing.cpu_count(), len(paths))
+    stats = ReplayStats()
+
+    with open(output, 'w', newline='') as out:
+        if fmt == 'csv':
+            csv.writer(out).writerow(FIELDS)
+        if processes <= 1:
+            for path in paths:
+                stats.add(write_records(path, out, fmt, **options))
+            return stats
+
+        jobs = [(path, '%s.%d.part' % (output, i), fmt, options) for i, path in enumerate(paths)]
+        try:
+            with multiprocessing.Pool(processes) as pool:
+                for part, part_stats in pool.imap(_write_part, jobs):
+                    with open(part, newline='') as f:
+                        shutil.copyfileobj(f, out)
+                    os.remove(part)
+                    stats.add(part_stats)
+        finally:
+            for _, part, _, _ in jobs:
+                if os.path.exists(part):
+                    os.remove(part)
+    return stats
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Decode pcap or dump captures into per-frame JSONL/CSV records')
+    parser.add_argument('output', help='records file; CSV if it ends in .csv, else JSON lines')
+    parser.add_argument('captures', nargs='+')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--no-decode', action='store_true', help='frame only, without decoding payloads')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    started = time.monotonic()
+    stats = replay_files(args.captures, args.output, processes=args.processes, decode=not args.no_decode)
+    sys.stderr.write('%r in %.1fs\n' % (stats, time.monotonic() - started))
+
+
+if __name__ == '__main__':
+    main()
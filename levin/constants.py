@@ -5,6 +5,7 @@ LEVIN_SIGNATURE = c_uint64(0x0101010101012101)  # Bender's nightmare
 LEVIN_PACKET_REQUEST = c_uint32(0x00000001)
 LEVIN_PACKET_RESPONSE = c_uint32(0x00000002)
 LEVIN_DEFAULT_MAX_PACKET_SIZE = 100000000  # 100MB
+LEVIN_HEADER_SIZE = 33
 LEVIN_PROTOCOL_VER_1 = c_uint32(1)
 LEVIN_ERROR_CONNECTION = -1
 LEVIN_ERROR_CONNECTION_NOT_FOUND = -2
@@ -34,6 +35,31 @@ P2P_COMMANDS = {
     P2P_COMMAND_REQUEST_PEER_ID: 'peer_id',
 }
 
+# src/cryptonote_protocol/cryptonote_protocol_defs.h
+BC_COMMANDS_POOL_BASE = c_uint32(2000)
+NOTIFY_NEW_BLOCK = c_uint32(BC_COMMANDS_POOL_BASE + 1)
+NOTIFY_NEW_TRANSACTIONS = c_uint32(BC_COMMANDS_POOL_BASE + 2)
+NOTIFY_REQUEST_GET_OBJECTS = c_uint32(BC_COMMANDS_POOL_BASE + 3)
+NOTIFY_RESPONSE_GET_OBJECTS = c_uint32(BC_COMMANDS_POOL_BASE + 4)
+NOTIFY_REQUEST_CHAIN = c_uint32(BC_COMMANDS_POOL_BASE + 6)
+NOTIFY_RESPONSE_CHAIN_ENTRY = c_uint32(BC_COMMANDS_POOL_BASE + 7)
+NOTIFY_NEW_FLUFFY_BLOCK = c_uint32(BC_COMMANDS_POOL_BASE + 8)
+NOTIFY_REQUEST_FLUFFY_MISSING_TX = c_uint32(BC_COMMANDS_POOL_BASE + 9)
+NOTIFY_GET_TXPOOL_COMPLEMENT = c_uint32(BC_COMMANDS_POOL_BASE + 10)
+BC_COMMANDS = {
+    NOTIFY_NEW_BLOCK: 'new_block',
+    NOTIFY_NEW_TRANSACTIONS: 'new_transactions',
+    NOTIFY_REQUEST_GET_OBJECTS: 'request_get_objects',
+    NOTIFY_RESPONSE_GET_OBJECTS: 'response_get_objects',
+    NOTIFY_REQUEST_CHAIN: 'request_chain',
+    NOTIFY_RESPONSE_CHAIN_ENTRY: 'response_chain_entry',
+    NOTIFY_NEW_FLUFFY_BLOCK: 'new_fluffy_block',
+    NOTIFY_REQUEST_FLUFFY_MISSING_TX: 'request_fluffy_missing_tx',
+    NOTIFY_GET_TXPOOL_COMPLEMENT: 'get_txpool_complement',
+}
+# every command accepted off the wire
+P2P_COMMANDS.update(BC_COMMANDS)
+
 PORTABLE_STORAGE_SIGNATUREA = c_uint32(0x01011101)
 PORTABLE_STORAGE_SIGNATUREB = c_uint32(0x01020101)
 PORTABLE_STORAGE_FORMAT_VER = c_ubyte(1)
@@ -45,6 +71,10 @@ PORTABLE_RAW_SIZE_MARK_INT64 = c_ubyte(3)
 
 MAX_STRING_LEN_POSSIBLE = 2000000000  # do not let string be so big
 
+# default decoder limits, see contrib/epee/include/storages/portable_storage_from_bin.h
+PORTABLE_STORAGE_RECURSION_LIMIT = 100
+PORTABLE_STORAGE_OBJECT_LIMIT = 65536
+
 # data types (boost serialization)
 SERIALIZE_TYPE_INT64 = c_ubyte(1)
 SERIALIZE_TYPE_INT32 = c_ubyte(2)
@@ -0,0 +1,435 @@
+import asyncio
+import csv
+import logging
+import multiprocessing
+import os
+import random
+import selectors
+import struct
+import sys
+import time
+
+from levin.aio import LevinConnection
+from levin.peerstore import PeerStore
+from levin.template import handshake_template
+from levin.utils import pack_address, unpack_address
+from levin.constants import *
+
+log = logging.getLogger()
+
+
+class EdgeWriter:
+    """
+    Streams discovered edges as CSV rows to disk:
+
+        node_host,node_port,peer_host,peer_port,last_seen
+    """
+    FIELDS = ('node_host', 'node_port', 'peer_host', 'peer_port', 'last_seen')
+
+    def __init__(self, path: str = None, fileobj=None):
+        self._owned = fileobj is None and path is not None
+        self.fileobj = fileobj or (open(path, 'w', newline='', buffering=1 << 16) if path else None)
+        self._csv = csv.writer(self.fileobj) if self.fileobj else None
+        self.edges = 0
+        if self._csv:
+            self._csv.writerow(self.FIELDS)
+
+    def write(self, node: tuple, peers: list):
+        self.edges += len(peers)
+        if self._csv:
+            self._csv.writerows((node[0], node[1], p[0], p[1], p[2]) for p in peers)
+
+    def close(self):
+        if self._owned:
+            self.fileobj.close()
+        elif self.fileobj:
+            self.fileobj.flush()
+
+
+class CrawlStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self.nodes_ok = 0
+        self.nodes_failed = 0
+        self.retries = 0
+        self.edges = 0
+        self.discovered = 0
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def nodes_per_sec(self) -> float:
+        return (self.nodes_ok + self.nodes_failed) / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return '<CrawlStats ok=%d failed=%d retries=%d edges=%d discovered=%d %.1fs %.1f nodes/s>' % (
+            self.nodes_ok, self.nodes_failed, self.retries, self.edges, self.discovered,
+            self.elapsed, self.nodes_per_sec)
+
+
+class Crawler:
+    """
+    Breadth-first crawl of the network starting from `seeds`. Every node gets
+    a handshake; the peers it advertises are written out as edges and queued
+    if not visited before. At most `concurrency` connections are in flight.
+
+        crawler = Crawler(output='edges.csv', concurrency=2000)
+        stats = asyncio.run(crawler.run())
+    """
+    def __init__(
+        self,
+        seeds: list = None,
+        concurrency: int = 1000,
+        timeout: float = 10.0,
+        retries: int = 1,
+        backoff: float = 2.0,
+        max_depth: int = None,
+        max_nodes: int = None,
+        output: str = None,
+        network_id: bytes = None,
+        store=None,
+    ):
+        self.seeds = list(seeds or SEED_NODES)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.network_id = network_id
+        self.edges = output if isinstance(output, EdgeWriter) else EdgeWriter(output)
+        self.store = store
+        self.stats = CrawlStats()
+        self.visited = set()
+
+        self._queue = None
+        self._pending = 0
+        self._done = None
+
+    def _enqueue(self, node: tuple, depth: int):
+        if node in self.visited:
+            return
+        if self.max_nodes is not None and len(self.visited) >= self.max_nodes:
+            return
+        self.visited.add(node)
+        self.stats.discovered += 1
+        self._pending += 1
+        self._queue.put_nowait((node, depth, 0))
+
+    def _retry_later(self, item: tuple):
+        node, depth, attempt = item
+        self.stats.retries += 1
+        self._pending += 1
+        delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, (node, depth, attempt + 1))
+
+    def _finish(self):
+        self._pending -= 1
+        if not self._pending:
+            self._done.set()
+
+    def _record(self, node: tuple, peers: list):
+        self.edges.write(node, peers)
+        self.stats.edges = self.edges.edges
+        if self.store is not None:
+            self.store.add(peers, source=node)
+
+    async def handshake(self, host: str, port: int) -> list:
+        """Returns [(ip, port, last_seen, id), ...] advertised by host:port; id is None if not given"""
+        conn = await LevinConnection.connect(host, port, timeout=self.timeout)
+        try:
+            frame = handshake_template(self.network_id).render(my_port=0, peer_id=random.getrandbits(64))
+            bucket = await conn.request(P2P_COMMAND_HANDSHAKE, frame=frame, timeout=self.timeout)
+        finally:
+            await conn.close()
+
+        peers = bucket.get_peers() or []
+        return [(p['ip'].ip, p['port'].value, p['last_seen'].value if 'last_seen' in p else '',
+                 p['id'].value if 'id' in p else None) for p in peers]
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            node, depth, attempt = item
+            try:
+                peers = await self.handshake(*node)
+            except Exception as e:
+                log.debug("%s:%d failed (attempt %d): %s", node[0], node[1], attempt, e)
+                if attempt < self.retries:
+                    self._retry_later(item)
+                else:
+                    self.stats.nodes_failed += 1
+            else:
+                self.stats.nodes_ok += 1
+                self._record(node, peers)
+                if self.max_depth is None or depth < self.max_depth:
+                    for peer in peers:
+                        self._enqueue((peer[0], peer[1]), depth + 1)
+            finally:
+                self._finish()
+
+    async def run(self) -> CrawlStats:
+        self._queue = asyncio.Queue()
+        self._done = asyncio.Event()
+        self.stats = CrawlStats()
+
+        for host, port in self.seeds:
+            self._enqueue((host, port), 0)
+        if not self._pending:
+            self._done.set()
+
+        workers = [asyncio.ensure_future(self._worker()) for _ in range(self.concurrency)]
+        try:
+            await self._done.wait()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.edges.close()
+            if self.store is not None:
+                self.store.flush()
+            self.stats.finished = time.monotonic()
+        return self.stats
+
+
+# binary channel between ShardedCrawler and its worker processes
+_ENDPOINT = struct.Struct('<16sH')  # target: address, port
+_RESULT = struct.Struct('<16sHBH')  # node: address, port, ok, peer count
+_PEER = struct.Struct('<16sHBqQ')  # advertised peer: address, port, flags, last_seen, id
+_HAS_LAST_SEEN, _HAS_ID = 1, 2  # flags of a _PEER record; without them the peer gave no last_seen / id
+_MAX_PEERS = 0xffff  # peer count field of _RESULT; Monero sends at most 250
+
+
+async def _shard_worker(targets, conn, concurrency: int, **options):
+    loop = asyncio.get_running_loop()
+    crawler = Crawler(concurrency=concurrency, **options)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = bytearray()
+    tasks = set()
+    scheduled = []
+    sending = None
+
+    def flush():
+        # once per loop iteration, coalescing every result completed in it; a send
+        # blocks until the parent reads, so it runs in a thread, one at a time
+        nonlocal sending
+        scheduled.clear()
+        if results and sending is None:
+            sending = loop.run_in_executor(None, conn.send_bytes, bytes(results))
+            sending.add_done_callback(sent)
+            results.clear()
+
+    def sent(future):
+        nonlocal sending
+        sending = None
+        if not future.cancelled() and future.exception() is not None:
+            log.error("results lost: %s", future.exception())
+        flush()
+
+    async def visit(address: bytes, port: int):
+        try:
+            peers = await handshake(address, port)
+            record = bytearray(_RESULT.pack(address, port, peers is not None, min(len(peers or ()), _MAX_PEERS)))
+            for ip, peer_port, last_seen, _id in (peers or ())[:_MAX_PEERS]:
+                flags = (_HAS_LAST_SEEN if last_seen != '' else 0) | (_HAS_ID if _id is not None else 0)
+                record += _PEER.pack(pack_address(ip), peer_port, flags, last_seen or 0, _id or 0)
+        except Exception as e:
+            # e.g. a peer list entry that does not fit its record; the parent must still hear of the node
+            log.debug("%s:%d failed: %s", unpack_address(address), port, e)
+            record = _RESULT.pack(address, port, False, 0)
+        results.extend(record)
+        if not scheduled:
+            scheduled.append(loop.call_soon(flush))
+
+    async def handshake(address: bytes, port: int) -> list:
+        host = unpack_address(address)
+        async with semaphore:
+            for attempt in range(crawler.retries + 1):
+                try:
+                    peers = await crawler.handshake(host, port)
+                    break
+                except Exception as e:
+                    log.debug("%s:%d failed (attempt %d): %s", host, port, attempt, e)
+                    if attempt < crawler.retries:
+                        await asyncio.sleep(crawler.backoff * (2 ** attempt) * (0.5 + random.random()))
+            else:
+                peers = None
+        return peers
+
+    # targets arrive as a stream of _ENDPOINT records, ending when the parent closes it
+    received = bytearray()
+    while True:
+        data = await loop.run_in_executor(None, os.read, targets.fileno(), 1 << 16)
+        if not data:
+            break
+        received += data
+        whole = len(received) - len(received) % _ENDPOINT.size
+        for address, port in _ENDPOINT.iter_unpack(bytes(received[:whole])):
+            task = asyncio.ensure_future(visit(address, port))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        del received[:whole]
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    flush()
+    while sending is not None:
+        await asyncio.wait((sending,))
+
+
+def _shard_main(targets, conn, concurrency: int, options: dict, parent_ends: list):
+    # a forked worker inherits the parent's pipe ends, its own included; closed
+    # here, the parent closing this worker's targets reaches it as end of file
+    for pipe in parent_ends:
+        pipe.close()
+    asyncio.run(_shard_worker(targets, conn, concurrency, **options))
+    conn.close()
+    targets.close()
+
+
+class ShardedCrawler(Crawler):
+    """
+    Crawler spreading the handshakes over `workers` processes, each running
+    its own event loop with up to `concurrency` connections. The parent keeps
+    the visited set and edge file; targets and results cross the process
+    boundary as packed fixed-width records (`_ENDPOINT`, `_RESULT`, `_PEER`)
+    over pipes, one each way per worker. Neither end blocks on a send: the
+    parent writes targets as the pipe takes them and reads results meanwhile,
+    workers send from a thread. Endpoints are sharded by hash, so a node is
+    always handled by the same worker.
+
+        stats = ShardedCrawler(output='edges.csv', workers=8).run()
+    """
+    def __init__(self, workers: int = None, **kwargs):
+        super(ShardedCrawler, self).__init__(**kwargs)
+        self.workers = workers or multiprocessing.cpu_count()
+        self._depth = {}
+        self._outbox = None
+
+    def _enqueue(self, node: tuple, depth: int):
+        if node in self._depth:
+            return
+        if self.max_nodes is not None and len(self._depth) >= self.max_nodes:
+            return
+        self._depth[node] = depth
+        self.stats.discovered += 1
+        self._pending += 1
+        self._outbox[hash(node) % self.workers].extend(_ENDPOINT.pack(pack_address(node[0]), node[1]))
+
+    def _on_results(self, data: bytes):
+        view = memoryview(data)
+        offset = 0
+        while offset < len(view):
+            address, port, ok, count = _RESULT.unpack_from(view, offset)
+            offset += _RESULT.size
+            node = (unpack_address(address), port)
+            # as Crawler.handshake() has them: '' and None for what the peer did not give
+            peers = [(unpack_address(a), p, s if f & _HAS_LAST_SEEN else '', i if f & _HAS_ID else None)
+                     for a, p, f, s, i in _PEER.iter_unpack(view[offset:offset + count * _PEER.size])]
+            offset += count * _PEER.size
+            self._pending -= 1
+
+            if not ok:
+                self.stats.nodes_failed += 1
+                continue
+
+            self.stats.nodes_ok += 1
+            self._record(node, peers)
+            depth = self._depth[node]
+            if self.max_depth is None or depth < self.max_depth:
+                for peer in peers:
+                    self._enqueue((peer[0], peer[1]), depth + 1)
+
+    def run(self) -> CrawlStats:
+        self.stats = CrawlStats()
+        self._depth = {}
+        self._pending = 0
+        self._outbox = [bytearray() for _ in range(self.workers)]
+
+        options = dict(timeout=self.timeout, retries=self.retries, backoff=self.backoff,
+                       network_id=self.network_id)
+        targets, results, processes = [], [], []
+        for _ in range(self.workers):
+            targets_in, targets_out = multiprocessing.Pipe(duplex=False)
+            results_in, results_out = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_shard_main, daemon=True, args=(
+                targets_in, results_out, self.concurrency, options, targets + results + [targets_out, results_in]))
+            process.start()
+            targets_in.close()
+            results_out.close()
+            os.set_blocking(targets_out.fileno(), False)
+            targets.append(targets_out)
+            results.append(results_in)
+            processes.append(process)
+
+        # results are read whenever a worker has some, also while targets are still
+        # being written: a blocking send either way could stall both ends
+        selector = selectors.DefaultSelector()
+        for pipe in results:
+            selector.register(pipe, selectors.EVENT_READ)
+        writing = set()
+        try:
+            for host, port in self.seeds:
+                self._enqueue((host, port), 0)
+
+            while self._pending:
+                for i, (pipe, outbox) in enumerate(zip(targets, self._outbox)):
+                    if outbox and i not in writing:
+                        selector.register(pipe, selectors.EVENT_WRITE, i)
+                        writing.add(i)
+                    elif not outbox and i in writing:
+                        selector.unregister(pipe)
+                        writing.discard(i)
+                for key, events in selector.select():
+                    if events & selectors.EVENT_READ:
+                        self._on_results(key.fileobj.recv_bytes())
+                        continue
+                    outbox = self._outbox[key.data]
+                    try:
+                        del outbox[:os.write(key.fd, outbox)]
+                    except BlockingIOError:
+                        pass
+        finally:
+            selector.close()
+            # end of targets: workers finish what they have and exit
+            for pipe in targets + results:
+                pipe.close()
+            for process in processes:
+                process.join()
+            self.edges.close()
+            if self.store is not None:
+                self.store.flush()
+            self.stats.finished = time.monotonic()
+        return self.stats
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Crawl the network, writing peer edges to a CSV file')
+    parser.add_argument('output')
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--retries', type=int, default=1)
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--max-nodes', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=1, help='processes; concurrency applies per process')
+    parser.add_argument('--store', help='also record sightings in this PeerStore database')
+    args = parser.parse_args(args)
+
+    store = PeerStore(args.store) if args.store else None
+    options = dict(concurrency=args.concurrency, timeout=args.timeout, retries=args.retries,
+                   max_depth=args.max_depth, max_nodes=args.max_nodes, output=args.output, store=store)
+    if args.workers > 1:
+        stats = ShardedCrawler(workers=args.workers, **options).run()
+    else:
+        stats = asyncio.run(Crawler(**options).run())
+    if store is not None:
+        store.close()
+    sys.stderr.write('%r\n' % stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,8 @@ from levin.exceptions import BadArgumentException
 
 
 class _CType:
+    __slots__ = ('value', 'endian')
+
     def __init__(self, value, endian=None):
         self.value = value
         self.endian = endian
@@ -47,7 +49,7 @@ class _CType:
         return cls(value, endian)
 
     def to_bytes(self):
-        if isinstance(self.value, (int, bool)):
+        if isinstance(self.value, (int, bool, float)):
             type_struct = self.TYPE_STRUCT if hasattr(self, 'TYPE_STRUCT') else self.TYPE._type_
             return struct.pack('%s%s' % ('<' if self.endian == 'little' else '>', type_struct), self.value)
         elif isinstance(self.value, bytes):
@@ -55,13 +57,6 @@ class _CType:
                 return self.value[::-1]
             return self.value
 
-    def _overflows(self):
-        if isinstance(self.value, int):
-            try:
-                self.value.to_bytes(self.NBYTES, byteorder=self.endian, signed=self.SIGNED)
-            except OverflowError as e:
-                raise OverflowError("Value \'%d\' does not fit in %s." % (self.value, self.__class__.__name__))
-
     def __len__(self):
         if isinstance(self.value, bytes):
             return len(self.value)
@@ -71,7 +66,7 @@ class _CType:
         return len(bytes(self.value))
 
     def __eq__(self, other):
-        if isinstance(self.value, int):
+        if isinstance(self.value, (int, float)):
             return self.value == other
 
     def __ne__(self, other):
@@ -181,9 +176,19 @@ class _CType:
 
 
 class _IntType(_CType):
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        bits = cls.NBYTES * 8
+        cls.MIN = -(1 << (bits - 1)) if cls.SIGNED else 0
+        cls.MAX = (1 << (bits - 1)) - 1 if cls.SIGNED else (1 << bits) - 1
+
     def __init__(self, value, endian='little'):
-        super(_IntType, self).__init__(value, endian)
-        self._overflows()
+        self.value = value
+        self.endian = endian
+        if value.__class__ is int and not self.MIN <= value <= self.MAX:
+            raise OverflowError("Value \'%d\' does not fit in %s." % (value, self.__class__.__name__))
 
     def __repr__(self):
         _signed = 'unsigned' if not self.SIGNED else 'signed'
@@ -193,40 +198,32 @@ class _IntType(_CType):
 
 
 class c_int16(_IntType):
+    __slots__ = ()
     TYPE = _c_short
     NBYTES = 2
     SIGNED = True
 
-    def __init__(self, value, endian='little'):
-        super(c_int16, self).__init__(value, endian)
-
 
 class c_uint16(_IntType):
+    __slots__ = ()
     TYPE = _c_ushort
     NBYTES = 2
     SIGNED = False
 
-    def __init__(self, value, endian='little'):
-        super(c_uint16, self).__init__(value, endian)
-
 
 class c_int32(_IntType):
-    TYPE = _c_uint32
+    __slots__ = ()
+    TYPE = _c_int32
     NBYTES = 4
     SIGNED = True
 
-    def __init__(self, value, endian='little'):
-        super(c_int32, self).__init__(value, endian)
-
 
 class c_uint32(_IntType):
+    __slots__ = ()
     TYPE = _c_uint32
     NBYTES = 4
     SIGNED = False
 
-    def __init__(self, value, endian='little'):
-        super(c_uint32, self).__init__(value, endian)
-
     @property
     def ipv4(self) -> str:
         return str(ipaddress.IPv4Address(self.value))
@@ -237,28 +234,24 @@ class c_uint32(_IntType):
 
 
 class c_int64(_IntType):
+    __slots__ = ()
     TYPE = _c_uint64
     TYPE_STRUCT = 'q'
     NBYTES = 8
     SIGNED = True
 
-    def __init__(self, value, endian='little'):
-        super(c_int64, self).__init__(value, endian)
-
     @property
     def date_utc(self):
         return datetime.utcfromtimestamp(self.value)
 
 
 class c_uint64(_IntType):
+    __slots__ = ()
     TYPE = _c_uint64
     TYPE_STRUCT = 'Q'
     NBYTES = 8
     SIGNED = False
 
-    def __init__(self, value, endian='little'):
-        super(c_uint64, self).__init__(value, endian)
-
     @property
     def ipv6(self) -> str:
         val = socket.inet_ntop(socket.AF_INET6, self.value)
@@ -276,29 +269,28 @@ class c_uint64(_IntType):
 
 
 class c_byte(_IntType):
+    __slots__ = ()
     TYPE = _c_byte
     NBYTES = 1
     SIGNED = True
 
-    def __init__(self, value, endian='little'):
-        super(c_byte, self).__init__(value, endian)
-
 
 class c_bytes(_CType):
+    __slots__ = ()
+
     def __init__(self, value, endian='little'):
         super(c_bytes, self).__init__(value, endian)
 
 
 class c_ubyte(_IntType):
+    __slots__ = ()
     TYPE = _c_ubyte
     NBYTES = 1
     SIGNED = False
 
-    def __init__(self, value, endian='little'):
-        super(c_ubyte, self).__init__(value, endian)
-
 
 class c_string(_CType):
+    __slots__ = ('NBYTES',)
     ENCODING = 'ascii'
 
     def __init__(self, value):
@@ -310,6 +302,7 @@ class c_string(_CType):
 
 
 class c_bool(_CType):
+    __slots__ = ()
     TYPE_STRUCT = '?'
     NBYTES = 1
 
@@ -317,3 +310,21 @@ class c_bool(_CType):
         if value not in [True, False]:
             raise BadArgumentException('bool')
         super(c_bool, self).__init__(value)
+
+
+class c_double(_CType):
+    __slots__ = ()
+    TYPE_STRUCT = 'd'
+    NBYTES = 8
+
+    def __init__(self, value, endian='little'):
+        super(c_double, self).__init__(float(value), endian)
+
+    def __float__(self):
+        return self.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return '\'%r\' - c_double - 8 bytes' % self.value
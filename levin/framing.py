@@ -0,0 +1,162 @@
+import mmap
+import struct
+import tempfile
+import time
+
+from levin import metrics, recorder
+from levin.bucket import Bucket
+from levin.exceptions import BadPortableStorageSignature
+from levin.constants import *
+
+_SIGNATURE = bytes(LEVIN_SIGNATURE)
+_CB = struct.Struct('<Q')
+_COMMAND = struct.Struct('<I')
+_CB_END = 16
+_COMMAND_END = 21
+
+
+class LevinFrameDecoder:
+    """
+    Sans-IO Levin framing. Feed it whatever chunks arrive from the wire and
+    it returns the buckets completed by them:
+
+        decoder = LevinFrameDecoder()
+        while True:
+            for bucket in decoder.feed(sock.recv(65536)):
+                ...
+
+    The signature, payload size and command are checked as soon as their
+    bytes are in, so a bogus or oversized frame is rejected before its body
+    is buffered. A payload that fails to decode raises IOError as well.
+    After an IOError the stream is out of sync and the decoder should be
+    discarded along with the connection.
+
+    Frames are handed to an active `levin.recorder` as received from `peer`,
+    if one is given.
+
+    `decode=False` leaves `payload_section` unset; other keyword `options`
+    (lazy, native, schema, views, limits, ...) are passed on to
+    `Bucket.read_payload`.
+
+    Payloads larger than `spill_threshold` bytes (e.g. get_objects responses
+    near the 100MB packet limit) are not held in memory: they are written to
+    an anonymous temporary file as they arrive and decoded from a read-only
+    mmap of it, so `bucket.payload` is an `mmap`. Combined with `views=True`
+    the decoded blobs are slices of that mapping.
+    """
+    def __init__(self, max_packet_size: int = LEVIN_DEFAULT_MAX_PACKET_SIZE, decode: bool = True,
+                 spill_threshold: int = None, peer=None, **options):
+        self.max_packet_size = max_packet_size
+        self.decode = decode
+        self.spill_threshold = spill_threshold
+        self.peer = peer
+        self.options = options
+        self._header = bytearray()
+        # header of the frame being received, for the recorder
+        self._frame_header = None
+        self._bucket = None
+        self._payload = None
+        self._spill = None
+        self._size = 0
+        self._received = 0
+
+    @property
+    def buffered(self) -> int:
+        """bytes of the current, incomplete frame"""
+        return len(self._header) + self._received
+
+    def feed(self, data) -> list:
+        data = memoryview(data).cast('B')
+        buckets = []
+        if metrics.hooks is not None:
+            metrics.hooks.bytes_in(len(data))
+
+        while data:
+            if self._bucket is None:
+                n = LEVIN_HEADER_SIZE - len(self._header)
+                self._header += data[:n]
+                data = data[n:]
+                self._check_header()
+                if len(self._header) < LEVIN_HEADER_SIZE:
+                    break
+
+                self._bucket = Bucket.from_header(self._header, max_packet_size=self.max_packet_size)
+                self._frame_header, self._header = self._header, bytearray()
+                self._size = self._bucket.cb.value
+                self._received = 0
+                if self.spill_threshold is not None and self._size > self.spill_threshold:
+                    self._spill = tempfile.TemporaryFile()
+                else:
+                    self._payload = bytearray(self._size)
+            else:
+                n = min(len(data), self._size - self._received)
+                if self._spill is not None:
+                    self._spill.write(data[:n])
+                else:
+                    self._payload[self._received:self._received + n] = data[:n]
+                self._received += n
+                data = data[n:]
+
+            if self._received == self._size:
+                buckets.append(self._complete())
+
+        return buckets
+
+    def _check_header(self):
+        header = self._header
+        size = len(header)
+
+        if header[:8] != _SIGNATURE[:size]:
+            raise IOError("Bender's nightmare missing")
+
+        if size >= _CB_END and _CB.unpack_from(header, 8)[0] > self.max_packet_size:
+            raise IOError("payload too large")
+
+        if size >= _COMMAND_END:
+            command = _COMMAND.unpack_from(header, 17)[0]
+            if command not in P2P_COMMANDS:
+                raise IOError("unregonized command: %d" % command)
+
+    def _complete(self) -> Bucket:
+        bucket, payload = self._bucket, self._payload
+        bucket.received = time.monotonic()
+        if self._spill is not None:
+            payload = self._map(self._spill)
+        if recorder.active is not None and self.peer is not None:
+            recorder.active.frame_in(self.peer, self._frame_header, payload)
+        self._bucket = self._payload = self._spill = self._frame_header = None
+        self._size = self._received = 0
+
+        hooks = metrics.hooks
+        if hooks is None:
+            if self.decode:
+                self._decode(bucket, payload)
+            else:
+                bucket.payload = payload
+            return bucket
+
+        started = time.perf_counter()
+        if self.decode:
+            self._decode(bucket, payload)
+        else:
+            bucket.payload = payload
+        hooks.frame_in(bucket.command.value, LEVIN_HEADER_SIZE + bucket.cb.value, time.perf_counter() - started)
+        if bucket.is_response and bucket.return_code.value < 0:
+            hooks.error(bucket.return_code.value)
+        return bucket
+
+    def _decode(self, bucket: Bucket, payload):
+        try:
+            bucket.read_payload(payload, **self.options)
+        except (ValueError, BadPortableStorageSignature, struct.error) as e:
+            # e.g. a bad storage signature or a non-ascii field name
+            raise IOError("undecodable payload: %s" % (str(e) or type(e).__name__)) from e
+
+    @staticmethod
+    def _map(f) -> mmap.mmap:
+        # the mapping keeps the data around after the file is closed
+        f.flush()
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
@@ -0,0 +1,179 @@
+"""
+Instrumentation of the wire path. Nothing is measured until hooks are
+installed; every call site only checks `metrics.hooks is not None`.
+
+    from levin import metrics
+    m = metrics.enable()
+    ...
+    print(m.prometheus())
+
+`Hooks` is the interface called from the framing, connection, session and
+server code; subclass it to forward events elsewhere, or use `Metrics`,
+which aggregates them and exports Prometheus text or `samples()`.
+"""
+import bisect
+from collections import Counter
+
+from levin.constants import *
+
+hooks = None
+
+ERROR_NAMES = {
+    LEVIN_ERROR_CONNECTION: 'LEVIN_ERROR_CONNECTION',
+    LEVIN_ERROR_CONNECTION_NOT_FOUND: 'LEVIN_ERROR_CONNECTION_NOT_FOUND',
+    LEVIN_ERROR_CONNECTION_DESTROYED: 'LEVIN_ERROR_CONNECTION_DESTROYED',
+    LEVIN_ERROR_CONNECTION_TIMEDOUT: 'LEVIN_ERROR_CONNECTION_TIMEDOUT',
+    LEVIN_ERROR_CONNECTION_NO_DUPLEX_PROTOCOL: 'LEVIN_ERROR_CONNECTION_NO_DUPLEX_PROTOCOL',
+    LEVIN_ERROR_CONNECTION_HANDLER_NOT_DEFINED: 'LEVIN_ERROR_CONNECTION_HANDLER_NOT_DEFINED',
+    LEVIN_ERROR_FORMAT: 'LEVIN_ERROR_FORMAT',
+}
+
+
+def enable(h: 'Hooks' = None) -> 'Hooks':
+    """Installs `h` (a new `Metrics` by default) process wide and returns it"""
+    global hooks
+    hooks = Metrics() if h is None else h
+    return hooks
+
+
+def disable():
+    global hooks
+    hooks = None
+
+
+class Hooks:
+    """Events of the wire path; all no-ops here"""
+    def bytes_in(self, size: int):
+        """`size` bytes read off a connection"""
+
+    def frame_in(self, command: int, size: int, decode_seconds: float):
+        """a complete frame of `size` bytes (header included), decoded in `decode_seconds`"""
+
+    def frame_out(self, command: int, size: int):
+        """a frame of `size` bytes (header included) queued for sending"""
+
+    def error(self, code: int):
+        """an error of class `code` (a LEVIN_ERROR_* value), received or local"""
+
+    def handshake(self, seconds: float):
+        """round trip time of a completed outgoing handshake"""
+
+    def queue(self, name: str, delta: int):
+        """the `name` queue ('requests' awaiting a response, 'handlers' running) grew by `delta`"""
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: tuple):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list:
+        """[(upper bound, observations <= bound), ...] ending with +Inf"""
+        total, out = 0, []
+        for bound, n in zip(self.bounds + (float('inf'),), self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+
+class Metrics(Hooks):
+    HANDSHAKE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.frames_received = Counter()
+        self.frames_sent = Counter()
+        # command -> [frames, seconds]
+        self.decode_time = {}
+        self.errors = Counter()
+        self.queues = Counter()
+        self.handshakes = Histogram(self.HANDSHAKE_BUCKETS)
+
+    def bytes_in(self, size: int):
+        self.bytes_received += size
+
+    def frame_in(self, command: int, size: int, decode_seconds: float):
+        self.frames_received[command] += 1
+        entry = self.decode_time.get(command)
+        if entry is None:
+            entry = self.decode_time[command] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += decode_seconds
+
+    def frame_out(self, command: int, size: int):
+        self.bytes_sent += size
+        self.frames_sent[command] += 1
+
+    def error(self, code: int):
+        self.errors[code] += 1
+
+    def handshake(self, seconds: float):
+        self.handshakes.observe(seconds)
+
+    def queue(self, name: str, delta: int):
+        self.queues[name] += delta
+
+    def samples(self):
+        """(name, labels, value) of every metric"""
+        yield 'levin_bytes_received_total', {}, self.bytes_received
+        yield 'levin_bytes_sent_total', {}, self.bytes_sent
+        for command, n in sorted(self.frames_received.items()):
+            yield 'levin_frames_received_total', {'command': _command_name(command)}, n
+        for command, n in sorted(self.frames_sent.items()):
+            yield 'levin_frames_sent_total', {'command': _command_name(command)}, n
+        for command, (n, seconds) in sorted(self.decode_time.items()):
+            labels = {'command': _command_name(command)}
+            yield 'levin_decode_seconds_count', labels, n
+            yield 'levin_decode_seconds_sum', labels, seconds
+        for code, n in sorted(self.errors.items()):
+            yield 'levin_errors_total', {'error': ERROR_NAMES.get(code, str(code))}, n
+        for name, depth in sorted(self.queues.items()):
+            yield 'levin_queue_depth', {'queue': name}, depth
+        for bound, n in self.handshakes.cumulative():
+            yield 'levin_handshake_seconds_bucket', {'le': '+Inf' if bound == float('inf') else repr(bound)}, n
+        yield 'levin_handshake_seconds_sum', {}, self.handshakes.sum
+        yield 'levin_handshake_seconds_count', {}, self.handshakes.count
+
+    def export(self, callback):
+        """Calls `callback(name, labels, value)` for every sample"""
+        for sample in self.samples():
+            callback(*sample)
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines, typed = [], set()
+        for name, labels, value in self.samples():
+            family = name if name in _TYPES else name.rsplit('_', 1)[0]
+            if family not in typed:
+                typed.add(family)
+                lines.append('# TYPE %s %s' % (family, _TYPES[family]))
+            if labels:
+                name += '{%s}' % ','.join('%s="%s"' % item for item in labels.items())
+            lines.append('%s %s' % (name, value))
+        return '\n'.join(lines) + '\n'
+
+
+_TYPES = {
+    'levin_bytes_received_total': 'counter',
+    'levin_bytes_sent_total': 'counter',
+    'levin_frames_received_total': 'counter',
+    'levin_frames_sent_total': 'counter',
+    'levin_decode_seconds': 'summary',
+    'levin_errors_total': 'counter',
+    'levin_queue_depth': 'gauge',
+    'levin_handshake_seconds': 'histogram',
+}
+
+
+def _command_name(command: int) -> str:
+    return P2P_COMMANDS.get(command, str(command))
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import logging
+import sys
+import time
+from collections import OrderedDict, deque
+
+from levin.session import LevinSession
+from levin.constants import *
+
+log = logging.getLogger()
+
+TX = 'tx'
+BLOCK = 'block'
+
+# notifications carrying objects; decoded with their schema codec
+_COMMANDS = frozenset((NOTIFY_NEW_TRANSACTIONS.value, NOTIFY_NEW_BLOCK.value, NOTIFY_NEW_FLUFFY_BLOCK.value))
+
+
+def blob_id(blob) -> bytes:
+    """32 byte identity of a tx or block blob. A blake2b digest, not the cryptonote hash."""
+    return hashlib.blake2b(blob, digest_size=32).digest()
+
+
+class Sighting(tuple):
+    """
+    (kind, id, peer, received, delay, first): object `id` of `kind` (TX or
+    BLOCK) arrived from `peer` (host, port) at `received` (time.monotonic()),
+    `delay` seconds after its first sighting from any peer.
+    """
+    __slots__ = ()
+
+    kind = property(lambda self: self[0])
+    id = property(lambda self: self[1])
+    peer = property(lambda self: self[2])
+    received = property(lambda self: self[3])
+    delay = property(lambda self: self[4])
+    first = property(lambda self: self[5])
+
+
+class SeenCache:
+    """Bounded LRU of object id -> first received time; the least recently seen is dropped first"""
+    __slots__ = ('maxsize', 'evicted', '_entries')
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.evicted = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: bytes):
+        return key in self._entries
+
+    def see(self, key: bytes, received: float) -> float:
+        """Time `key` was first seen; `received` if it is new"""
+        entries = self._entries
+        first = entries.get(key)
+        if first is not None:
+            entries.move_to_end(key)
+            return first
+        entries[key] = received
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evicted += 1
+        return received
+
+
+class MonitorStats:
+    def __init__(self):
+        self.sessions = 0
+        self.failed = 0
+        self.errors = 0
+        self.notifications = 0
+        self.txs = 0
+        self.blocks = 0
+        self.first_seen = 0
+        self.duplicates = 0
+
+    def __repr__(self):
+        return ('<MonitorStats sessions=%d failed=%d errors=%d notifications=%d txs=%d blocks=%d '
+                'first_seen=%d duplicates=%d>') % (
+            self.sessions, self.failed, self.errors, self.notifications, self.txs, self.blocks,
+            self.first_seen, self.duplicates)
+
+
+class PropagationMonitor:
+    """
+    Keeps sessions to many nodes and records when each of them relays a
+    transaction or block. Every bucket is stamped with time.monotonic() when
+    its frame completes; objects are deduplicated across peers in a
+    `SeenCache` of `seen_size` ids, so the first relay of an object yields a
+    `Sighting` with `first=True` and later ones their delay after it.
+
+        async with PropagationMonitor(on_sighting=print) as monitor:
+            for host, port in nodes:
+                monitor.watch(host, port)
+            await asyncio.sleep(3600)
+
+    Sightings go to `on_sighting(sighting)`, by default the bounded
+    `records` deque. Lost sessions are reopened after `reconnect_delay`
+    seconds, also those ended by an unexpected error (counted in
+    `stats.errors`); `session_options` are passed on to `LevinSession`.
+    """
+    def __init__(self, seen_size: int = 100000, on_sighting=None, max_records: int = 100000,
+                 reconnect_delay: float = 5.0, **session_options):
+        self.seen = SeenCache(seen_size)
+        self.records = deque(maxlen=max_records)
+        self.on_sighting = on_sighting or self.records.append
+        self.reconnect_delay = reconnect_delay
+        self.session_options = session_options
+        self.sessions = {}
+        self.stats = MonitorStats()
+        # offset from the monotonic clock of the sightings to wall clock time
+        self.clock_offset = time.time() - time.monotonic()
+        self._tasks = {}
+
+    def watch(self, host: str, port: int):
+        """Starts monitoring host:port"""
+        key = (host, port)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.ensure_future(self._watch(key))
+
+    async def _watch(self, key: tuple):
+        handler = lambda bucket: self.on_notification(key, bucket)
+        while True:
+            session = LevinSession(*key, handlers={command: handler for command in _COMMANDS},
+                                   schema=_COMMANDS, **self.session_options)
+            try:
+                await session.open()
+                self.sessions[key] = session
+                self.stats.sessions += 1
+                log.debug("monitoring %s:%d", *key)
+                await session.conn.wait_closed()
+            except (OSError, asyncio.TimeoutError) as e:
+                self.stats.failed += 1
+                log.debug("session to %s:%d failed: %s", key[0], key[1], e)
+            except Exception as e:
+                # e.g. a response we can't make sense of; the node is retried all the same
+                self.stats.errors += 1
+                log.error("session to %s:%d failed: %s", key[0], key[1], e, exc_info=True)
+            finally:
+                self.sessions.pop(key, None)
+                await session.close()
+            if not self.reconnect_delay:
+                return
+            await asyncio.sleep(self.reconnect_delay)
+
+    def on_notification(self, peer: tuple, bucket):
+        message = bucket.payload_section
+        if message is None:
+            return
+        self.stats.notifications += 1
+        if bucket.command.value == NOTIFY_NEW_TRANSACTIONS.value:
+            for blob in message.txs or ():
+                self.stats.txs += 1
+                self.see(TX, blob_id(blob), peer, bucket.received)
+        elif message.b is not None and message.b.block:
+            self.stats.blocks += 1
+            self.see(BLOCK, blob_id(message.b.block), peer, bucket.received)
+
+    def see(self, kind: str, _id: bytes, peer: tuple, received: float):
+        first = self.seen.see(_id, received)
+        if first == received:
+            self.stats.first_seen += 1
+        else:
+            self.stats.duplicates += 1
+        self.on_sighting(Sighting((kind, _id, peer, received, received - first, first == received)))
+
+    def wall_time(self, received: float) -> float:
+        return received + self.clock_offset
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Record tx and block propagation across nodes as CSV')
+    parser.add_argument('nodes', nargs='+', help='ip:port of the nodes to monitor')
+    parser.add_argument('--seen-size', type=int, default=100000)
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    def emit(sighting: Sighting):
+        print('%s,%s,%s:%d,%.6f,%.6f' % (sighting.kind, sighting.id.hex(), sighting.peer[0], sighting.peer[1],
+                                         monitor.wall_time(sighting.received), sighting.delay))
+
+    async def run():
+        async with monitor:
+            for node in args.nodes:
+                host, _, port = node.rpartition(':')
+                monitor.watch(host.strip('[]'), int(port))
+            while True:
+                await asyncio.sleep(60)
+                log.info("%r", monitor.stats)
+
+    monitor = PropagationMonitor(seen_size=args.seen_size, on_sighting=emit)
+    print('kind,id,peer,time,delay')
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
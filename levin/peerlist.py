@@ -0,0 +1,331 @@
+import re
+import socket
+import struct
+import sys
+from array import array
+
+from levin.reader import LevinReader, _SCALARS
+from levin.constants import *
+
+_TYPE_OBJECT = SERIALIZE_TYPE_OBJECT.value
+_TYPE_STRING = SERIALIZE_TYPE_STRING.value
+_FLAG_ARRAY = SERIALIZE_FLAG_ARRAY.value
+
+_UINT16 = struct.Struct('<H')
+_UINT32 = struct.Struct('<I')
+_UINT64 = struct.Struct('<Q')
+_INT64 = struct.Struct('<q')
+# serialize type -> width of fixed-width values
+_SIZES = {t: scalar[0].size for t, scalar in _SCALARS.items()}
+
+
+def _key(name: str, _type) -> bytes:
+    # name length, name and type byte as they appear in a section
+    return bytes([len(name)]) + name.encode('ascii') + bytes([int(_type)])
+
+
+_PEERLIST = _key('local_peerlist_new', _TYPE_OBJECT | _FLAG_ARRAY)
+_ADR = _key('adr', _TYPE_OBJECT)
+_ADDR_OBJECT = _key('addr', _TYPE_OBJECT)
+_ID = _key('id', SERIALIZE_TYPE_UINT64)
+_LAST_SEEN = _key('last_seen', SERIALIZE_TYPE_INT64)
+_M_IP = _key('m_ip', SERIALIZE_TYPE_UINT32)
+_M_PORT = _key('m_port', SERIALIZE_TYPE_UINT16)
+_ADDR_V6 = _key('addr', _TYPE_STRING) + b'\x40'  # varint 16
+
+# (key path, serialize type) -> PeerColumns column
+_FIELDS = {
+    ((b'last_seen',), SERIALIZE_TYPE_INT64.value): 'last_seen',
+    ((b'id',), SERIALIZE_TYPE_UINT64.value): 'id',
+    ((b'adr', b'addr', b'm_ip'), SERIALIZE_TYPE_UINT32.value): 'ip',
+    ((b'adr', b'addr', b'm_port'), SERIALIZE_TYPE_UINT16.value): 'port',
+    ((b'adr', b'addr', b'addr'), _TYPE_STRING): 'ip',
+}
+_TYPECODES = {'ip': 'I', 'port': 'H', 'last_seen': 'q', 'id': 'Q'}
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+class _Layout:
+    """
+    Byte layout of a fixed-width peerlist_entry: `regex` matches a run of
+    entries of `size` bytes, `columns` lists (column, typecode, offset,
+    width) of the values to take from each.
+    """
+    __slots__ = ('size', 'regex', 'columns', 'ipv6', 'missing')
+
+
+class PeerColumns:
+    """
+    Peers of one address family as packed columns. For IPv4 `ip` is an
+    `array('I')` of addresses as they are on the wire (`ip.tobytes()` holds
+    the 4 byte network order addresses back to back on little-endian hosts);
+    for IPv6 it is a `bytearray` of 16 byte addresses.
+    """
+    __slots__ = ('family', 'ip', 'port', 'last_seen', 'id')
+
+    def __init__(self, family: int):
+        self.family = family
+        self.ip = array('I') if family == socket.AF_INET else bytearray()
+        self.port = array('H')
+        self.last_seen = array('q')
+        self.id = array('Q')
+
+    def __len__(self):
+        return len(self.port)
+
+    def address(self, i: int) -> str:
+        if self.family == socket.AF_INET:
+            return socket.inet_ntoa(_UINT32.pack(self.ip[i]))
+        return socket.inet_ntop(socket.AF_INET6, bytes(self.ip[16 * i:16 * i + 16]))
+
+    def __iter__(self):
+        """(ip, port, last_seen, id) tuples"""
+        for i in range(len(self)):
+            yield self.address(i), self.port[i], self.last_seen[i], self.id[i]
+
+    def to_numpy(self) -> dict:
+        """The columns as NumPy arrays, sharing memory; needs NumPy"""
+        import numpy as np
+        ip = np.frombuffer(self.ip, dtype='<u4' if self.family == socket.AF_INET else 'V16')
+        return {
+            'ip': ip,
+            'port': np.frombuffer(self.port, dtype=np.uint16),
+            'last_seen': np.frombuffer(self.last_seen, dtype=np.int64),
+            'id': np.frombuffer(self.id, dtype=np.uint64),
+        }
+
+    def __repr__(self):
+        return '<PeerColumns %s %d peers>' % ('ipv4' if self.family == socket.AF_INET else 'ipv6', len(self))
+
+
+class PeerListScanner(LevinReader):
+    """
+    Pulls `local_peerlist_new` out of a raw handshake or timed_sync payload
+    without building the `Section` tree: everything else is skipped, and
+    the known peerlist_entry fields are matched on their raw key bytes and
+    appended to `PeerColumns`. Entries that are neither IPv4 nor IPv6 (tor,
+    i2p) are left out.
+
+        ipv4, ipv6 = PeerListScanner(payload).scan()
+    """
+    def __init__(self, buffer):
+        if not isinstance(buffer, (bytes, bytearray)):
+            buffer = bytes(buffer)
+        super(PeerListScanner, self).__init__(buffer)
+        self.data = buffer
+        self.ipv4 = PeerColumns(socket.AF_INET)
+        self.ipv6 = PeerColumns(socket.AF_INET6)
+
+    def scan(self) -> tuple:
+        self.read_signature()
+        try:
+            count = self.read_count()
+            while count > 0:
+                if self.data.startswith(_PEERLIST, self.offset):
+                    self.offset += len(_PEERLIST)
+                    self.scan_entries()
+                else:
+                    self.skip_field()
+                count -= 1
+        except (struct.error, IndexError):
+            raise IOError("unexpected end of payload")
+        return self.ipv4, self.ipv6
+
+    def scan_entries(self):
+        """
+        Scans the peerlist_entry array. An entry decoded field by field also
+        teaches a `_Layout`; following entries with the same shape are then
+        matched as a run by one regex and their columns copied out with
+        strided slices, without per-entry Python code.
+        """
+        data = self.data
+        size = self.read_var_int()
+        layout = None
+        while size > 0:
+            if layout is not None:
+                match = layout.regex.match(data, self.offset)
+                if match:
+                    n = min((match.end() - self.offset) // layout.size, size)
+                    self.take(layout, n)
+                    size -= n
+                    continue
+            start = self.offset
+            self.scan_entry()
+            layout = self.learn(start)
+            size -= 1
+
+    def take(self, layout: '_Layout', n: int):
+        """Appends the columns of `n` entries of `layout` at the current offset"""
+        step = layout.size
+        view = self.buffer[self.offset:self.offset + n * step]
+        columns = self.ipv6 if layout.ipv6 else self.ipv4
+        for name, typecode, rel, width in layout.columns:
+            out = bytearray(n * width)
+            for j in range(width):
+                out[j::width] = view[rel + j::step]
+            target = getattr(columns, name)
+            if typecode is None:
+                target += out
+            elif _BIG_ENDIAN:
+                values = array(typecode, out)
+                values.byteswap()
+                target.extend(values)
+            else:
+                target.frombytes(out)
+        for name in layout.missing:
+            target = getattr(columns, name)
+            target.frombytes(bytes(n * target.itemsize))
+        self.offset += n * step
+
+    def learn(self, start: int) -> '_Layout':
+        """Layout of the entry at `start`, or None if it has variable width parts"""
+        parts, columns = [], []
+        end = self._walk(start, (), parts, columns)
+        if end is None:
+            return None
+        found = {name for name, _, _ in columns}
+        if 'ip' not in found or 'port' not in found:
+            return None
+
+        layout = _Layout()
+        layout.size = end - start
+        layout.regex = re.compile(b'(?:' + b''.join(
+            re.escape(p) if isinstance(p, bytes) else b'.{%d}' % p for p in parts) + b')+', re.DOTALL)
+        layout.columns = [(name, _TYPECODES[name] if width != 16 else None, offset - start, width)
+                          for name, offset, width in columns]
+        layout.ipv6 = any(width == 16 for _, _, width in columns)
+        layout.missing = [name for name in ('last_seen', 'id') if name not in found]
+        return layout
+
+    def _walk(self, offset: int, path: tuple, parts: list, columns: list):
+        # splits a section into literal bytes and value widths
+        buffer = self.buffer
+        count = buffer[offset]
+        if count & 0x03:
+            return None
+        parts.append(bytes(buffer[offset:offset + 1]))
+        offset += 1
+        for _ in range(count >> 2):
+            n = buffer[offset]
+            key = path + (bytes(buffer[offset + 1:offset + 1 + n]),)
+            _type = buffer[offset + 1 + n]
+            parts.append(bytes(buffer[offset:offset + 2 + n]))
+            offset += 2 + n
+
+            size = _SIZES.get(_type)
+            if size is None and _type == _TYPE_STRING:
+                if buffer[offset] & 0x03:
+                    return None
+                size = buffer[offset] >> 2
+                parts.append(bytes(buffer[offset:offset + 1]))
+                offset += 1
+                if size != 16:
+                    _type = None
+            elif size is None and _type == _TYPE_OBJECT:
+                offset = self._walk(offset, key, parts, columns)
+                if offset is None:
+                    return None
+                continue
+            elif size is None:
+                return None
+
+            name = _FIELDS.get((key, _type))
+            if name is not None:
+                columns.append((name, offset, size))
+            parts.append(size)
+            offset += size
+        return offset
+
+    def read_count(self) -> int:
+        # section entry counts nearly always fit the one byte varint
+        b = self.buffer[self.offset]
+        if b & 0x03:
+            return self.read_var_int()
+        self.offset += 1
+        return b >> 2
+
+    def skip_field(self):
+        """Skips one `name, type, value` field of a section"""
+        buffer = self.buffer
+        offset = self.offset
+        offset += 1 + buffer[offset]
+        _type = buffer[offset]
+        size = _SIZES.get(_type)
+        if size is not None:
+            self.offset = offset + 1 + size
+        else:
+            self.offset = offset + 1
+            self.skip_entry(_type)
+
+    def scan_entry(self):
+        data, buffer = self.data, self.buffer
+        ip = port = None
+        ipv6 = False
+        last_seen = _id = 0
+
+        count = self.read_count()
+        while count > 0:
+            offset = self.offset
+            if data.startswith(_LAST_SEEN, offset):
+                offset += len(_LAST_SEEN)
+                last_seen = _INT64.unpack_from(buffer, offset)[0]
+                self.offset = offset + 8
+            elif data.startswith(_ID, offset):
+                offset += len(_ID)
+                _id = _UINT64.unpack_from(buffer, offset)[0]
+                self.offset = offset + 8
+            elif data.startswith(_ADR, offset):
+                self.offset = offset + len(_ADR)
+                adr_count = self.read_count()
+                while adr_count > 0:
+                    if data.startswith(_ADDR_OBJECT, self.offset):
+                        self.offset += len(_ADDR_OBJECT)
+                        ip, port, ipv6 = self.scan_addr()
+                    else:
+                        self.skip_field()
+                    adr_count -= 1
+            else:
+                self.skip_field()
+            count -= 1
+
+        if ip is None or port is None:
+            return
+        if ipv6:
+            columns = self.ipv6
+            columns.ip += ip
+        else:
+            columns = self.ipv4
+            columns.ip.append(ip)
+        columns.port.append(port)
+        columns.last_seen.append(last_seen)
+        columns.id.append(_id)
+
+    def scan_addr(self) -> tuple:
+        data, buffer = self.data, self.buffer
+        ip = port = None
+        ipv6 = False
+        count = self.read_count()
+        while count > 0:
+            offset = self.offset
+            if data.startswith(_M_IP, offset):
+                offset += len(_M_IP)
+                ip = _UINT32.unpack_from(buffer, offset)[0]
+                self.offset = offset + 4
+            elif data.startswith(_M_PORT, offset):
+                offset += len(_M_PORT)
+                port = _UINT16.unpack_from(buffer, offset)[0]
+                self.offset = offset + 2
+            elif data.startswith(_ADDR_V6, offset):
+                offset += len(_ADDR_V6)
+                ip = buffer[offset:offset + 16]
+                ipv6 = True
+                self.offset = offset + 16
+            else:
+                self.skip_field()
+            count -= 1
+        return ip, port, ipv6
+
+
+def extract_peers(payload) -> tuple:
+    """(ipv4, ipv6) `PeerColumns` of the peer list in a raw handshake/timed_sync payload"""
+    return PeerListScanner(payload).scan()
@@ -0,0 +1,188 @@
+import sqlite3
+import time
+
+from levin.utils import pack_address, unpack_address, _IPV4_MAPPED
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS peers (
+    addr BLOB NOT NULL,
+    port INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    id INTEGER,
+    source_addr BLOB,
+    source_port INTEGER,
+    sightings INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (addr, port)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS peers_last_seen ON peers (last_seen);
+'''
+
+# last_seen only moves forward; id and source follow the freshest sighting
+_UPSERT = '''
+INSERT INTO peers (addr, port, first_seen, last_seen, id, source_addr, source_port)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (addr, port) DO UPDATE SET
+    sightings = sightings + 1,
+    id = CASE WHEN excluded.last_seen >= last_seen THEN coalesce(excluded.id, id) ELSE id END,
+    source_addr = CASE WHEN excluded.last_seen >= last_seen THEN excluded.source_addr ELSE source_addr END,
+    source_port = CASE WHEN excluded.last_seen >= last_seen THEN excluded.source_port ELSE source_port END,
+    last_seen = max(last_seen, excluded.last_seen)
+'''
+
+_COLUMNS = 'addr, port, first_seen, last_seen, id, source_addr, source_port, sightings'
+
+
+class PeerRecord(tuple):
+    """(ip, port, first_seen, last_seen, id, source, sightings); source is (ip, port) or None"""
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row: tuple):
+        addr, port, first_seen, last_seen, _id, source_addr, source_port, sightings = row
+        source = (unpack_address(source_addr), source_port) if source_addr is not None else None
+        _id = _id & 0xffffffffffffffff if _id is not None else None
+        return cls((unpack_address(addr), port, first_seen, last_seen, _id, source, sightings))
+
+    ip = property(lambda self: self[0])
+    port = property(lambda self: self[1])
+    first_seen = property(lambda self: self[2])
+    last_seen = property(lambda self: self[3])
+    id = property(lambda self: self[4])
+    source = property(lambda self: self[5])
+    sightings = property(lambda self: self[6])
+
+
+class PeerStore:
+    """
+    SQLite backed set of peer sightings, one fixed-width record per
+    (address, port): 16 byte address (IPv4 as ::ffff:a.b.c.d), port,
+    first_seen (our clock), last_seen (as advertised), peer id and the node
+    that advertised it. The primary key makes upserts a single b-tree probe;
+    the last_seen index serves `fresh()`. The file survives restarts as-is.
+
+        store = PeerStore('peers.db')
+        store.add_bucket(bucket, source=('212.83.175.67', 18080))
+        for peer in store.fresh(since=time.time() - 3600):
+            ...
+
+    Sightings are buffered and written `batch_size` at a time; `flush()` or
+    `close()` write out the rest.
+    """
+    def __init__(self, path: str = ':memory:', batch_size: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(path)
+        if path != ':memory:':
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(_SCHEMA)
+        self._batch = []
+
+    def add(self, peers, source: tuple = None, now: int = None):
+        """
+        Records `peers` advertised by `source` (ip, port). Peers are (ip, port),
+        (ip, port, last_seen) or (ip, port, last_seen, id) tuples.
+        """
+        now = int(time.time()) if now is None else now
+        source_addr, source_port = (pack_address(source[0]), source[1]) if source else (None, None)
+        batch = self._batch
+        for peer in peers:
+            last_seen = peer[2] if len(peer) > 2 and peer[2] else now
+            _id = _signed(peer[3]) if len(peer) > 3 and peer[3] is not None else None
+            batch.append((pack_address(peer[0]), peer[1], now, last_seen, _id, source_addr, source_port))
+        if len(batch) >= self.batch_size:
+            self.flush()
+
+    def add_section(self, section, source: tuple = None, now: int = None):
+        """
+        Records the `local_peerlist_new` entries of a decoded handshake or
+        timed_sync `Section`, read straight from the entries (ctypes or native
+        values) without building intermediate peer dicts.
+        """
+        now = int(time.time()) if now is None else now
+        entries = section.entries.get('local_peerlist_new')
+        if not entries:
+            return
+        source_addr, source_port = (pack_address(source[0]), source[1]) if source else (None, None)
+        batch = self._batch
+        for peer in entries:
+            peer = peer.entries
+            try:
+                addr = peer['adr'].entries['addr'].entries
+            except (KeyError, AttributeError):
+                continue
+            if 'm_ip' in addr:
+                m_ip = addr['m_ip']
+                packed = _IPV4_MAPPED + (m_ip if isinstance(m_ip, int) else m_ip.value).to_bytes(4, 'little')
+            elif 'addr' in addr:
+                packed = bytes(_value(addr['addr']))
+                if len(packed) != 16:
+                    continue
+            else:
+                continue
+            last_seen = _value(peer['last_seen']) if 'last_seen' in peer else None
+            _id = _value(peer['id']) if 'id' in peer else None
+            batch.append((packed, _value(addr['m_port']), now, last_seen or now,
+                          _signed(_id) if _id is not None else None, source_addr, source_port))
+        if len(batch) >= self.batch_size:
+            self.flush()
+
+    def add_bucket(self, bucket, source: tuple = None, now: int = None):
+        self.add_section(bucket.payload_section, source, now)
+
+    def flush(self):
+        if self._batch:
+            with self.db:
+                self.db.executemany(_UPSERT, self._batch)
+            self._batch = []
+
+    def get(self, ip: str, port: int) -> PeerRecord:
+        self.flush()
+        row = self.db.execute('SELECT %s FROM peers WHERE addr = ? AND port = ?' % _COLUMNS,
+                              (pack_address(ip), port)).fetchone()
+        return PeerRecord.from_row(row) if row else None
+
+    def fresh(self, since: int = None, limit: int = None) -> list:
+        """Peers by descending last_seen, optionally only those seen at or after `since`"""
+        self.flush()
+        query = 'SELECT %s FROM peers' % _COLUMNS
+        args = []
+        if since is not None:
+            query += ' WHERE last_seen >= ?'
+            args.append(int(since))
+        query += ' ORDER BY last_seen DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+        return [PeerRecord.from_row(row) for row in self.db.execute(query, args)]
+
+    def __len__(self):
+        self.flush()
+        return self.db.execute('SELECT count(*) FROM peers').fetchone()[0]
+
+    def __contains__(self, endpoint: tuple):
+        return self.get(*endpoint) is not None
+
+    def __iter__(self):
+        self.flush()
+        return (PeerRecord.from_row(row) for row in self.db.execute('SELECT %s FROM peers' % _COLUMNS))
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _value(v):
+    return v.value if hasattr(v, 'value') else v
+
+
+def _signed(i: int) -> int:
+    # SQLite integers are signed 64 bit; peer ids are stored two's complement
+    return i - (1 << 64) if i >= 1 << 63 else i
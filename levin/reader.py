@@ -1,22 +1,161 @@
+import os
 import sys
+import struct
+from array import array
 from io import BytesIO
 
-from levin.utils import rshift
 from levin.exceptions import BadPortableStorageSignature
 from levin.ctypes import *
 from levin.constants import *
 
+# precompiled little-endian structs, unpacked with `unpack_from` at an offset
+_HEADER = struct.Struct('<IIB')
+_UINT16 = struct.Struct('<H')
+_UINT32 = struct.Struct('<I')
+_UINT64 = struct.Struct('<Q')
+
+# serialize type -> (struct, ctype) for fixed-width scalars
+_SCALARS = {
+    SERIALIZE_TYPE_UINT64.value: (_UINT64, c_uint64),
+    SERIALIZE_TYPE_INT64.value: (struct.Struct('<q'), c_int64),
+    SERIALIZE_TYPE_UINT32.value: (_UINT32, c_uint32),
+    SERIALIZE_TYPE_INT32.value: (struct.Struct('<i'), c_int32),
+    SERIALIZE_TYPE_UINT16.value: (_UINT16, c_uint16),
+    SERIALIZE_TYPE_INT16.value: (struct.Struct('<h'), c_int16),
+    SERIALIZE_TYPE_UINT8.value: (struct.Struct('<B'), c_ubyte),
+    SERIALIZE_TYPE_INT8.value: (struct.Struct('<b'), c_byte),
+    SERIALIZE_TYPE_DOUBLE.value: (struct.Struct('<d'), c_double),
+    SERIALIZE_TYPE_BOOL.value: (struct.Struct('<?'), c_bool),
+}
+
+# serialize type -> array.array typecode for columnar arrays
+_TYPECODES = {
+    SERIALIZE_TYPE_UINT64.value: 'Q',
+    SERIALIZE_TYPE_INT64.value: 'q',
+    SERIALIZE_TYPE_UINT32.value: 'I',
+    SERIALIZE_TYPE_INT32.value: 'i',
+    SERIALIZE_TYPE_UINT16.value: 'H',
+    SERIALIZE_TYPE_INT16.value: 'h',
+    SERIALIZE_TYPE_UINT8.value: 'B',
+    SERIALIZE_TYPE_INT8.value: 'b',
+    SERIALIZE_TYPE_DOUBLE.value: 'd',
+}
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+# serialize type -> ctype, as indexed by the C codec
+_CTYPES = tuple(_SCALARS[t][1] if t in _SCALARS else None for t in range(14))
+
+# the optional C codec (levin/_speedups.c); LEVIN_PURE_PYTHON=1 turns it off
+try:
+    from levin import _speedups
+except ImportError:
+    _speedups = None
+if os.environ.get('LEVIN_PURE_PYTHON'):
+    _speedups = None
+
+_TYPE_OBJECT = SERIALIZE_TYPE_OBJECT.value
+_TYPE_STRING = SERIALIZE_TYPE_STRING.value
+_TYPE_ARRAY = SERIALIZE_TYPE_ARRAY.value
+_FLAG_ARRAY = SERIALIZE_FLAG_ARRAY.value
+
+
+class DecoderLimits:
+    """
+    Bounds on what a payload can make `LevinReader` allocate. Every count
+    read off the wire is checked against these, and against the bytes left
+    in the buffer, before anything is allocated for it; a payload over a
+    limit raises IOError.
+
+    `max_objects` counts sections per reader, `max_depth` the nesting of
+    sections and arrays of sections.
+    """
+    __slots__ = ('max_objects', 'max_depth', 'max_array_length', 'max_string_length')
+
+    def __init__(self, max_objects: int = PORTABLE_STORAGE_OBJECT_LIMIT,
+                 max_depth: int = PORTABLE_STORAGE_RECURSION_LIMIT,
+                 max_array_length: int = LEVIN_DEFAULT_MAX_PACKET_SIZE,
+                 max_string_length: int = MAX_STRING_LEN_POSSIBLE):
+        self.max_objects = max_objects
+        self.max_depth = max_depth
+        self.max_array_length = max_array_length
+        self.max_string_length = max_string_length
+
+    def __repr__(self):
+        return '<DecoderLimits objects=%d depth=%d array=%d string=%d>' % (
+            self.max_objects, self.max_depth, self.max_array_length, self.max_string_length)
+
+
+DEFAULT_LIMITS = DecoderLimits()
+
 
 class LevinReader:
-    def __init__(self, buffer: BytesIO):
-        if isinstance(buffer, bytes):
-            buffer = BytesIO(buffer)
-        self.buffer = buffer
+    """
+    Portable storage decoder. Works on a single memoryview of the payload and
+    keeps an offset into it; scalars are decoded with precompiled structs.
+
+    With `lazy=True` sections are only skimmed: `LazySection` records where
+    each value is and decodes it when its key is first accessed, and arrays
+    of objects become a `LazyArray` decoding elements on access. Lazy
+    sections keep a reference to `buffer`, so it must not be reused while
+    they are alive. Skimming is done in Python, and only pays off over the
+    Python decoder: when the C extension is built `lazy` is ignored and the
+    payload is decoded eagerly in C, which is faster even for reading a
+    single value of a large payload.
+
+    With `native=True` values are plain `int`/`bytes` instead of `_CType`
+    wrappers; the serialize type of each entry is kept in `Section.types`.
+    Sections of the same shape share that dict, replace rather than modify it.
+
+    With `columnar=True` arrays of fixed-width numbers are decoded in one
+    go into an `array.array` and arrays of strings into a `StringArray`.
+
+    With `views=True` strings (tx and block blobs) are zero-copy memoryview
+    slices of `buffer` instead of `bytes`; `buffer` must then stay unchanged
+    for as long as they are in use.
+
+    Sections are decoded by the C extension `levin._speedups` when it is
+    built. It raises the same errors as
+    the Python decoder, which only takes over for input the extension
+    reports as `Unsupported`.
+
+    `limits` (a `DecoderLimits`, `DEFAULT_LIMITS` if omitted) bounds the
+    objects, nesting, array and string lengths of the payload. Sections are
+    decoded with an explicit stack instead of recursion, so nesting costs no
+    Python stack either way.
+    """
+    def __init__(self, buffer, lazy: bool = False, native: bool = False, columnar: bool = False,
+                 views: bool = False, limits: DecoderLimits = None):
+        if isinstance(buffer, BytesIO):
+            buffer = buffer.read()
+        self.buffer = memoryview(buffer).cast('B')
+        self.offset = 0
+        self.size = len(self.buffer)
+        # the C decoder reads a whole payload faster than Python skims it
+        self.lazy = lazy and _speedups is None
+        self.native = native
+        self.columnar = columnar
+        self.views = views
+        self.limits = limits or DEFAULT_LIMITS
+        self._types = {}
+        self._objects = 0
+        # levels open outside the current stack, i.e. lazy sections being skimmed
+        self._depth = 0
 
     def read_payload(self):
-        sig1 = c_uint32.from_buffer(self.buffer)
-        sig2 = c_uint32.from_buffer(self.buffer)
-        sig3 = c_ubyte.from_buffer(self.buffer)
+        self.read_signature()
+        try:
+            if self.lazy:
+                return self.read_lazy_section()
+            return self.read_section()
+        except (struct.error, IndexError):
+            raise IOError("unexpected end of payload")
+
+    def read_signature(self):
+        if self.size - self.offset < _HEADER.size:
+            raise BadPortableStorageSignature()
+
+        sig1, sig2, sig3 = _HEADER.unpack_from(self.buffer, self.offset)
+        self.offset += _HEADER.size
 
         if sig1 != PORTABLE_STORAGE_SIGNATUREA:
             raise BadPortableStorageSignature()
@@ -25,32 +164,140 @@ class LevinReader:
         elif sig3 != PORTABLE_STORAGE_FORMAT_VER:
             raise BadPortableStorageSignature()
 
-        return self.read_section()
-
     def read_section(self):
-        from levin.section import Section
-        section = Section()
-        count = self.read_var_int()
+        if _speedups is not None:
+            from levin.section import Section, StringArray
+            try:
+                section, self.offset, self._objects = _speedups.read_section(
+                    self.buffer, self.offset, self.native, self.views, self._types, Section, _CTYPES,
+                    self.limits, self._objects, (array, StringArray) if self.columnar else None)
+                return section
+            except _speedups.Unsupported:
+                # e.g. nesting too deep for the recursive C decoder
+                pass
+
+        stack = []
+        root = self._open_section(stack)
+        self._read_nested(stack)
+        return root
+
+    def _read_nested(self, stack: list):
+        """Decodes the sections and arrays of sections or of arrays open on `stack`"""
+        buffer = self.buffer
+        native = self.native
+        # frames are [section, entries, types, fields left] for sections and
+        # [None, list, element type, elements left] for arrays of sections or arrays
+        while stack:
+            frame = stack[-1]
+            if frame[3] == 0:
+                stack.pop()
+                if native and frame[0] is not None:
+                    # sections of the same shape share one types dict
+                    types = frame[2]
+                    frame[0].types = self._types.setdefault(tuple(types.items()), types)
+                continue
+            frame[3] -= 1
+
+            if frame[0] is None:
+                if frame[2] == _TYPE_OBJECT:
+                    frame[1].append(self._open_section(stack))
+                else:
+                    frame[1].append(self._open_array(stack, self._array_type(), nested=True))
+                continue
+
+            entries = frame[1]
+            offset = self.offset
+            len_name = buffer[offset]
+            offset += 1
+            end = offset + len_name
+            _type = buffer[end]
+            section_name = str(buffer[offset:end], 'ascii')
+            offset = end + 1
 
-        while count > 0:
-            section_name = self.read_section_name()
-            storage_entry = self.load_storage_entry()
-            section.add(section_name, storage_entry)
-            count -= 1
+            if native:
+                frame[2][section_name] = buffer[offset] if _type == _TYPE_ARRAY else _type
 
+            # scalars are decoded inline, nested sections get a frame, the rest is dispatched
+            scalar = _SCALARS.get(_type)
+            if scalar is not None:
+                _struct, ctype = scalar
+                value = _struct.unpack_from(buffer, offset)[0]
+                self.offset = offset + _struct.size
+                entries[section_name] = value if native else ctype(value)
+                continue
+
+            self.offset = offset
+            if _type == _TYPE_OBJECT:
+                entries[section_name] = self._open_section(stack)
+                continue
+            if _type == _TYPE_ARRAY:
+                _type = buffer[offset]
+                self.offset = offset + 1
+                if not _type & _FLAG_ARRAY:
+                    raise IOError("wrong type sequences")
+            if _type & _FLAG_ARRAY:
+                entries[section_name] = self._open_array(stack, _type & ~_FLAG_ARRAY)
+            else:
+                entries[section_name] = self.read(_type=_type)
+
+    def _open_array(self, stack: list, _type: int, nested: bool = False):
+        """
+        An array of `_type` elements. Arrays of sections and of arrays get a
+        frame on `stack`, to be filled in by `_read_nested`. Natively decoded
+        numbers in an array nested in an array come as an `array.array`, as
+        `Section.types` only holds the outer array's type.
+        """
+        if _type == _TYPE_OBJECT or _type == _TYPE_ARRAY:
+            self._enter(stack)
+            items = []
+            stack.append([None, items, _type, self.read_array_size(1)])
+            return items
+        return self.read_array_entry(_type, columnar=nested and self.native)
+
+    def _array_type(self) -> int:
+        """Reads the element type of an array that is an element of an array of arrays"""
+        _type = self.buffer[self.offset]
+        self.offset += 1
+        if not _type & _FLAG_ARRAY:
+            raise IOError("wrong type sequences")
+        return _type & ~_FLAG_ARRAY
+
+    def _enter(self, stack: list):
+        if self._depth + len(stack) >= self.limits.max_depth:
+            raise IOError("payload nested too deeply")
+
+    def _section_size(self, stack: list) -> int:
+        """Counts the section at the current offset, nested below `stack`, and reads its number of fields"""
+        self._enter(stack)
+        self._objects += 1
+        if self._objects > self.limits.max_objects:
+            raise IOError("too many objects in payload")
+        count = self.read_var_int()
+        if count > self.size - self.offset:
+            raise IOError("unexpected end of payload")
+        return count
+
+    def _open_section(self, stack: list):
+        from levin.section import Section
+        count = self._section_size(stack)
+        section = Section()
+        stack.append([section, section.entries, {} if self.native else None, count])
         return section
 
     def read_section_name(self) -> str:
-        len_name = c_ubyte.from_buffer(self.buffer)
-        name = self.buffer.read(len_name.value)
-        return name.decode('ascii')
+        offset = self.offset
+        len_name = self.buffer[offset]
+        offset += 1
+        self.offset = offset + len_name
+        return str(self.buffer[offset:self.offset], 'ascii')
 
     def load_storage_entry(self):
-        _type = c_ubyte.from_buffer(self.buffer)
+        _type = self.buffer[self.offset]
+        self.offset += 1
 
-        if (_type & SERIALIZE_FLAG_ARRAY) != 0:
+        if _type & _FLAG_ARRAY:
             return self.load_storage_array_entry(_type)
-        if _type == SERIALIZE_TYPE_ARRAY:
+        if _type == _TYPE_ARRAY:
             return self.read_storage_entry_array_entry()
         else:
             return self.read_storage_entry(_type)
@@ -59,53 +306,272 @@ class LevinReader:
         return self.read(_type=_type)
 
     def load_storage_array_entry(self, _type: int):
-        _type &= ~SERIALIZE_FLAG_ARRAY.value
+        _type = int(_type) & ~_FLAG_ARRAY
         return self.read_array_entry(_type)
 
     def read_storage_entry_array_entry(self):
-        _type = c_ubyte.from_buffer(self.buffer)
+        _type = self.buffer[self.offset]
+        self.offset += 1
 
-        if (_type & SERIALIZE_FLAG_ARRAY) != 0:
+        if not _type & _FLAG_ARRAY:
             raise IOError("wrong type sequences")
 
         return self.load_storage_array_entry(_type)
 
-    def read_array_entry(self, _type: int):
-        data = []
-        size = self.read_var_int()
+    def read_array_entry(self, _type: int, columnar: bool = False):
+        if self.lazy and _type == _TYPE_OBJECT:
+            return self.read_lazy_array()
+        if _type == _TYPE_ARRAY:
+            # arrays of arrays; each element has a flagged type byte of its own
+            stack = []
+            items = self._open_array(stack, _type)
+            self._read_nested(stack)
+            return items
+
+        scalar = _SCALARS.get(_type)
+        if scalar is not None:
+            # fixed width elements; unpack the whole run in one go
+            _struct, ctype = scalar
+            size = self.read_array_size(_struct.size)
+            end = self.offset + _struct.size * size
+            run = self.buffer[self.offset:end]
+            self.offset = end
+            if (self.columnar or columnar) and _type in _TYPECODES:
+                values = array(_TYPECODES[_type])
+                values.frombytes(run)
+                if _BIG_ENDIAN:
+                    values.byteswap()
+                return values
+            if self.native:
+                return [v for v, in _struct.iter_unpack(run)]
+            return [ctype(v) for v, in _struct.iter_unpack(run)]
 
+        if _type != _TYPE_STRING and _type != _TYPE_OBJECT:
+            raise IOError("unsupported type: %d" % _type)
+        size = self.read_array_size(1)
+        if self.columnar and _type == _TYPE_STRING:
+            return self.read_string_array(size)
+
+        data = []
         while size > 0:
             data.append(self.read(_type=_type))
             size -= 1
         return data
 
+    def read_array_size(self, width: int) -> int:
+        """Reads an element count, checked against the limits and the bytes left for `width` byte elements"""
+        size = self.read_var_int()
+        if size > self.limits.max_array_length:
+            raise IOError("array too long: %d elements" % size)
+        if size * width > self.size - self.offset:
+            raise IOError("unexpected end of payload")
+        return size
+
+    def read_string_array(self, size: int):
+        from levin.section import StringArray
+        starts, ends = array('Q'), array('Q')
+        begin = self.offset
+
+        while size > 0:
+            count = self.read_var_int()
+            if count > self.limits.max_string_length:
+                raise IOError("string too long: %d bytes" % count)
+            start = self.offset - begin
+            starts.append(start)
+            ends.append(start + count)
+            self.offset += count
+            size -= 1
+
+        if self.offset > self.size:
+            raise IOError("unexpected end of payload")
+        return StringArray(bytes(self.buffer[begin:self.offset]), starts, ends)
+
     def read(self, _type: int = None, count: int = None):
         if isinstance(count, int):
-            if count > sys.maxsize:
-                raise IOError()
-            _data = self.buffer.read(count)
-            return _data
-
-        if _type == SERIALIZE_TYPE_UINT64:
-            return c_uint64.from_buffer(self.buffer)
-        elif _type == SERIALIZE_TYPE_INT64:
-            return c_int64.from_buffer(self.buffer)
-        elif _type == SERIALIZE_TYPE_UINT32:
-            return c_uint32.from_buffer(self.buffer)
-        elif _type == SERIALIZE_TYPE_INT32:
-            return c_int32.from_buffer(self.buffer)
-        elif _type == SERIALIZE_TYPE_UINT16:
-            return c_uint16.from_buffer(self.buffer)
-        elif _type == SERIALIZE_TYPE_INT16:
-            return c_int16.from_buffer(self.buffer)
-        elif _type == SERIALIZE_TYPE_UINT8:
-            return c_ubyte.from_buffer(self.buffer)
-        elif _type == SERIALIZE_TYPE_INT8:
-            return c_byte.from_buffer(self.buffer)
-        elif _type == SERIALIZE_TYPE_OBJECT:
+            if count > self.limits.max_string_length:
+                raise IOError("string too long: %d bytes" % count)
+            end = self.offset + count
+            if end > self.size:
+                raise IOError("unexpected end of payload")
+            _data = self.buffer[self.offset:end]
+            self.offset = end
+            return _data if self.views else bytes(_data)
+
+        scalar = _SCALARS.get(_type)
+        if scalar is not None:
+            _struct, ctype = scalar
+            value = _struct.unpack_from(self.buffer, self.offset)[0]
+            self.offset += _struct.size
+            return value if self.native else ctype(value)
+        elif _type == _TYPE_OBJECT:
+            if self.lazy:
+                return self.read_lazy_section()
             return self.read_section()
-        elif _type == SERIALIZE_TYPE_STRING:
+        elif _type == _TYPE_STRING:
             return self.read_byte_array()
+        raise IOError("unsupported type: %s" % _type)
+
+    def read_lazy_section(self):
+        from levin.section import LazySection
+        index = {}
+        buffer = self.buffer
+        count = self._section_size([])
+
+        # values are skipped one level below this section
+        self._depth += 1
+        try:
+            while count > 0:
+                offset = self.offset
+                len_name = buffer[offset]
+                offset += 1
+                section_name = str(buffer[offset:offset + len_name], 'ascii')
+                offset += len_name
+                _type = buffer[offset]
+                self.offset = offset + 1
+                if _type == _TYPE_ARRAY:
+                    # index the flagged element type that follows
+                    _type = buffer[self.offset]
+                    self.offset += 1
+                    if not _type & _FLAG_ARRAY:
+                        raise IOError("wrong type sequences")
+                index[section_name] = (_type, self.offset)
+                self.skip_entry(_type)
+                count -= 1
+        finally:
+            self._depth -= 1
+
+        if self.offset > self.size:
+            raise IOError("unexpected end of payload")
+        return LazySection(self, index)
+
+    def read_lazy_array(self):
+        from levin.section import LazyArray
+        offsets = []
+        size = self.read_array_size(1)
+
+        while size > 0:
+            offsets.append(self.offset)
+            self.skip_section()
+            size -= 1
+
+        if self.offset > self.size:
+            raise IOError("unexpected end of payload")
+        return LazyArray(self, offsets)
+
+    def read_at(self, offset: int, _type: int = None):
+        """Decodes the storage entry of `_type` at `offset` (object if omitted)"""
+        # the whole payload was checked against the limits when it was skimmed
+        previous, objects = self.offset, self._objects
+        self.offset = offset
+        try:
+            if _type is None:
+                return self.read_lazy_section() if self.lazy else self.read_section()
+            if _type & _FLAG_ARRAY:
+                return self.load_storage_array_entry(_type)
+            if _type == _TYPE_ARRAY:
+                return self.read_storage_entry_array_entry()
+            return self.read(_type=_type)
+        except (struct.error, IndexError):
+            raise IOError("unexpected end of payload")
+        finally:
+            self.offset, self._objects = previous, objects
+
+    def skip_entry(self, _type: int):
+        if _type & _FLAG_ARRAY:
+            self.skip_array(_type & ~_FLAG_ARRAY)
+        elif _type == _TYPE_ARRAY:
+            _type = self.buffer[self.offset]
+            self.offset += 1
+            if not _type & _FLAG_ARRAY:
+                raise IOError("wrong type sequences")
+            self.skip_array(_type & ~_FLAG_ARRAY)
+        else:
+            self.skip(_type)
+
+    def skip(self, _type: int):
+        scalar = _SCALARS.get(_type)
+        if scalar is not None:
+            self.offset += scalar[0].size
+        elif _type == _TYPE_STRING:
+            count = self.read_var_int()
+            if count > self.limits.max_string_length:
+                raise IOError("string too long: %d bytes" % count)
+            self.offset += count
+        elif _type == _TYPE_OBJECT:
+            self.skip_section()
+        else:
+            raise IOError("unsupported type: %d" % _type)
+
+    def skip_section(self):
+        stack = []
+        stack.append(self._section_size(stack))
+        self._skip_nested(stack)
+
+    def _skip_nested(self, stack: list):
+        """Skips to the end of the sections and arrays of sections or of arrays open on `stack`"""
+        buffer = self.buffer
+        # fields left per open section; arrays are [elements left, element type]
+        while stack:
+            frame = stack[-1]
+            if isinstance(frame, list):
+                if frame[0] == 0:
+                    stack.pop()
+                elif frame[1] == _TYPE_OBJECT:
+                    frame[0] -= 1
+                    stack.append(self._section_size(stack))
+                else:
+                    frame[0] -= 1
+                    self._skip_open(stack, self._array_type())
+                continue
+            if frame == 0:
+                stack.pop()
+                continue
+            stack[-1] = frame - 1
+
+            offset = self.offset
+            offset += 1 + buffer[offset]
+            _type = buffer[offset]
+            self.offset = offset + 1
+            if _type == _TYPE_ARRAY:
+                _type = buffer[self.offset]
+                self.offset += 1
+                if not _type & _FLAG_ARRAY:
+                    raise IOError("wrong type sequences")
+            if _type == _TYPE_OBJECT:
+                stack.append(self._section_size(stack))
+            elif _type & _FLAG_ARRAY:
+                self._skip_open(stack, _type & ~_FLAG_ARRAY)
+            else:
+                self.skip(_type)
+
+    def _skip_open(self, stack: list, _type: int):
+        """Skips an array of `_type` elements, or opens a frame on `stack` for one of sections or arrays"""
+        if _type == _TYPE_OBJECT or _type == _TYPE_ARRAY:
+            self._enter(stack)
+            stack.append([self.read_array_size(1), _type])
+        else:
+            self.skip_array(_type)
+
+    def skip_array(self, _type: int):
+        scalar = _SCALARS.get(_type)
+        if scalar is not None:
+            size = self.read_array_size(scalar[0].size)
+            self.offset += scalar[0].size * size
+            return
+
+        if _type == _TYPE_OBJECT or _type == _TYPE_ARRAY:
+            # an array of sections or of arrays is a level of nesting of its own
+            stack = []
+            self._skip_open(stack, _type)
+            self._skip_nested(stack)
+            return
+        if _type != _TYPE_STRING:
+            raise IOError("unsupported type: %d" % _type)
+        size = self.read_array_size(1)
+
+        while size > 0:
+            self.skip(_type)
+            size -= 1
 
     def read_byte_array(self, count: int = None):
         if not isinstance(count, int):
@@ -113,24 +579,21 @@ class LevinReader:
         return self.read(count=count)
 
     def read_var_int(self):
-        b = c_ubyte.from_buffer(self.buffer)
-        size_mask = b & PORTABLE_RAW_SIZE_MARK_MASK
-
-        if size_mask == PORTABLE_RAW_SIZE_MARK_BYTE:
-            v = rshift(b, 2)
-        elif size_mask == PORTABLE_RAW_SIZE_MARK_WORD:
-            v = rshift(self.read_rest(b, 1), 2)
-        elif size_mask == PORTABLE_RAW_SIZE_MARK_DWORD:
-            v = rshift(self.read_rest(b, 3), 2)
-        elif size_mask == PORTABLE_RAW_SIZE_MARK_INT64:
-            v = rshift(self.read_rest(b, 7), 2)
-        else:
-            raise IOError('invalid var_int')
-        return v
-
-    def read_rest(self, first_byte: int, _bytes: int):
-        result = first_byte
-        for i in range(0, _bytes):
-            result += (c_ubyte.from_buffer(self.buffer) << 8)
+        # contrib/epee/include/storages/portable_storage_from_bin.h:read_varint
+        buffer, offset = self.buffer, self.offset
+        b = buffer[offset]
+        size_mask = b & 0x03
 
-        return result
+        if size_mask == 0:  # PORTABLE_RAW_SIZE_MARK_BYTE
+            self.offset = offset + 1
+            return b >> 2
+        elif size_mask == 1:  # PORTABLE_RAW_SIZE_MARK_WORD
+            v = _UINT16.unpack_from(buffer, offset)[0]
+            self.offset = offset + 2
+        elif size_mask == 2:  # PORTABLE_RAW_SIZE_MARK_DWORD
+            v = _UINT32.unpack_from(buffer, offset)[0]
+            self.offset = offset + 4
+        else:  # PORTABLE_RAW_SIZE_MARK_INT64
+            v = _UINT64.unpack_from(buffer, offset)[0]
+            self.offset = offset + 8
+        return v >> 2
@@ -0,0 +1,220 @@
+"""
+Recording of live traffic. Nothing is recorded until a recorder is
+installed; every call site only checks `recorder.active is not None`.
+
+    from levin import recorder
+    r = recorder.enable('node.dump', max_bytes=256 << 20)
+    ...
+    recorder.disable()
+    for path in r.files():
+        for frame in capture.replay(path):
+            ...
+
+Every frame received or sent by `Bucket.recv()`/`send()`, `LevinConnection`
+and `LevinServer` is appended, header included, to a dump file (see
+`levin.capture`) with its time, peer and direction. The receive path only
+queues references to the frame's buffers, the send path copies those that
+are mutable; a writer thread packs and writes them in batches, and rotates
+the file at `max_bytes` like `logging.handlers.RotatingFileHandler`
+(node.dump, node.dump.1, ...).
+
+The receive and send paths pay about a microsecond per frame. Writing is
+not free either: on a single core the writer thread's copy and write of
+each frame (about 10us per 32KB) competes with the connections, so
+framing-only throughput of large frames drops by up to 3x while recording;
+decoding dwarfs it.
+"""
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger()
+
+active = None
+
+# directions, as in levin.capture
+IN = 0
+OUT = 1
+
+
+def enable(path: str, **options) -> 'Recorder':
+    """Starts recording to `path` process wide and returns the `Recorder`; see its options"""
+    global active
+    disable()
+    active = Recorder(path, **options)
+    return active
+
+
+def disable():
+    """Stops recording; frames queued so far are written out first"""
+    global active
+    r, active = active, None
+    if r is not None:
+        r.close()
+
+
+class Recorder:
+    """
+    Appends frames to a rotating dump file from a background thread. At most
+    `max_pending` bytes wait to be written; frames beyond that are dropped
+    (and counted) rather than slowing down the connection. The queue is
+    written out when it holds `batch_size` bytes or every `interval` seconds.
+    """
+    def __init__(self, path: str, max_bytes: int = 64 << 20, backups: int = 4, batch_size: int = 1 << 20,
+                 interval: float = 0.5, max_pending: int = 64 << 20):
+        from levin import capture
+        self._capture = capture
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+
+        self.frames = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.rotations = 0
+
+        self._lock = threading.Lock()
+        self._queue = []
+        self._pending = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._writer = capture.DumpWriter(path)
+        # size of a file without records
+        self._empty = capture._DUMP_HEADER.size
+        self._thread = threading.Thread(target=self._run, name='levin-recorder', daemon=True)
+        self._thread.start()
+
+    def frame_in(self, peer, header, payload):
+        """
+        A frame received from `peer` ((host, port) or 'host:port'). The
+        buffers (bytes, bytearray or mmap) are written later, so they must
+        not be reused until then.
+        """
+        self._add(IN, peer, (header, payload))
+
+    def frame_out(self, peer, buffers: list):
+        """
+        A frame sent to `peer`, as the buffers handed to the transport. Those
+        that are not `bytes` (e.g. a `MessageTemplate.render_into()` view of a
+        reused buffer) are copied.
+        """
+        for b in buffers:
+            if type(b) is not bytes:
+                buffers = [b if type(b) is bytes else bytes(b) for b in buffers]
+                break
+        self._add(OUT, peer, buffers)
+
+    def _add(self, direction: int, peer, buffers):
+        size = sum(map(len, buffers))
+        with self._lock:
+            if self._closed or self._pending + size > self.max_pending:
+                self.dropped += 1
+                return
+            self._queue.append((time.time(), direction, peer, buffers, size))
+            self._pending += size
+            full = self._pending >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self._lock:
+                queue, self._queue, self._pending = self._queue, [], 0
+                closed = self._closed
+            if queue:
+                # flush() markers
+                waiters = [entry for entry in queue if isinstance(entry, threading.Event)]
+                if waiters:
+                    queue = [entry for entry in queue if not isinstance(entry, threading.Event)]
+                try:
+                    self._write(queue)
+                except Exception as e:
+                    log.error("recorder: dropping %d frames, %s", len(queue), e)
+                    with self._lock:
+                        self.dropped += len(queue)
+                for waiter in waiters:
+                    waiter.set()
+            if closed:
+                return
+
+    def _write(self, queue: list):
+        pack = self._capture._RECORD.pack
+        endpoint = self._capture.endpoint
+        # encoded peer names of this batch
+        peers = {}
+        writer = self._writer
+        # of the file, with the parts not written yet
+        size = writer.size
+        parts = []
+        for timestamp, direction, peer, buffers, length in queue:
+            name = peers.get(peer)
+            if name is None:
+                name = peers[peer] = endpoint(peer).encode('ascii')[:255]
+            header = pack(timestamp, direction, len(name), length) + name
+            if size + len(header) + length > self.max_bytes and size > self._empty:
+                writer.write_raw(b''.join(parts))
+                parts = []
+                writer = self._rotate()
+                size = writer.size
+            parts.append(header)
+            parts.extend(buffers)
+            size += len(header) + length
+            self.frames += 1
+            self.bytes += length
+        # one write per batch; joining costs less than a write per buffer
+        writer.write_raw(b''.join(parts))
+        writer.flush()
+
+    def _rotate(self):
+        self._writer.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                source = '%s.%d' % (self.path, i)
+                if os.path.exists(source):
+                    os.replace(source, '%s.%d' % (self.path, i + 1))
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self._writer = self._capture.DumpWriter(self.path)
+        return self._writer
+
+    def flush(self):
+        """Blocks until the frames queued so far are on disk (in the OS cache)"""
+        done = threading.Event()
+        with self._lock:
+            if self._closed:
+                return
+            self._queue.append(done)
+        self._wake.set()
+        done.wait()
+
+    def files(self) -> list:
+        """the dump files written so far, oldest first"""
+        paths = ['%s.%d' % (self.path, i) for i in range(self.backups, 0, -1)] + [self.path]
+        return [path for path in paths if os.path.exists(path)]
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return '<Recorder %s frames=%d bytes=%d dropped=%d rotations=%d>' % (
+            self.path, self.frames, self.bytes, self.dropped, self.rotations)
@@ -1,15 +1,22 @@
 from time import time
 import random
+import socket
+from array import array
 from io import BytesIO
-from collections import OrderedDict
+from collections.abc import MutableMapping, Sequence
 
 from levin.constants import *
 from levin.ctypes import *
 
 
 class Section:
+    # entries: key -> value in insertion order; types: serialize type per key,
+    # set on sections decoded with native values, otherwise None
+    __slots__ = ('entries', 'types')
+
     def __init__(self):
-        self.entries = OrderedDict()
+        self.entries = {}
+        self.types = None
 
     def add(self, key: str, entry: object):
         self.entries[key] = entry
@@ -18,9 +25,9 @@ class Section:
         return len(self.entries.keys())
 
     @classmethod
-    def from_byte_array(cls, buffer: BytesIO):
+    def from_byte_array(cls, buffer: BytesIO, **options):
         from levin.reader import LevinReader
-        x = LevinReader(buffer)
+        x = LevinReader(buffer, **options)
         section = x.read_payload()
         return section
 
@@ -39,16 +46,75 @@ class Section:
         node_data.add("network_id", c_string(network_id))
         node_data.add("peer_id", c_uint64(peer_id))
         section.add("node_data", node_data)
+        section.add("payload_data", cls.sync_data())
+        return section
 
-        payload_data = Section()
+    @classmethod
+    def sync_data(cls):
+        # CORE_SYNC_DATA of a node sitting at the genesis block
+        payload_data = cls()
         payload_data.add("cumulative_difficulty", c_uint64(1))
         payload_data.add("current_height", c_uint64(1))
         genesis_hash = bytes.fromhex("418015bb9ae982a1975da7d79277c2705727a56894ba0fb246adaabb1f4632e3")  # genesis
         payload_data.add("top_id", c_string(genesis_hash))
         payload_data.add("top_version", c_ubyte(1))
-        section.add("payload_data", payload_data)
+        return payload_data
+
+    @classmethod
+    def timed_sync_request(cls):
+        section = cls()
+        section.add("payload_data", cls.sync_data())
+        return section
+
+    @classmethod
+    def timed_sync_response(cls, peers: list = None):
+        section = cls()
+        section.add("local_time", c_uint64(int(time())))
+        section.add("payload_data", cls.sync_data())
+        if peers:
+            section.add("local_peerlist_new", list(peers))
+        return section
+
+    @classmethod
+    def ping_response(cls, peer_id: int):
+        section = cls()
+        section.add("status", c_string(b"OK"))
+        section.add("peer_id", c_uint64(peer_id))
+        return section
+
+    @classmethod
+    def handshake_response(cls, peers: list = None, my_port: int = 0, network_id: bytes = None,
+                           peer_id: int = None, support_flags: int = None):
+        """`peers` are (ip, port) or (ip, port, last_seen) tuples, see `peer_entry()`"""
+        section = cls.handshake_request(my_port=my_port, network_id=network_id, peer_id=peer_id)
+        if support_flags is not None:
+            section.entries["node_data"].add("support_flags", c_uint32(int(support_flags)))
+        if peers:
+            section.add("local_peerlist_new", [cls.peer_entry(*peer) for peer in peers])
         return section
 
+    @classmethod
+    def peer_entry(cls, ip: str, port: int, last_seen: int = None, peer_id: int = None):
+        """peerlist_entry for an IPv4 or IPv6 address"""
+        addr = cls()
+        adr = cls()
+        if ':' in ip:
+            addr.add("addr", c_string(socket.inet_pton(socket.AF_INET6, ip)))
+            addr.add("m_port", c_uint16(port))
+            adr.add("addr", addr)
+            adr.add("type", c_ubyte(2))
+        else:
+            addr.add("m_ip", c_uint32(int.from_bytes(socket.inet_aton(ip), 'little')))
+            addr.add("m_port", c_uint16(port))
+            adr.add("addr", addr)
+            adr.add("type", c_ubyte(1))
+
+        peer = cls()
+        peer.add("adr", adr)
+        peer.add("id", c_uint64(random.getrandbits(64) if peer_id is None else peer_id))
+        peer.add("last_seen", c_int64(int(time()) if last_seen is None else last_seen))
+        return peer
+
     @classmethod
     def create_flags_response(cls):
         section = cls()
@@ -81,3 +147,116 @@ class Section:
         buffer = writer.write_payload(self)
         buffer.seek(0)
         return buffer.read()
+
+
+class LazyEntries(MutableMapping):
+    """
+    Ordered key -> value mapping of a `LazySection`. Values are decoded from
+    the reader's buffer on first access and cached.
+    """
+    def __init__(self, reader, index: dict):
+        self._reader = reader
+        self._index = index
+        self._values = {}
+
+    def __getitem__(self, key: str):
+        try:
+            return self._values[key]
+        except KeyError:
+            _type, offset = self._index[key]
+            value = self._values[key] = self._reader.read_at(offset, _type)
+            return value
+
+    def __setitem__(self, key: str, value):
+        if key not in self._index:
+            self._index[key] = None
+        self._values[key] = value
+
+    def __delitem__(self, key: str):
+        del self._index[key]
+        self._values.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, list(self._index))
+
+
+class LazySection(Section):
+    """
+    Section decoded on demand by `LevinReader(buffer, lazy=True)`; only the
+    keys and value offsets are known up front.
+    """
+    def __init__(self, reader=None, index: dict = None):
+        self.entries = LazyEntries(reader, index if index is not None else {})
+
+    @property
+    def types(self) -> dict:
+        index = self.entries._index
+        return {k: v[0] for k, v in index.items() if v is not None}
+
+
+class LazyArray(Sequence):
+    """Array of objects whose elements are decoded into `LazySection`s on access"""
+    def __init__(self, reader, offsets: list):
+        self._reader = reader
+        self._offsets = offsets
+        self._items = [None] * len(offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        item = self._items[i]
+        if item is None:
+            item = self._items[i] = self._reader.read_at(self._offsets[i])
+        return item
+
+    def __len__(self):
+        return len(self._offsets)
+
+
+class StringArray(Sequence):
+    """
+    Compact array of strings: the string bytes back to back in one `data`
+    buffer and element i at `data[starts[i]:ends[i]]`. Decoded by
+    `LevinReader(buffer, columnar=True)` and written in bulk by `LevinWriter`.
+    """
+    __slots__ = ('data', 'starts', 'ends')
+
+    def __init__(self, data: bytes = b'', starts: array = None, ends: array = None):
+        self.data = data
+        self.starts = starts if starts is not None else array('Q')
+        self.ends = ends if ends is not None else array('Q')
+
+    @classmethod
+    def from_list(cls, items: list):
+        starts, ends = array('Q'), array('Q')
+        offset = 0
+        for item in items:
+            starts.append(offset)
+            offset += len(item)
+            ends.append(offset)
+        return cls(b''.join(items), starts, ends)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.data[self.starts[i]:self.ends[i]]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __eq__(self, other):
+        if isinstance(other, (StringArray, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return '%s(%d items, %d bytes)' % (self.__class__.__name__, len(self), len(self.data))
@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import random
+import sys
+import time
+
+from levin import metrics, recorder
+from levin.bucket import Bucket
+from levin.framing import LevinFrameDecoder
+from levin.section import Section
+from levin.template import MessageTemplate, Slot, _now
+from levin.constants import *
+from levin.ctypes import *
+
+log = logging.getLogger()
+
+
+class LevinServerProtocol(asyncio.Protocol):
+    """
+    One inbound connection of a `LevinServer`. Callback based, so an idle
+    connection costs this object, its transport and an empty frame decoder;
+    no task or stream buffers.
+    """
+    __slots__ = ('server', 'transport', 'peername', 'decoder', 'last_seen', 'peer_id')
+
+    def __init__(self, server: 'LevinServer'):
+        self.server = server
+        self.transport = None
+        self.peername = None
+        self.decoder = None
+        self.last_seen = time.monotonic()
+        self.peer_id = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peername = transport.get_extra_info('peername')
+        self.server.on_connect(self)
+
+    def data_received(self, data: bytes):
+        self.last_seen = time.monotonic()
+        if self.decoder is None:
+            self.decoder = LevinFrameDecoder(max_packet_size=self.server.max_packet_size, peer=self.peername)
+        try:
+            buckets = self.decoder.feed(data)
+        except IOError as e:
+            # bad framing or an undecodable payload
+            log.debug("dropping %s: %s", self.peername, e)
+            self.server.stats.malformed += 1
+            if metrics.hooks is not None:
+                metrics.hooks.error(LEVIN_ERROR_FORMAT)
+            self.transport.close()
+            return
+        for bucket in buckets:
+            self.server.dispatch(self, bucket)
+
+    def connection_lost(self, exc):
+        self.server.on_disconnect(self)
+
+    def send(self, bucket: Bucket):
+        if not self.transport.is_closing():
+            if metrics.hooks is not None:
+                metrics.hooks.frame_out(bucket.command.value, LEVIN_HEADER_SIZE + bucket.cb.value)
+            buffers = bucket.buffers()
+            if recorder.active is not None:
+                recorder.active.frame_out(self.peername, buffers)
+            self.transport.writelines(buffers)
+
+    def close(self):
+        self.transport.close()
+
+
+class ServerStats:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.handshakes = 0
+        self.requests = 0
+        self.errors = 0
+        self.malformed = 0
+
+    def __repr__(self):
+        return '<ServerStats accepted=%d rejected=%d handshakes=%d requests=%d errors=%d malformed=%d>' % (
+            self.accepted, self.rejected, self.handshakes, self.requests, self.errors, self.malformed)
+
+
+class LevinServer:
+    """
+    Listening Levin node. Answers inbound handshakes and timed_syncs with the
+    configured peer list, pings and support_flags requests, and logs who
+    connects. Requests are dispatched through `handlers`, keyed by the
+    `P2P_COMMANDS` codes; a handler is called as `handler(conn, bucket)` and
+    may return a `Section`, raw payload bytes or None, or be a coroutine
+    function returning one of those.
+
+        server = LevinServer(port=18080, peers=[('1.2.3.4', 18080)])
+        server.handlers[P2P_COMMAND_REQUEST_STAT_INFO.value] = on_stat_info
+        await server.start()
+        await server.serve_forever()
+    """
+    def __init__(
+        self,
+        host: str = '0.0.0.0',
+        port: int = 18080,
+        peers: list = None,
+        support_flags: int = P2P_SUPPORT_FLAGS.value,
+        network_id: bytes = None,
+        peer_id: int = None,
+        my_port: int = None,
+        max_connections: int = 10000,
+        max_packet_size: int = 1 << 20,
+        idle_timeout: float = None,
+    ):
+        self.host = host
+        self.port = port
+        self.support_flags = int(support_flags)
+        self.network_id = network_id
+        self.peer_id = random.getrandbits(64) if peer_id is None else peer_id
+        self.my_port = port if my_port is None else my_port
+        self.max_connections = max_connections
+        self.max_packet_size = max_packet_size
+        self.idle_timeout = idle_timeout
+        self.connections = set()
+        self.stats = ServerStats()
+        self.handlers = {
+            P2P_COMMAND_HANDSHAKE.value: self.on_handshake,
+            P2P_COMMAND_TIMED_SYNC.value: self.on_timed_sync,
+            P2P_COMMAND_PING.value: self.on_ping,
+            P2P_COMMAND_REQUEST_SUPPORT_FLAGS.value: self.on_support_flags,
+        }
+
+        self._server = None
+        self._sweeper = None
+        self._handshake = None
+        self._timed_sync = None
+        self._flags = bytes(Section.create_flags_response())
+        self._ping = bytes(Section.ping_response(self.peer_id))
+        self.set_peers(peers or [])
+
+    def set_peers(self, peers: list):
+        """Sets the (ip, port[, last_seen]) peer list handed out from now on"""
+        self.peers = list(peers)
+
+        section = Section.handshake_response(self.peers, my_port=self.my_port, network_id=self.network_id,
+                                             peer_id=self.peer_id, support_flags=self.support_flags)
+        section.entries["node_data"].add("local_time", Slot("local_time", c_uint64))
+        self._handshake = MessageTemplate(P2P_COMMAND_HANDSHAKE, section, local_time=_now)
+
+        section = Section.timed_sync_response(section.entries.get("local_peerlist_new"))
+        section.add("local_time", Slot("local_time", c_uint64))
+        self._timed_sync = MessageTemplate(P2P_COMMAND_TIMED_SYNC, section, local_time=_now)
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: LevinServerProtocol(self), self.host, self.port,
+                                                backlog=1024)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        if self.idle_timeout:
+            self._sweeper = asyncio.ensure_future(self._sweep())
+        log.info("listening on %s:%d", self.host, self.port)
+        return self
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    def on_connect(self, conn: LevinServerProtocol):
+        if len(self.connections) >= self.max_connections:
+            self.stats.rejected += 1
+            conn.close()
+            return
+        self.stats.accepted += 1
+        self.connections.add(conn)
+        log.debug("connection from %s", conn.peername)
+
+    def on_disconnect(self, conn: LevinServerProtocol):
+        self.connections.discard(conn)
+
+    def dispatch(self, conn: LevinServerProtocol, bucket: Bucket):
+        if not bucket.is_request:
+            return
+        self.stats.requests += 1
+        command = bucket.command.value
+        handler = self.handlers.get(command)
+        if handler is None:
+            if bucket.return_data.value:
+                conn.send(Bucket.create_response(command, return_code=LEVIN_ERROR_CONNECTION_HANDLER_NOT_DEFINED))
+            return
+
+        try:
+            result = handler(conn, bucket)
+        except Exception as e:
+            self._failed(conn, bucket, e)
+            return
+        if asyncio.iscoroutine(result):
+            task = asyncio.ensure_future(result)
+            task.add_done_callback(lambda t: self._respond(conn, bucket, t))
+            hooks = metrics.hooks
+            if hooks is not None:
+                hooks.queue('handlers', 1)
+                task.add_done_callback(lambda t: hooks.queue('handlers', -1))
+        else:
+            self._reply(conn, bucket, result)
+
+    def _respond(self, conn: LevinServerProtocol, bucket: Bucket, task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self._failed(conn, bucket, task.exception())
+        else:
+            self._reply(conn, bucket, task.result())
+
+    def _reply(self, conn: LevinServerProtocol, bucket: Bucket, result):
+        if not bucket.return_data.value:
+            return
+        if isinstance(result, (bytes, bytearray)):
+            conn.send(Bucket.create_response(bucket.command.value, payload=result))
+        else:
+            conn.send(Bucket.create_response(bucket.command.value, section=result))
+
+    def _failed(self, conn: LevinServerProtocol, bucket: Bucket, e: Exception):
+        self.stats.errors += 1
+        if metrics.hooks is not None:
+            metrics.hooks.error(LEVIN_ERROR_FORMAT)
+        log.debug("handler for '%s' failed: %s", P2P_COMMANDS[bucket.command], e)
+        if bucket.return_data.value:
+            conn.send(Bucket.create_response(bucket.command.value, return_code=LEVIN_ERROR_FORMAT))
+
+    def broadcast(self, command: int, section: Section = None, payload: bytes = None) -> int:
+        """Sends a notification (no response expected) to every connection; returns how many were sent"""
+        bucket = Bucket.create_request(int(command), payload=payload, section=section)
+        bucket.return_data = c_bool(False)
+        buffers = bucket.buffers()
+        sent = 0
+        for conn in self.connections:
+            if not conn.transport.is_closing():
+                conn.transport.writelines(buffers)
+                if recorder.active is not None:
+                    recorder.active.frame_out(conn.peername, buffers)
+                sent += 1
+        if metrics.hooks is not None:
+            for _ in range(sent):
+                metrics.hooks.frame_out(bucket.command.value, LEVIN_HEADER_SIZE + bucket.cb.value)
+        return sent
+
+    def on_handshake(self, conn: LevinServerProtocol, bucket: Bucket):
+        self.stats.handshakes += 1
+        node_data = bucket.payload_section.entries.get("node_data")
+        if node_data is not None and "peer_id" in node_data.entries:
+            conn.peer_id = int(node_data.entries["peer_id"])
+            log.info("handshake from %s peer_id=%016x my_port=%d", conn.peername, conn.peer_id,
+                     int(node_data.entries.get("my_port", 0)))
+        else:
+            log.info("handshake from %s", conn.peername)
+        return self._handshake.payload()
+
+    def on_timed_sync(self, conn: LevinServerProtocol, bucket: Bucket):
+        return self._timed_sync.payload()
+
+    def on_ping(self, conn: LevinServerProtocol, bucket: Bucket):
+        return self._ping
+
+    def on_support_flags(self, conn: LevinServerProtocol, bucket: Bucket):
+        return self._flags
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            deadline = time.monotonic() - self.idle_timeout
+            for conn in [c for c in self.connections if c.last_seen < deadline]:
+                log.debug("closing idle %s", conn.peername)
+                conn.close()
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._server is not None:
+            self._server.close()
+        for conn in list(self.connections):
+            conn.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a listening Levin node handing out a peer list')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--peers', help='file with one ip:port per line')
+    parser.add_argument('--max-connections', type=int, default=10000)
+    args = parser.parse_args(args)
+
+    peers = []
+    if args.peers:
+        with open(args.peers) as f:
+            for line in f:
+                host, _, port = line.strip().rpartition(':')
+                if host:
+                    peers.append((host.strip('[]'), int(port)))
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    async def serve():
+        async with LevinServer(args.host, args.port, peers=peers, max_connections=args.max_connections) as server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
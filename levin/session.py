@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, Counter
+
+from levin.aio import LevinConnection
+from levin.bucket import Bucket
+from levin.section import Section
+from levin.template import handshake_template, PING, TIMED_SYNC
+from levin.constants import *
+
+log = logging.getLogger()
+
+
+def peer_endpoints(bucket: Bucket) -> list:
+    """[(ip, port, last_seen), ...] advertised in a handshake or timed_sync response"""
+    peers = bucket.get_peers() or []
+    return [(p['ip'].ip, p['port'].value, p['last_seen'].value if 'last_seen' in p else '') for p in peers]
+
+
+class LevinSession:
+    """
+    A handshaked connection that stays open. Incoming timed_sync, ping and
+    support_flags requests are answered automatically, so the remote node
+    keeps us around; further requests go over the same connection. Extra
+    `handlers` ({command: handler(bucket)}, e.g. for notifications) are
+    installed before the handshake; `decoder_options` go to the connection's
+    `LevinFrameDecoder`.
+
+        async with LevinSession('212.83.175.67', 18080) as session:
+            peers = await session.peers()      # from the handshake
+            ...
+            peers = await session.peers()      # timed_sync, no new handshake
+    """
+    def __init__(self, host: str, port: int, network_id: bytes = None, my_port: int = 0,
+                 peer_id: int = None, timeout: float = 10.0, handlers: dict = None, **decoder_options):
+        self.host = host
+        self.port = port
+        self.network_id = network_id
+        self.my_port = my_port
+        self.peer_id = random.getrandbits(64) if peer_id is None else peer_id
+        self.timeout = timeout
+        self.handlers = handlers or {}
+        self.decoder_options = decoder_options
+        self.conn = None
+        self.handshake = None
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.last_checked = self.created
+        self.requests = 0
+        self._fresh_peers = None
+
+    async def open(self):
+        self.conn = await LevinConnection.connect(self.host, self.port, timeout=self.timeout, **self.decoder_options)
+        self.conn.add_handler(P2P_COMMAND_TIMED_SYNC, lambda bucket: Section.timed_sync_response())
+        self.conn.add_handler(P2P_COMMAND_PING, lambda bucket: Section.ping_response(self.peer_id))
+        for command, handler in self.handlers.items():
+            self.conn.add_handler(command, handler)
+        try:
+            frame = handshake_template(self.network_id).render(my_port=self.my_port, peer_id=self.peer_id)
+            self.handshake = await self.request(P2P_COMMAND_HANDSHAKE, frame=frame)
+        except BaseException:
+            await self.conn.close()
+            raise
+        if self.handshake.return_code.value < 0:
+            await self.conn.close()
+            raise ConnectionError("handshake refused by %s:%d (%d)" % (
+                self.host, self.port, self.handshake.return_code.value))
+        self._fresh_peers = peer_endpoints(self.handshake)
+        return self
+
+    @property
+    def closed(self) -> bool:
+        return self.conn is None or self.conn.closed
+
+    @property
+    def idle(self) -> float:
+        """seconds since the last request"""
+        return time.monotonic() - self.last_used
+
+    async def request(self, command: int, section: Section = None, timeout: float = None,
+                      frame: bytes = None) -> Bucket:
+        self.requests += 1
+        self.last_used = time.monotonic()
+        return await self.conn.request(command, section, timeout=timeout or self.timeout, frame=frame)
+
+    async def timed_sync(self) -> Bucket:
+        return await self.request(P2P_COMMAND_TIMED_SYNC, frame=TIMED_SYNC.frame)
+
+    async def ping(self) -> float:
+        """Round trip time of a ping, in seconds. Does not count as use of the session."""
+        started = time.monotonic()
+        await self.conn.request(P2P_COMMAND_PING, timeout=self.timeout, frame=PING.frame)
+        self.last_checked = time.monotonic()
+        return self.last_checked - started
+
+    async def peers(self) -> list:
+        """The peer list; taken from the handshake the first time, then from a timed_sync"""
+        if self._fresh_peers is not None:
+            peers, self._fresh_peers = self._fresh_peers, None
+            return peers
+        return peer_endpoints(await self.timed_sync())
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __repr__(self):
+        return '<LevinSession %s:%d requests=%d idle=%.1fs%s>' % (
+            self.host, self.port, self.requests, self.idle, ' closed' if self.closed else '')
+
+
+class PoolStats:
+    def __init__(self):
+        self.opened = 0
+        self.reused = 0
+        self.failed = 0
+        self.evicted_idle = 0
+        self.evicted_limit = 0
+        self.health_checks = 0
+        self.health_failed = 0
+
+    @property
+    def reuse_rate(self) -> float:
+        """fraction of session lookups served by an already open session"""
+        total = self.opened + self.reused
+        return self.reused / total if total else 0.0
+
+    def __repr__(self):
+        return ('<PoolStats opened=%d reused=%d failed=%d evicted_idle=%d evicted_limit=%d '
+                'health=%d/%d reuse=%.1f%%>') % (
+            self.opened, self.reused, self.failed, self.evicted_idle, self.evicted_limit,
+            self.health_checks - self.health_failed, self.health_checks, 100 * self.reuse_rate)
+
+
+class SessionPool:
+    """
+    Keeps `LevinSession`s per (host, port) and hands out the open one on
+    repeated requests. Sessions idle for `idle_timeout` seconds are closed;
+    sessions idle for `health_interval` seconds are pinged and dropped when
+    that fails. At most `max_per_host` sessions are kept per host address,
+    counting every port of it, and `max_sessions` in total, closing the
+    least recently used one to make room. Handshakes in flight count
+    towards both limits.
+
+        async with SessionPool(idle_timeout=300) as pool:
+            peers = await pool.peers('212.83.175.67', 18080)
+            print(pool.stats)
+    """
+    def __init__(self, max_per_host: int = 1, max_sessions: int = None, idle_timeout: float = 300.0,
+                 health_interval: float = 60.0, **session_options):
+        self.max_per_host = max_per_host
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.session_options = session_options
+        self.stats = PoolStats()
+
+        # (host, port) -> LevinSession, least recently used first
+        self._sessions = OrderedDict()
+        self._per_host = Counter()
+        self._reserved = 0
+        self._freed = asyncio.Event()
+        self._opening = {}
+        self._maintenance = None
+        self.closed = False
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def session(self, host: str, port: int) -> LevinSession:
+        """The open session to host:port, handshaking a new one if needed"""
+        if self.closed:
+            raise ConnectionError("session pool closed")
+        self._start()
+        return await self._session(host, port, retry=True)
+
+    async def _session(self, host: str, port: int, retry: bool) -> LevinSession:
+        key = (host, port)
+        session = self._sessions.get(key)
+        if session is not None and not session.closed:
+            self._sessions.move_to_end(key)
+            self.stats.reused += 1
+            return session
+        if session is not None:
+            self._discard(key)
+
+        # concurrent callers for the same endpoint share one handshake
+        opening = self._opening.get(key)
+        if opening is not None:
+            try:
+                session = await asyncio.shield(opening)
+            except asyncio.CancelledError:
+                if not opening.cancelled():
+                    raise
+                if self.closed:
+                    raise ConnectionError("session pool closed")
+                # the caller that started the handshake was cancelled; try once on our own
+                if not retry:
+                    raise
+                return await self._session(host, port, retry=False)
+            self.stats.reused += 1
+            return session
+
+        opening = self._opening[key] = asyncio.ensure_future(self._open(host, port))
+        try:
+            return await asyncio.shield(opening)
+        except asyncio.CancelledError:
+            if self.closed and opening.cancelled():
+                raise ConnectionError("session pool closed")
+            raise
+        finally:
+            if self._opening.get(key) is opening:
+                del self._opening[key]
+            if not opening.done():
+                # abandoned; waiters see it cancelled rather than a handshake nobody owns
+                opening.cancel()
+
+    async def _open(self, host: str, port: int) -> LevinSession:
+        # reserve a slot first; handshakes in flight count towards the limits
+        while self._per_host[host] >= self.max_per_host or \
+                (self.max_sessions is not None and self._reserved >= self.max_sessions):
+            if self._per_host[host] >= self.max_per_host:
+                victim = next((k for k in self._sessions if k[0] == host), None)
+            else:
+                victim = next(iter(self._sessions), None)
+            if victim is None:
+                await self._freed.wait()
+            else:
+                await self._evict(victim)
+        self._per_host[host] += 1
+        self._reserved += 1
+
+        try:
+            session = await LevinSession(host, port, **self.session_options).open()
+        except BaseException as e:
+            if not isinstance(e, asyncio.CancelledError):
+                self.stats.failed += 1
+            self._release(host)
+            raise
+        self.stats.opened += 1
+        self._sessions[(host, port)] = session
+        return session
+
+    async def request(self, host: str, port: int, command: int, section: Section = None,
+                      timeout: float = None, frame: bytes = None) -> Bucket:
+        """Sends a request over the pooled session, reconnecting once if a reused one went away"""
+        session = await self.session(host, port)
+        try:
+            return await session.request(command, section, timeout=timeout, frame=frame)
+        except ConnectionError:
+            if not session.closed:
+                raise
+            self._discard((host, port))
+            session = await self.session(host, port)
+            return await session.request(command, section, timeout=timeout, frame=frame)
+
+    async def peers(self, host: str, port: int) -> list:
+        session = await self.session(host, port)
+        try:
+            return await session.peers()
+        except ConnectionError:
+            if not session.closed:
+                raise
+            self._discard((host, port))
+            return await (await self.session(host, port)).peers()
+
+    async def _evict(self, key: tuple):
+        session = self._discard(key)
+        if session is not None:
+            self.stats.evicted_limit += 1
+            await session.close()
+
+    def _discard(self, key: tuple) -> LevinSession:
+        session = self._sessions.pop(key, None)
+        if session is not None:
+            self._release(key[0])
+        return session
+
+    def _release(self, host: str):
+        if self.closed:
+            # close() resets the counts
+            return
+        self._per_host[host] -= 1
+        if not self._per_host[host]:
+            del self._per_host[host]
+        self._reserved -= 1
+        self._freed.set()
+        self._freed = asyncio.Event()
+
+    def _start(self):
+        if self._maintenance is None and (self.idle_timeout or self.health_interval):
+            self._maintenance = asyncio.ensure_future(self._maintain())
+
+    async def _maintain(self):
+        interval = min(t for t in (self.idle_timeout, self.health_interval) if t)
+        while True:
+            await asyncio.sleep(interval / 2)
+            try:
+                await self.check()
+            except Exception as e:
+                log.error("session pool maintenance failed: %s", e, exc_info=True)
+
+    async def check(self):
+        """Closes idle sessions and pings the ones quiet for `health_interval`"""
+        probes = []
+        for key, session in list(self._sessions.items()):
+            # closing a session below yields; others may have gone or been replaced meanwhile
+            if self._sessions.get(key) is not session:
+                continue
+            if session.closed:
+                self._discard(key)
+            elif self.idle_timeout and session.idle >= self.idle_timeout:
+                log.debug("closing idle session %s:%d", *key)
+                self._discard(key)
+                self.stats.evicted_idle += 1
+                await session.close()
+            elif self.health_interval and \
+                    time.monotonic() - max(session.last_used, session.last_checked) >= self.health_interval:
+                probes.append((key, session))
+
+        probes = [(key, session) for key, session in probes if self._sessions.get(key) is session]
+        if probes:
+            results = await asyncio.gather(*(session.ping() for _, session in probes),
+                                           return_exceptions=True)
+            for (key, session), result in zip(probes, results):
+                self.stats.health_checks += 1
+                if isinstance(result, BaseException):
+                    log.debug("health check of %s:%d failed: %s", key[0], key[1], result)
+                    self.stats.health_failed += 1
+                    if self._sessions.get(key) is session:
+                        self._discard(key)
+                    await session.close()
+
+    async def close(self):
+        """Closes every session and cancels the handshakes in flight; the pool can't be used after"""
+        self.closed = True
+        tasks = list(self._opening.values())
+        if self._maintenance is not None:
+            tasks.append(self._maintenance)
+            self._maintenance = None
+        for task in tasks:
+            task.cancel()
+        # a handshake finishing before its cancellation lands leaves its session in the pool
+        await asyncio.gather(*tasks, return_exceptions=True)
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        self._opening.clear()
+        self._per_host.clear()
+        self._reserved = 0
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,146 @@
+import struct
+from time import time
+
+from levin.bucket import Bucket
+from levin.section import Section
+from levin.writer import LevinWriter, _TYPES, _FORMATS, _UINT8
+from levin.exceptions import BadArgumentException
+from levin.constants import *
+from levin.ctypes import *
+
+
+class Slot:
+    """
+    Placeholder for a variable value in a `MessageTemplate` section. Slots
+    are fixed width: integer ctypes, or `c_string` with a fixed `size`.
+    """
+    __slots__ = ('name', 'ctype', 'size')
+
+    def __init__(self, name: str, ctype=c_uint64, size: int = None):
+        if ctype is c_string:
+            if size is None:
+                raise BadArgumentException("string slots need a size")
+        elif ctype not in _TYPES or _TYPES[ctype] not in _FORMATS:
+            raise BadArgumentException("slot type must be fixed width")
+        self.name = name
+        self.ctype = ctype
+        self.size = size
+
+
+class _TemplateWriter(LevinWriter):
+    def __init__(self):
+        super(_TemplateWriter, self).__init__()
+        self.slots = {}
+
+    def serialized_write(self, data, _type: int = None):
+        if not isinstance(data, Slot):
+            return super(_TemplateWriter, self).serialized_write(data, _type)
+
+        stype = _TYPES[data.ctype]
+        self.write(_UINT8.pack(stype))
+        if data.ctype is c_string:
+            self.write_var_in(data.size)
+            self.slots[data.name] = (self._written, data.size, None)
+            self.write(bytes(data.size))
+        else:
+            _struct = struct.Struct('<' + _FORMATS[stype])
+            self.slots[data.name] = (self._written, _struct.size, _struct)
+            self.write(bytes(_struct.size))
+
+
+class MessageTemplate:
+    """
+    A bucket (header + payload) serialized once, with `Slot`s that are
+    patched in place per message:
+
+        template = MessageTemplate(P2P_COMMAND_PING, Section())
+        sock.send(template.render())
+
+    `render()` copies the precompiled frame and packs the given slot values
+    into it; `render_into()` does the same into a caller owned buffer.
+    """
+    def __init__(self, command: int, section: Section, return_data: bool = True,
+                 flags: c_uint32 = LEVIN_PACKET_REQUEST, **defaults):
+        writer = _TemplateWriter()
+        writer.write_payload(section)
+        payload = writer.buffer.getvalue()
+
+        bucket = Bucket.create_request(int(command), payload=payload)
+        bucket.return_data = c_bool(return_data)
+        bucket.flags = flags
+
+        self.command = int(command)
+        self.frame = bucket.header() + payload
+        self.size = len(self.frame)
+        self.defaults = defaults
+        self.slots = {name: (LEVIN_HEADER_SIZE + offset, size, _struct)
+                      for name, (offset, size, _struct) in writer.slots.items()}
+
+    def render(self, **values) -> bytearray:
+        buffer = bytearray(self.frame)
+        self._patch(buffer, values)
+        return buffer
+
+    def render_into(self, buffer: bytearray, **values) -> memoryview:
+        """Renders into the first `self.size` bytes of `buffer`"""
+        view = memoryview(buffer)[:self.size]
+        view[:] = self.frame
+        self._patch(view, values)
+        return view
+
+    def payload(self, **values) -> bytes:
+        return bytes(self.render(**values)[LEVIN_HEADER_SIZE:])
+
+    def bucket(self, **values) -> Bucket:
+        bucket = Bucket.create_request(self.command, payload=self.payload(**values))
+        bucket.return_data = c_bool(self.frame[16] == 1)
+        return bucket
+
+    def _patch(self, buffer, values: dict):
+        slots = self.slots
+        for name, value in (dict(self.defaults, **values) if self.defaults else values).items():
+            offset, size, _struct = slots[name]
+            if callable(value):
+                value = value()
+            if _struct is None:
+                if len(value) != size:
+                    raise BadArgumentException("slot '%s' takes %d bytes" % (name, size))
+                buffer[offset:offset + size] = value
+            else:
+                _struct.pack_into(buffer, offset, value)
+
+
+def _now() -> int:
+    return int(time())
+
+
+_handshake_templates = {}
+
+
+def handshake_template(network_id: bytes = None) -> MessageTemplate:
+    """COMMAND_HANDSHAKE request with local_time, my_port and peer_id slots"""
+    template = _handshake_templates.get(network_id)
+    if template is None:
+        section = Section.handshake_request(network_id=network_id, peer_id=0)
+        node_data = section.entries["node_data"]
+        node_data.add("local_time", Slot("local_time", c_uint64))
+        node_data.add("my_port", Slot("my_port", c_uint32))
+        node_data.add("peer_id", Slot("peer_id", c_uint64))
+        template = MessageTemplate(P2P_COMMAND_HANDSHAKE, section, local_time=_now)
+        _handshake_templates[network_id] = template
+    return template
+
+
+def stat_info_template() -> MessageTemplate:
+    """COMMAND_REQUEST_STAT_INFO request with peer_id and time slots"""
+    section = Section.stat_info_request(peer_id=0)
+    proof_of_trust = section.entries["proof_of_trust"]
+    proof_of_trust.add("peer_id", Slot("peer_id", c_uint64))
+    proof_of_trust.add("time", Slot("time", c_uint64))
+    return MessageTemplate(P2P_COMMAND_REQUEST_STAT_INFO, section, time=_now)
+
+
+PING = MessageTemplate(P2P_COMMAND_PING, Section())
+SUPPORT_FLAGS = MessageTemplate(P2P_COMMAND_REQUEST_SUPPORT_FLAGS, Section())
+TIMED_SYNC = MessageTemplate(P2P_COMMAND_TIMED_SYNC, Section.timed_sync_request())
+STAT_INFO = stat_info_template()
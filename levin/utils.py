@@ -4,6 +4,7 @@ import socket
 import ipaddress
 import struct
 from io import BytesIO
+from collections import deque
 
 
 def ip2int(addr):
@@ -14,6 +15,64 @@ def int2ip(addr):
     return ipaddress.IPv4Address(addr)
 
 
+_IPV4_MAPPED = b'\x00' * 10 + b'\xff\xff'
+
+
+def pack_address(host: str) -> bytes:
+    # 16 byte address; IPv4 as ::ffff:a.b.c.d
+    if ':' in host:
+        return socket.inet_pton(socket.AF_INET6, host)
+    return _IPV4_MAPPED + socket.inet_aton(host)
+
+
+def unpack_address(address: bytes) -> str:
+    if address.startswith(_IPV4_MAPPED):
+        return socket.inet_ntoa(address[12:])
+    return socket.inet_ntop(socket.AF_INET6, address)
+
+
 def rshift(val, n):
     # 32bit rightshift
     return (val % 0x100000000) >> n
+
+
+def recv_into(sock: socket.socket, view: memoryview):
+    # fill `view` completely from `sock`
+    while view:
+        n = sock.recv_into(view)
+        if not n:
+            raise IOError("connection closed")
+        view = view[n:]
+
+
+# max. buffers per sendmsg call (IOV_MAX on Linux)
+SENDMSG_MAX_BUFFERS = 1024
+
+
+def sendmsg_all(sock: socket.socket, buffers: list):
+    # scatter/gather write of all `buffers`, resuming after partial writes
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(buffers))
+        return
+
+    if len(buffers) <= SENDMSG_MAX_BUFFERS:
+        sent = sock.sendmsg(buffers)
+        total = sum(map(len, buffers))
+        if sent == total:
+            return
+    else:
+        sent = 0
+
+    views = deque(memoryview(b).cast('B') for b in buffers if len(b))
+    while True:
+        while sent:
+            size = len(views[0])
+            if sent >= size:
+                sent -= size
+                views.popleft()
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+        if not views:
+            return
+        sent = sock.sendmsg([views[i] for i in range(min(len(views), SENDMSG_MAX_BUFFERS))])
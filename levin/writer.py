@@ -1,12 +1,78 @@
+import sys
+import struct
+from array import array
+from collections.abc import Sequence
 from io import BytesIO
 
-from levin.section import Section
+from levin.reader import _speedups
+from levin.section import Section, StringArray
 from levin.exceptions import BadArgumentException
 from levin.constants import *
 from levin.ctypes import *
 
+# ctype -> serialize type
+_TYPES = {
+    c_uint64: SERIALIZE_TYPE_UINT64.value,
+    c_int64: SERIALIZE_TYPE_INT64.value,
+    c_uint32: SERIALIZE_TYPE_UINT32.value,
+    c_int32: SERIALIZE_TYPE_INT32.value,
+    c_uint16: SERIALIZE_TYPE_UINT16.value,
+    c_int16: SERIALIZE_TYPE_INT16.value,
+    c_ubyte: SERIALIZE_TYPE_UINT8.value,
+    c_byte: SERIALIZE_TYPE_INT8.value,
+    c_double: SERIALIZE_TYPE_DOUBLE.value,
+    c_bool: SERIALIZE_TYPE_BOOL.value,
+    c_string: SERIALIZE_TYPE_STRING.value,
+}
+
+# serialize type -> struct format character of fixed-width values
+_FORMATS = {
+    SERIALIZE_TYPE_UINT64.value: 'Q',
+    SERIALIZE_TYPE_INT64.value: 'q',
+    SERIALIZE_TYPE_UINT32.value: 'I',
+    SERIALIZE_TYPE_INT32.value: 'i',
+    SERIALIZE_TYPE_UINT16.value: 'H',
+    SERIALIZE_TYPE_INT16.value: 'h',
+    SERIALIZE_TYPE_UINT8.value: 'B',
+    SERIALIZE_TYPE_INT8.value: 'b',
+    SERIALIZE_TYPE_DOUBLE.value: 'd',
+    SERIALIZE_TYPE_BOOL.value: '?',
+}
+# serialize type -> precompiled `<type byte><value>` struct for scalar entries
+_SCALARS = {t: struct.Struct('<B' + f) for t, f in _FORMATS.items()}
+
+# array.array typecode -> serialize type, by item size for the platform dependent ones
+_ARRAY_TYPES = {
+    ('Q', 8): SERIALIZE_TYPE_UINT64, ('L', 8): SERIALIZE_TYPE_UINT64,
+    ('q', 8): SERIALIZE_TYPE_INT64, ('l', 8): SERIALIZE_TYPE_INT64,
+    ('I', 4): SERIALIZE_TYPE_UINT32, ('L', 4): SERIALIZE_TYPE_UINT32,
+    ('i', 4): SERIALIZE_TYPE_INT32, ('l', 4): SERIALIZE_TYPE_INT32,
+    ('H', 2): SERIALIZE_TYPE_UINT16,
+    ('h', 2): SERIALIZE_TYPE_INT16,
+    ('B', 1): SERIALIZE_TYPE_UINT8,
+    ('b', 1): SERIALIZE_TYPE_INT8,
+    ('d', 8): SERIALIZE_TYPE_DOUBLE,
+}
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+_UINT8 = struct.Struct('<B')
+_UINT16 = struct.Struct('<H')
+_UINT32 = struct.Struct('<I')
+_UINT64 = struct.Struct('<Q')
+
+_TYPE_STRING = SERIALIZE_TYPE_STRING.value
+_TYPE_OBJECT = SERIALIZE_TYPE_OBJECT.value
+_TYPE_ARRAY = SERIALIZE_TYPE_ARRAY.value
+_FLAG_ARRAY = SERIALIZE_FLAG_ARRAY.value
+
 
 class LevinWriter:
+    """
+    Portable storage encoder. Values may be `_CType` wrappers, `Section`s,
+    `bytes` (strings), lists of any of those, `array.array`/`StringArray`,
+    or native `int`/`float`/`bool` values. Native ints need their serialize
+    type in the enclosing `Section.types`, as set by a native `LevinReader`.
+    """
     def __init__(self, buffer: BytesIO = None):
         self.buffer = buffer
         self._written = 0
@@ -21,60 +87,197 @@ class LevinWriter:
         return self.buffer
 
     def put_section(self, section: Section):
+        if _speedups is not None:
+            try:
+                self.write(_speedups.encode_section(section, Section, _TYPES))
+                return
+            except _speedups.Unsupported:
+                # values the C encoder leaves to this one; it raises its own errors for bad input
+                pass
+
+        types = section.types or {}
         self.write_var_in(len(section))
         for k, v in section.entries.items():
             _k = k.encode('ascii')
-            self.write(bytes(c_ubyte(len(_k))))
+            self.write(_UINT8.pack(len(_k)))
             self.write(_k)
-            self.serialized_write(v)
+            self.serialized_write(v, types.get(k))
 
     def write_section(self, section):
         self.write(bytes(SERIALIZE_TYPE_OBJECT))
         self.put_section(section)
 
-    def serialized_write(self, data):
-        _types = {
-            c_uint64: SERIALIZE_TYPE_UINT64,
-            c_int64: SERIALIZE_TYPE_INT64,
-            c_uint32: SERIALIZE_TYPE_UINT32,
-            c_int32: SERIALIZE_TYPE_INT32,
-            c_uint16: SERIALIZE_TYPE_UINT16,
-            c_int16: SERIALIZE_TYPE_INT16,
-            c_string: SERIALIZE_TYPE_STRING,
-            c_ubyte: SERIALIZE_TYPE_UINT8,
-            c_byte: SERIALIZE_TYPE_INT8
-        }
-
-        if type(data) in _types:
-            self.write(bytes(_types[type(data)]))
-
-            if isinstance(data, c_string):
-                self.write_var_in(len(data))
-
-            self.write(bytes(data))
+    def serialized_write(self, data, _type: int = None):
+        """Writes type and value of one entry; `_type` is used for native values"""
+        stype = _TYPES.get(type(data))
+        if stype is not None:
+            if stype == _TYPE_STRING:
+                self.write_string(data.value)
+            elif isinstance(data.value, bytes):
+                # raw value bytes, e.g. c_uint64(b'AAAAAAAA')
+                self.write(_UINT8.pack(stype))
+                self.write(data.to_bytes())
+            else:
+                self.write(_SCALARS[stype].pack(stype, data.value))
         elif isinstance(data, Section):
             self.write_section(data)
+        elif isinstance(data, (bytes, bytearray, memoryview, str)):
+            self.write_string(data)
+        elif isinstance(data, array):
+            self.write_array(data)
+        elif isinstance(data, StringArray):
+            self.write_string_array(data)
+        elif isinstance(data, (list, tuple, Sequence)):
+            self.write_list(data, _type)
+        elif isinstance(data, bool):
+            self.write(_SCALARS[SERIALIZE_TYPE_BOOL.value].pack(SERIALIZE_TYPE_BOOL.value, data))
+        elif isinstance(data, float):
+            self.write(_SCALARS[SERIALIZE_TYPE_DOUBLE.value].pack(SERIALIZE_TYPE_DOUBLE.value, data))
+        elif isinstance(data, int) and _type in _SCALARS:
+            self.write(_SCALARS[_type].pack(_type, data))
         else:
             raise BadArgumentException("Unable to cast input to serialized data")
 
-    def write_var_in(self, i: int):
-        # contrib/epee/include/storages/portable_storage_to_bin.h:pack_varint
-
-        if i <= 63:
-            out = (i << 2) | PORTABLE_RAW_SIZE_MARK_BYTE.value
-            self.write(bytes(c_ubyte(out)))
-        elif i <= 16383:
-            out = (i << 2) | PORTABLE_RAW_SIZE_MARK_WORD.value
-            self.write(bytes(c_uint16(out)))
-        elif i <= 1073741823:
-            out = (i << 2) | PORTABLE_RAW_SIZE_MARK_DWORD.value
-            self.write(bytes(c_uint32(out)))
+    def write_string(self, data):
+        if isinstance(data, str):
+            data = data.encode(c_string.ENCODING)
+        self.write(_UINT8.pack(_TYPE_STRING))
+        self.write_var_in(len(data))
+        self.write(data)
+
+    def write_list(self, data: list, _type: int = None):
+        """
+        Writes a homogeneous list. The element type comes from `_type` (the
+        flagged array type from `Section.types`) or the first element.
+        """
+        if _type is not None:
+            _type &= ~_FLAG_ARRAY
+        elif data:
+            _type = element_type(data[0])
+        else:
+            _type = _TYPE_OBJECT
+
+        self.write(_UINT8.pack(_type | _FLAG_ARRAY))
+        self.write_var_in(len(data))
+
+        fmt = _FORMATS.get(_type)
+        if fmt is not None:
+            # fixed width; pack the whole run at once
+            try:
+                if fmt == 'd':
+                    values = [float(v) for v in data]
+                elif fmt == '?':
+                    values = [bool(v.value if isinstance(v, c_bool) else v) for v in data]
+                else:
+                    values = [int(v) for v in data]
+            except TypeError:
+                # raw value bytes among them, e.g. c_uint64(b'AAAAAAAA')
+                self.write(b''.join(fixed_bytes(v, fmt) for v in data))
+                return
+            try:
+                self.write(struct.pack('<%d%s' % (len(values), fmt), *values))
+            except struct.error:
+                raise BadArgumentException("array values do not fit serialize type %d" % _type)
+        elif _type == _TYPE_STRING:
+            chunk = bytearray()
+            for v in data:
+                if isinstance(v, c_string):
+                    v = v.value
+                if isinstance(v, str):
+                    v = v.encode(c_string.ENCODING)
+                chunk += pack_var_int(len(v))
+                chunk += v
+            self.write(chunk)
+        elif _type == _TYPE_OBJECT:
+            for v in data:
+                self.put_section(v)
+        elif _type == _TYPE_ARRAY:
+            # arrays of arrays; every element carries its own flagged type
+            for v in data:
+                if isinstance(v, array):
+                    self.write_array(v)
+                elif isinstance(v, StringArray):
+                    self.write_string_array(v)
+                elif isinstance(v, (list, tuple, Sequence)) and not isinstance(v, (bytes, bytearray, str)):
+                    self.write_list(v)
+                else:
+                    raise BadArgumentException("Unable to serialize %r as an array" % (v,))
         else:
-            if i > 4611686018427387903:
-                raise BadArgumentException("failed to pack varint - too big amount")
-            out = (i << 2) | PORTABLE_RAW_SIZE_MARK_INT64.value
-            self.write(bytes(c_uint64(out)))
+            raise BadArgumentException("Unable to serialize array of type %d" % _type)
+
+    def write_array(self, data: array):
+        _type = _ARRAY_TYPES.get((data.typecode, data.itemsize))
+        if _type is None:
+            raise BadArgumentException("Unable to serialize array of '%s'" % data.typecode)
+
+        self.write(bytes(c_ubyte(_type.value | SERIALIZE_FLAG_ARRAY.value)))
+        self.write_var_in(len(data))
+        if _BIG_ENDIAN:
+            data = array(data.typecode, data)
+            data.byteswap()
+        self.write(data.tobytes())
+
+    def write_string_array(self, data: StringArray):
+        self.write(bytes(c_ubyte(SERIALIZE_TYPE_STRING.value | SERIALIZE_FLAG_ARRAY.value)))
+        self.write_var_in(len(data))
+        chunk = bytearray()
+        view = memoryview(data.data)
+        for start, end in zip(data.starts, data.ends):
+            chunk += pack_var_int(end - start)
+            chunk += view[start:end]
+        self.write(chunk)
+
+    def write_var_in(self, i: int):
+        self.write(pack_var_int(i))
 
     def write(self, data, tt=None):
         self.buffer.write(data)
         self._written += len(data)
+
+
+def element_type(value) -> int:
+    """serialize type of a list element"""
+    stype = _TYPES.get(type(value))
+    if stype is not None:
+        return stype
+    if isinstance(value, Section):
+        return _TYPE_OBJECT
+    if isinstance(value, (bytes, bytearray, memoryview, str)):
+        return _TYPE_STRING
+    if isinstance(value, (array, StringArray, list, tuple, Sequence)):
+        return _TYPE_ARRAY
+    if isinstance(value, bool):
+        return SERIALIZE_TYPE_BOOL.value
+    if isinstance(value, float):
+        return SERIALIZE_TYPE_DOUBLE.value
+    raise BadArgumentException("Unable to infer serialize type of %r" % (value,))
+
+
+def fixed_bytes(value, fmt: str) -> bytes:
+    """one element of a fixed-width array; ctypes holding raw value bytes are written as they are"""
+    if type(value) in _TYPES:
+        if isinstance(value.value, bytes):
+            raw = value.to_bytes()
+            if len(raw) != struct.calcsize(fmt):
+                raise BadArgumentException("raw value of %d bytes in an array of %d byte values"
+                                           % (len(raw), struct.calcsize(fmt)))
+            return raw
+        value = value.value
+    try:
+        return struct.pack('<' + fmt, value)
+    except struct.error:
+        raise BadArgumentException("array value %r does not fit '%s'" % (value, fmt))
+
+
+def pack_var_int(i: int) -> bytes:
+    # contrib/epee/include/storages/portable_storage_to_bin.h:pack_varint
+    if i <= 63:
+        return _UINT8.pack((i << 2) | PORTABLE_RAW_SIZE_MARK_BYTE.value)
+    elif i <= 16383:
+        return _UINT16.pack((i << 2) | PORTABLE_RAW_SIZE_MARK_WORD.value)
+    elif i <= 1073741823:
+        return _UINT32.pack((i << 2) | PORTABLE_RAW_SIZE_MARK_DWORD.value)
+    else:
+        if i > 4611686018427387903:
+            raise BadArgumentException("failed to pack varint - too big amount")
+        return _UINT64.pack((i << 2) | PORTABLE_RAW_SIZE_MARK_INT64.value)
@@ -2,8 +2,9 @@ import sys
 import socket
 from levin.section import Section
 from levin.bucket import Bucket
+from levin.framing import LevinFrameDecoder
 from levin.ctypes import *
-from levin.constants import P2P_COMMANDS, LEVIN_SIGNATURE
+from levin.constants import P2P_COMMANDS
 
 args = sys.argv
 if len(args) != 3:
@@ -21,34 +22,39 @@ except:
 
 bucket = Bucket.create_handshake_request()
 
-sock.send(bucket.header())
-sock.send(bucket.payload())
+bucket.send(sock)
 
 # print(">> sent packet \'%s\'" % P2P_COMMANDS[bucket.command])
 
 buckets = []
+decoder = LevinFrameDecoder()
+done = False
 
-while 1:
-    buffer = sock.recv(8)
+while not done:
+    buffer = sock.recv(65536)
     if not buffer:
         sys.stderr.write("Invalid response; exiting\n")
         break
 
-    if not buffer.startswith(bytes(LEVIN_SIGNATURE)):
-        sys.stderr.write("Invalid response; exiting\n")
+    try:
+        received = decoder.feed(buffer)
+    except IOError as e:
+        # framing errors and undecodable payloads alike
+        sys.stderr.write("Invalid response (%s); exiting\n" % e)
         break
 
-    bucket = Bucket.from_buffer(signature=buffer, sock=sock)
-    buckets.append(bucket)
+    for bucket in received:
+        buckets.append(bucket)
 
-    if bucket.command == 1001:
-        peers = bucket.get_peers() or []
+        if bucket.command == 1001:
+            peers = bucket.get_peers() or []
 
-        for peer in peers:
-            try:
-                print('%s:%d' % (peer['ip'].ip, peer['port'].value))
-            except:
-                pass
+            for peer in peers:
+                try:
+                    print('%s:%d' % (peer['ip'].ip, peer['port'].value))
+                except:
+                    pass
 
-        sock.close()
-        break
+            sock.close()
+            done = True
+            break
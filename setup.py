@@ -1,5 +1,5 @@
 import os
-from setuptools import setup
+from setuptools import setup, Extension
 
 
 here = os.path.abspath(os.path.dirname(__file__))
@@ -16,5 +16,9 @@ setup(name='py-levin',
       author='xmrdsc',
       url='https://github.com/xmrdsc/py-levin',
       packages=['levin'],
+      # dataclass(slots=True) in levin.schema
+      python_requires='>=3.10',
+      # optional C codec; without a compiler the pure Python one is used
+      ext_modules=[Extension('levin._speedups', ['levin/_speedups.c'], optional=True)],
       license='2018 WTFPL – Do What the Fuck You Want to Public License'
      )
\ No newline at end of file